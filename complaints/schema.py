@@ -18,6 +18,10 @@ from graphql_jwt.decorators import login_required
 from gasoline.schema import StationType, PriceType
 from users.schema import UserType
 
+# Loaders
+from oilApp.loaders import load_related
+from oilApp.optimizer import optimize
+
 #------------------QUERIES---------------
 class ComplaintType(DjangoObjectType):
     """ Type for Complaint Model"""
@@ -34,6 +38,18 @@ class ComplaintType(DjangoObjectType):
             'offered_price'
         )
 
+    def resolve_user(root, info):
+        """ Return the author of the complaint, joined or batched by the request loader"""
+        return load_related(info, root, 'user')
+
+    def resolve_station(root, info):
+        """ Return the station of the complaint, joined or batched by the request loader"""
+        return load_related(info, root, 'station')
+
+    def resolve_actual_price(root, info):
+        """ Return the price of the complaint, joined or batched by the request loader"""
+        return load_related(info, root, 'actual_price')
+
 
 #-----------NODE-QUERIES----------
 class ComplaintNode(DjangoObjectType):
@@ -50,6 +66,23 @@ class ComplaintNode(DjangoObjectType):
         }
         interfaces = (relay.Node,)
 
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        """ Fetch only what the selection set asks for"""
+        return optimize(queryset, info)
+
+    def resolve_user(root, info):
+        """ Return the author of the complaint, joined or batched by the request loader"""
+        return load_related(info, root, 'user')
+
+    def resolve_station(root, info):
+        """ Return the station of the complaint, joined or batched by the request loader"""
+        return load_related(info, root, 'station')
+
+    def resolve_actual_price(root, info):
+        """ Return the price of the complaint, joined or batched by the request loader"""
+        return load_related(info, root, 'actual_price')
+
 #---------------MUTATION--------------
 class CreateComplaint(graphene.Mutation):
     """Create a new complaint
@@ -91,7 +124,7 @@ class Query(graphene.ObjectType):
     @login_required
     def resolve_my_complaints(root, info):
         """ Return complaints created by the logged user"""
-        return Complaint.objects.filter(user=info.context.user)
+        return optimize(Complaint.objects.filter(user=info.context.user), info)
 
     # Node Query Class
     complaint = relay.Node.Field(ComplaintNode)
@@ -1,3 +1,66 @@
-from django.test import TestCase
+""" Complaints tests """
 
-# Create your tests here.
+# Django
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+# Models
+from complaints.models import Complaint
+from gasoline.models import Station, Price
+
+# Schema
+from oilApp.schema import schema
+
+
+COMPLAINTS_QUERY = '''
+query ($first: Int) {
+    nodeComplaint(first: $first) {
+        edges {
+            node {
+                user { username }
+                station { name }
+                actualPrice { price station { name } }
+            }
+        }
+    }
+}
+'''
+
+
+class ComplaintLoadersTestCase(TestCase):
+    """ Complaint relations are resolved with batching loaders"""
+
+    def setUp(self):
+        for i in range(30):
+            user = User.objects.create(username=f'user{i}')
+            station = Station.objects.create(name=f'Station {i}', register=f'PL/{i}',
+                                             latitude=19.4, longitude=-99.1)
+            price = Price.objects.create(station=station, gas_type='regular', price=20.5)
+            Complaint.objects.create(user=user, station=station, actual_price=price,
+                                     description='Price too high', link_evidence='',
+                                     type_complaint='price', offered_price=22.0)
+
+    def count_queries(self, first):
+        """ Return the number of queries of a page of first complaints"""
+        request = RequestFactory().post('/graphql')
+        with CaptureQueriesContext(connection) as queries:
+            result = schema.execute(COMPLAINTS_QUERY, variables={'first': first},
+                                    context_value=request)
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(result.data['nodeComplaint']['edges']), first)
+        return len(queries)
+
+    def test_constant_queries(self):
+        """ The number of queries does not grow with the page size"""
+        self.assertEqual(self.count_queries(3), self.count_queries(30))
+
+    def test_relations(self):
+        """ Every complaint gets its own user, station and price"""
+        request = RequestFactory().post('/graphql')
+        result = schema.execute(COMPLAINTS_QUERY, variables={'first': 2}, context_value=request)
+        node = result.data['nodeComplaint']['edges'][1]['node']
+        self.assertEqual(node['user']['username'], 'user1')
+        self.assertEqual(node['station']['name'], 'Station 1')
+        self.assertEqual(node['actualPrice']['station']['name'], 'Station 1')
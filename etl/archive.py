@@ -0,0 +1,86 @@
+"""
+This module comprises the columnar archive of the ETL system. The cleaned
+stations and prices of every run are written as compressed Parquet files in
+one folder per day, so any date range can be loaded again without the network
+"""
+
+import os
+import re
+import pandas as pd
+from datetime import datetime, timedelta
+
+
+COMPRESSION = 'zstd'
+SNAPSHOT_FILE = re.compile(r'^(stations|prices)_(\d{8}_\d{6}_\d{6})\.parquet$')
+SNAPSHOT_DATE_FORMAT = '%Y%m%d_%H%M%S_%f'
+
+
+def partition_folder(folder, day):
+    """
+    Returns the folder of the archive partition holding the snapshots of day
+    """
+    return os.path.join(folder, f'date={day:%Y-%m-%d}')
+
+
+def snapshot_stamp(run_date):
+    """
+    Returns the stamp that names the snapshot of the run started at run_date
+    """
+    return f'{run_date:{SNAPSHOT_DATE_FORMAT}}'
+
+
+def write_snapshot(folder, stations_df, prices_df, run_date):
+    """
+    Archives the cleaned stations and prices DataFrames of the run started at
+    run_date into the partition of its day
+
+    Returns the paths of the stations and prices files written
+    """
+    partition = partition_folder(folder, run_date)
+    os.makedirs(partition, exist_ok=True)
+
+    paths = []
+    for name, df in (('stations', stations_df), ('prices', prices_df)):
+        path = os.path.join(partition, f'{name}_{snapshot_stamp(run_date)}.parquet')
+        df.reset_index(drop=True).to_parquet(path, compression=COMPRESSION, index=False)
+        paths.append(path)
+
+    return tuple(paths)
+
+
+def list_snapshots(folder, start, end):
+    """
+    Finds the snapshots archived from the day start to the day end, both
+    included, that have both their stations and prices files
+
+    Returns a list of (run_date, stations_path, prices_path) in run order
+    """
+    snapshots = []
+    day = start
+
+    while day <= end:
+        partition = partition_folder(folder, day)
+        files = {}
+
+        if os.path.isdir(partition):
+            for file_name in os.listdir(partition):
+                match = SNAPSHOT_FILE.match(file_name)
+                if match:
+                    files[(match.group(2), match.group(1))] = os.path.join(partition, file_name)
+
+        for stamp in sorted({stamp for stamp, _ in files}):
+            if (stamp, 'stations') in files and (stamp, 'prices') in files:
+                snapshots.append((datetime.strptime(stamp, SNAPSHOT_DATE_FORMAT),
+                                  files[(stamp, 'stations')], files[(stamp, 'prices')]))
+
+        day += timedelta(days=1)
+
+    return snapshots
+
+
+def read_snapshot(stations_path, prices_path):
+    """
+    Reads an archived snapshot back as the stations and prices DataFrames
+    produced by transform()
+    """
+    return pd.read_parquet(stations_path), pd.read_parquet(prices_path)
@@ -0,0 +1,213 @@
+"""
+This module benchmarks stages of the ETL system against synthetic datasets
+
+Usage:
+    python benchmark.py extract [n_places]
+    python benchmark.py join SHAPEFILE [n_points]
+    python benchmark.py e2e SHAPEFILE [--places N] [--db URL] [--workers N] [--delta]
+"""
+
+import os
+import json
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import tracemalloc
+import sqlalchemy as db
+from pathlib import Path
+from datetime import datetime, timedelta
+from timeit import default_timer as timer
+
+import instrumentation
+from parsers import PARSERS
+from boundaries import BoundaryStore
+from loaders import metadata
+from synthetic import write_datasets
+
+
+RESULTS_FILE = f'{Path(__file__).resolve().parent}/data/benchmarks/results.jsonl'
+
+
+def measure(function, *args):
+    """
+    Runs function with args, returning a tuple with its result, the elapsed
+    time in seconds and the peak of traced memory in bytes
+    """
+    tracemalloc.start()
+    start = timer()
+    result = function(*args)
+    end = timer()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, end - start, peak
+
+
+def bench_extract(n_places):
+    """
+    Compares every parser in PARSERS on synthetic datasets of n_places places
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        places_path = os.path.join(folder, 'places.xml')
+        prices_path = os.path.join(folder, 'prices.xml')
+        write_datasets(places_path, prices_path, n_places)
+
+        size = os.path.getsize(places_path) + os.path.getsize(prices_path)
+        print(f'{n_places} places, {size / 2**20:.1f} MiB of XML')
+
+        for name, parser in PARSERS.items():
+            stations_df, elapsed, peak = measure(parser, places_path, prices_path)
+            print(f'  {name:<10} {timedelta(seconds=elapsed)}  '
+                  f'peak {peak / 2**20:8.1f} MiB  {len(stations_df)} rows')
+
+
+def bench_join(shapefile, n_points, workers_list=(1, 2, 4, 8)):
+    """
+    Times the spatial join of n_points random points inside the bounding box
+    of shapefile with each number of worker processes in workers_list
+    """
+    source_files = [shapefile, f'{os.path.splitext(shapefile)[0]}.dbf']
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = BoundaryStore.load(source_files, os.path.join(folder, 'boundaries.pickle'))
+
+        bounds = np.array([geometry.bounds for geometry in store.geometries])
+        rng = np.random.default_rng(0)
+        longitudes = rng.uniform(bounds[:, 0].min(), bounds[:, 2].max(), n_points)
+        latitudes = rng.uniform(bounds[:, 1].min(), bounds[:, 3].max(), n_points)
+        print(f'{n_points} points, {len(store.geometries)} boundaries, {os.cpu_count()} CPUs')
+
+        expected = None
+        for workers in workers_list:
+            start = timer()
+            if workers > 1:
+                result = store.locate_parallel(longitudes, latitudes, workers)
+            else:
+                result = store.locate(longitudes, latitudes)
+            elapsed = timer() - start
+
+            expected = expected or result
+            print(f'  {workers} workers  {timedelta(seconds=elapsed)}  '
+                  f'{"same" if result == expected else "DIFFERENT"} output')
+
+
+def git_revision():
+    """
+    Returns the short hash of the checked out commit, or None outside a repository
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def record_result(params, run_report, results_file=RESULTS_FILE):
+    """
+    Appends the report of a benchmark run to results_file and prints how the
+    wall time of each stage moved since the last run with the same params
+    """
+    previous = None
+    if os.path.exists(results_file):
+        with open(results_file, encoding='utf8') as results:
+            for line in results:
+                result = json.loads(line)
+                if result['params'] == params:
+                    previous = result
+
+    result = {
+        'recorded_at': datetime.now().isoformat(),
+        'revision': git_revision(),
+        'params': params,
+        'report': run_report.to_dict(),
+    }
+
+    os.makedirs(os.path.dirname(results_file), exist_ok=True)
+    with open(results_file, mode='a', encoding='utf8') as results:
+        results.write(json.dumps(result) + '\n')
+
+    if previous:
+        before = {stage['name']: stage['wall_seconds'] for stage in previous['report']['stages']}
+        print(f'Compared with {previous["revision"]} ({previous["recorded_at"]}):')
+        for stage in result['report']['stages']:
+            if stage['name'] in before:
+                print(f'  {stage["name"]:<28}{before[stage["name"]]:>9.2f} -> '
+                      f'{stage["wall_seconds"]:>9.2f} s')
+
+
+def bench_e2e(shapefile, n_places, db_string=None, workers=1, delta=False,
+              missing_prices=0.1, bad_values=0.01):
+    """
+    Runs extract, transform and load of main.py end to end on synthetic datasets
+    of n_places places located inside the boundaries of shapefile, against the
+    database at db_string (a fresh SQLite file by default), and records the
+    run report
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        db_string = db_string or f'sqlite:///{folder}/benchmark.sqlite3'
+        os.environ.setdefault('DATABASE_URL', db_string)
+        import main
+
+        main.DB_STRING = db_string
+        main.DATASET_FILES = [f'{folder}/places.xml', f'{folder}/prices.xml']
+        main.GEO_SOURCE_FILES = [shapefile, f'{os.path.splitext(shapefile)[0]}.dbf']
+        main.BOUNDARY_STORE_FILE = f'{folder}/boundaries.pickle'
+        main.GEOCACHE_FILE = f'{folder}/geocache.csv'
+        main.QUARANTINE_FOLDER = f'{folder}/quarantine'
+
+        engine = db.create_engine(db_string)
+        if engine.dialect.name == 'sqlite':
+            metadata.create_all(engine)
+
+        store = BoundaryStore.load(main.GEO_SOURCE_FILES, main.BOUNDARY_STORE_FILE)
+        write_datasets(*main.DATASET_FILES, n_places, store=store,
+                       missing_prices=missing_prices, bad_values=bad_values)
+
+        instrumentation.report = instrumentation.RunReport()
+        raw_stations_df, boundaries = main.extract()
+
+        with instrumentation.stage('transform', rows_in=len(raw_stations_df)) as transform_stage:
+            stations_df, prices_df = main.transform(raw_stations_df, boundaries, national=True,
+                                                    workers=workers)
+            transform_stage.rows_out = len(stations_df)
+
+        main.load(stations_df, prices_df, delta=delta, national=True)
+
+        instrumentation.report.print_summary()
+        record_result({
+            'places': n_places,
+            'dialect': engine.dialect.name,
+            'workers': workers,
+            'delta': delta,
+            'missing_prices': missing_prices,
+            'bad_values': bad_values,
+        }, instrumentation.report)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ETL benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    extract_parser = subparsers.add_parser('extract', help='compare the XML parsers')
+    extract_parser.add_argument('n_places', type=int, nargs='?', default=200000)
+
+    join_parser = subparsers.add_parser('join', help='scale the spatial join')
+    join_parser.add_argument('shapefile')
+    join_parser.add_argument('n_points', type=int, nargs='?', default=12000)
+
+    e2e_parser = subparsers.add_parser('e2e', help='run the whole ETL on synthetic data')
+    e2e_parser.add_argument('shapefile')
+    e2e_parser.add_argument('--places', type=int, default=12000)
+    e2e_parser.add_argument('--db', help='database URL (a temporary SQLite file by default)')
+    e2e_parser.add_argument('--workers', type=int, default=1)
+    e2e_parser.add_argument('--delta', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'extract':
+        bench_extract(args.n_places)
+    elif args.benchmark == 'join':
+        bench_join(args.shapefile, args.n_points)
+    else:
+        bench_e2e(args.shapefile, args.places, args.db, args.workers, args.delta)
@@ -0,0 +1,197 @@
+"""
+This module comprises a preprocessed store of the DIVA-GIS boundaries. The
+shapefile is converted once into a compact pickle with only the state and city
+names plus simplified geometries, next to an on-disk R-tree index, so each ETL
+run loads it in a fraction of the time of reading the shapefile and indexing it
+"""
+
+import os
+import pickle
+import numpy as np
+import geopandas as gpd
+from rtree import index
+from shapely import wkb
+from shapely.geometry import Point
+from shapely.prepared import prep
+from concurrent.futures import ProcessPoolExecutor
+
+from geocache import file_checksum
+
+
+SIMPLIFY_TOLERANCE = 0.0001
+STORE_VERSION = 1
+TILE_DEGREES = 1.0
+CHUNK_SIZE = 1000
+
+# Store opened by each worker process of locate_parallel()
+_worker_store = None
+
+
+class BoundaryStore:
+    """
+    State and city boundaries with a spatial index, able to answer which
+    boundary contains each point
+    """
+
+    def __init__(self, path, checksum, states, cities, geometries, tree):
+        self.path = path
+        self.checksum = checksum
+        self.states = states
+        self.cities = cities
+        self.geometries = geometries
+        self.tree = tree
+        self._prepared = {}
+
+    @classmethod
+    def build(cls, source_files, store_path):
+        """
+        Reads the shapefile (first of source_files), keeps NAME_1, NAME_2 and the
+        simplified geometries and writes them with an R-tree index to store_path
+        """
+        print('Building the boundary store...')
+        checksum = file_checksum(source_files)
+        geo_gdf = gpd.read_file(source_files[0])[['NAME_1', 'NAME_2', 'geometry']]
+        geometries = list(geo_gdf.geometry.simplify(SIMPLIFY_TOLERANCE, preserve_topology=True))
+
+        for suffix in ('.dat', '.idx'):
+            if os.path.exists(f'{store_path}{suffix}'):
+                os.remove(f'{store_path}{suffix}')
+
+        tree = index.Index(store_path, ((i, geometry.bounds, None)
+                                        for i, geometry in enumerate(geometries)))
+        tree.close()
+
+        with open(store_path, mode='wb') as store_file:
+            pickle.dump({
+                'version': STORE_VERSION,
+                'checksum': checksum,
+                'states': list(geo_gdf['NAME_1']),
+                'cities': list(geo_gdf['NAME_2']),
+                'geometries': [wkb.dumps(geometry) for geometry in geometries],
+            }, store_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        return cls.open(store_path)
+
+    @classmethod
+    def open(cls, store_path):
+        """
+        Opens the store written by build() at store_path
+
+        Raises FileNotFoundError when the pickle or either file of the R-tree
+        index is missing, since opening a missing index creates an empty one
+        """
+        for path in (f'{store_path}.dat', f'{store_path}.idx'):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f'Boundary store index {path} not found')
+
+        with open(store_path, mode='rb') as store_file:
+            data = pickle.load(store_file)
+
+        if data.get('version') != STORE_VERSION:
+            raise ValueError(f'Unsupported boundary store version in {store_path}')
+
+        geometries = [wkb.loads(geometry) for geometry in data['geometries']]
+        return cls(store_path, data['checksum'], data['states'], data['cities'], geometries,
+                   index.Index(store_path))
+
+    @classmethod
+    def load(cls, source_files, store_path):
+        """
+        Opens the store at store_path, rebuilding it first when it is missing,
+        unreadable or was built from source files with a different checksum
+        """
+        checksum = file_checksum(source_files)
+
+        try:
+            store = cls.open(store_path)
+            if store.checksum == checksum:
+                return store
+            store.tree.close()
+        except (FileNotFoundError, ValueError, pickle.UnpicklingError, KeyError):
+            pass
+
+        return cls.build(source_files, store_path)
+
+    def contains(self, i, point):
+        """
+        Tests whether the boundary i contains point, preparing its geometry the
+        first time it is needed
+        """
+        if i not in self._prepared:
+            self._prepared[i] = prep(self.geometries[i])
+        return self._prepared[i].intersects(point)
+
+    def locate(self, longitudes, latitudes):
+        """
+        Finds the boundary of each point given by longitudes and latitudes
+
+        Returns a tuple with the lists of states and cities, with None for the
+        points outside every boundary
+        """
+        states, cities = [], []
+
+        for longitude, latitude in zip(longitudes, latitudes):
+            point = Point(longitude, latitude)
+            match = next((i for i in sorted(self.tree.intersection((longitude, latitude,
+                                                                    longitude, latitude)))
+                          if self.contains(i, point)), None)
+
+            states.append(None if match is None else self.states[match])
+            cities.append(None if match is None else self.cities[match])
+
+        return states, cities
+
+    def locate_parallel(self, longitudes, latitudes, workers, tile_degrees=TILE_DEGREES,
+                        chunk_size=CHUNK_SIZE):
+        """
+        Same as locate(), spreading the points over a pool of worker processes
+
+        Points are partitioned into square tiles of tile_degrees and whole tiles
+        are packed, in tile order, into chunks of about chunk_size points, so
+        each worker keeps touching the same few boundaries. Every worker opens
+        the store from disk once and the results are put back in input order
+        """
+        longitudes = np.asarray(longitudes, dtype='float64')
+        latitudes = np.asarray(latitudes, dtype='float64')
+
+        tiles = np.floor(longitudes / tile_degrees) * 1000 + np.floor(latitudes / tile_degrees)
+        order = np.argsort(tiles, kind='stable')
+        tile_starts = np.flatnonzero(np.diff(tiles[order])) + 1
+
+        chunks, current = [], []
+        for tile in np.split(order, tile_starts):
+            current.extend(tile)
+            if len(current) >= chunk_size:
+                chunks.append(current)
+                current = []
+        if current:
+            chunks.append(current)
+
+        states, cities = [None] * len(longitudes), [None] * len(longitudes)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_open_worker_store,
+                                 initargs=(self.path,)) as pool:
+            results = pool.map(_locate_chunk, ([(longitudes[chunk], latitudes[chunk])
+                                                for chunk in chunks]))
+
+            for chunk, (chunk_states, chunk_cities) in zip(chunks, results):
+                for position, state, city in zip(chunk, chunk_states, chunk_cities):
+                    states[position] = state
+                    cities[position] = city
+
+        return states, cities
+
+
+def _open_worker_store(store_path):
+    """
+    Initializer of the worker processes: opens the store once per process
+    """
+    global _worker_store
+    _worker_store = BoundaryStore.open(store_path)
+
+
+def _locate_chunk(coordinates):
+    """
+    Locates a chunk of (longitudes, latitudes) in the store of the worker
+    """
+    return _worker_store.locate(*coordinates)
@@ -0,0 +1,149 @@
+"""
+This module comprises the delta load of the ETL system. Instead of inserting
+every price of the snapshot, it compares the snapshot with the latest known
+price of each (station, gas_type) and only writes what changed
+"""
+
+import pandas as pd
+import sqlalchemy as db
+from timeit import default_timer as timer
+
+from loaders import (BATCH_SIZE, PRICE_COLS, batches, bump_data_version, current_prices_table,
+                     insert_prices, price_frame, refresh_area_stats, report_throughput,
+                     station_frame, stations_table, upsert_stations)
+
+
+# Columns compared to decide whether a known station must be upserted again
+STATION_KEY_COLS = ['name', 'longitude', 'latitude', 'town', 'state']
+PRICE_DECIMALS = 2
+
+
+def read_stations_index(connection):
+    """
+    Reads every station once, returning a DataFrame indexed by register
+    """
+    query = db.select([stations_table.c.register, stations_table.c.id,
+                       stations_table.c.is_active] +
+                      [stations_table.c[col] for col in STATION_KEY_COLS])
+    rows = connection.execute(query).fetchall()
+    columns = ['register', 'id', 'is_active'] + STATION_KEY_COLS
+
+    return pd.DataFrame(rows, columns=columns).set_index('register')
+
+
+def read_latest_prices(connection):
+    """
+    Reads the current price of every (station_id, gas_type) from the current
+    prices table, whose size does not grow with the price history
+    """
+    rows = connection.execute(db.select([current_prices_table.c.station_id,
+                                         current_prices_table.c.gas_type,
+                                         current_prices_table.c.price])).fetchall()
+
+    return pd.DataFrame(rows, columns=['station_id', 'gas_type', 'known_price']) \
+        .astype({'station_id': 'int64', 'known_price': 'float64'})
+
+
+def changed_stations(stations_df, known_df):
+    """
+    Returns the rows of stations_df, in the columns of the stations table, that
+    are new, inactive or whose attributes differ from the known ones
+    """
+    joined_df = stations_df.join(known_df, on='register', rsuffix='_known')
+    changed = joined_df['id_known'].isna() | \
+        ~joined_df['is_active_known'].fillna(False).astype(bool)
+
+    for col in STATION_KEY_COLS:
+        both_missing = joined_df[col].isna() & joined_df[f'{col}_known'].isna()
+        changed |= (joined_df[col] != joined_df[f'{col}_known']) & ~both_missing
+
+    return stations_df[changed]
+
+
+def deactivate_stations(connection, station_ids, batch_size=BATCH_SIZE):
+    """
+    Marks the stations with the given ids as inactive
+    """
+    for batch in batches(station_ids, batch_size):
+        connection.execute(stations_table.update()
+                           .where(stations_table.c.id.in_(batch))
+                           .values(is_active=False))
+
+
+def changed_states(known_df, upserted_df, station_ids):
+    """
+    Returns the states whose price statistics the delta changes: the states
+    of the upserted stations, before and after the load, and those of the
+    known stations with station_ids, deactivated or with new prices
+    """
+    known_states = known_df.loc[known_df.index.isin(upserted_df['register']) |
+                                known_df['id'].isin(station_ids), 'state']
+
+    return set(pd.concat([known_states, upserted_df['state']]).dropna()) - {''}
+
+
+def delta_load(connection, stations_df, prices_df, batch_size=BATCH_SIZE, complete=True):
+    """
+    Loads only the differences between the stations and long prices DataFrames
+    produced by transform() and the database: new or modified stations are
+    upserted, stations missing from the snapshot are deactivated and only
+    prices that are new or moved for a (station, gas_type) are inserted. Only
+    the price statistics of the states with changes are refreshed
+
+    A snapshot that is not complete, capped to some states or rows, says
+    nothing about the stations it lacks, so none is deactivated
+
+    Returns a dictionary with the counts of unchanged, changed, new and removed
+    rows, plus the number of rows written
+    """
+    start = timer()
+
+    known_df = read_stations_index(connection)
+    latest_df = read_latest_prices(connection)
+
+    stations = station_frame(stations_df)
+    is_new_station = ~stations['register'].isin(known_df.index)
+
+    upserted_df = changed_stations(stations, known_df)
+    station_ids = known_df['id'].to_dict()
+    station_ids.update(upsert_stations(connection, upserted_df, batch_size))
+
+    removed_ids = []
+    if complete:
+        active_df = known_df[known_df['is_active'].astype(bool)]
+        removed_ids = [int(pk) for pk in
+                       active_df.loc[~active_df.index.isin(stations['register']), 'id']]
+        deactivate_stations(connection, removed_ids, batch_size)
+    else:
+        print('Snapshot capped to the busiest states, no station is deactivated')
+
+    snapshot_df = price_frame(prices_df, station_ids) \
+        .merge(latest_df, on=['station_id', 'gas_type'], how='left')
+
+    is_new = snapshot_df['known_price'].isna()
+    is_unchanged = ~is_new & (snapshot_df['price'].round(PRICE_DECIMALS) ==
+                              snapshot_df['known_price'].round(PRICE_DECIMALS))
+    is_changed = ~is_new & ~is_unchanged
+
+    to_insert_df = snapshot_df.loc[is_new | is_changed, PRICE_COLS]
+    insert_prices(connection, to_insert_df, batch_size)
+    refresh_area_stats(connection, changed_states(
+        known_df, upserted_df, set(removed_ids) | set(to_insert_df['station_id'])), batch_size)
+
+    # Runs that change nothing keep the responses cached by the API
+    if len(upserted_df) or removed_ids or len(to_insert_df):
+        bump_data_version(connection)
+
+    n_rows = report_throughput(start, len(upserted_df), len(to_insert_df))
+
+    counts = {
+        'unchanged': int(is_unchanged.sum()),
+        'changed': int(is_changed.sum()),
+        'new': int(is_new.sum()),
+        'new_stations': int(is_new_station.sum()),
+        'removed': len(removed_ids),
+    }
+    print('Delta: ' + ', '.join(f'{count} {name}' for name, count in counts.items()))
+
+    counts['rows_written'] = n_rows
+    return counts
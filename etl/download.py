@@ -0,0 +1,155 @@
+"""
+This module comprises the download layer of the ETL system. Dataset files are
+fetched concurrently and streamed to disk in chunks, with conditional requests
+so an unchanged feed costs a single 304 response, and with resumable retries of
+transient failures
+"""
+
+import os
+import json
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+
+CHUNK_SIZE = 1 << 16
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 1.0
+TIMEOUT_SECONDS = 60
+
+
+class DownloadError(Exception):
+    """Raised when a dataset could not be retrieved after every retry"""
+
+
+class ServerError(DownloadError):
+    """Raised when the server answers with a 5xx status, which is retried"""
+
+
+# Failures worth another attempt: 5xx answers, timeouts, refused or dropped
+# connections and transfers interrupted mid-body. Any other status is final
+TRANSIENT_ERRORS = (ServerError, requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError)
+
+
+def read_validators(path):
+    """
+    Returns the ETag and Last-Modified validators stored for the file at path
+    """
+    try:
+        with open(f'{path}.meta.json', encoding='utf8') as meta_file:
+            return json.load(meta_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def write_validators(path, response):
+    """
+    Stores the ETag and Last-Modified validators of response for the file at
+    path as pending, until commit_validators() is called once the file is
+    loaded
+    """
+    validators = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+
+    with open(f'{path}.pending.json', mode='w', encoding='utf8') as meta_file:
+        json.dump(validators, meta_file)
+
+
+def commit_validators(paths):
+    """
+    Makes the pending validators of the files at paths the ones sent with the
+    next requests. Until then the previous validators are sent, so a file whose
+    load failed is downloaded and processed again by the next run
+    """
+    for path in paths:
+        if os.path.exists(f'{path}.pending.json'):
+            os.replace(f'{path}.pending.json', f'{path}.meta.json')
+
+
+def request_headers(path, validators):
+    """
+    Builds the conditional and range headers for a request of the file at path
+    """
+    headers = {}
+
+    if os.path.exists(path):
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    partial_size = os.path.getsize(f'{path}.part') if os.path.exists(f'{path}.part') else 0
+    if partial_size and validators.get('partial_etag'):
+        headers['Range'] = f'bytes={partial_size}-'
+        headers['If-Range'] = validators['partial_etag']
+
+    return headers
+
+
+def fetch(url, path, session=None):
+    """
+    Downloads url into path unless the copy on disk is still current
+
+    The body is streamed into a .part file that is renamed once complete. A
+    transient failure is retried with exponential backoff, resuming from the
+    bytes already on disk when the server supports ranges; any other error
+    status raises DownloadError right away
+
+    Returns True when a new file was written and False when the server answered
+    304 Not Modified
+    """
+    session = session or requests.Session()
+
+    for attempt in range(MAX_RETRIES + 1):
+        validators = read_validators(path)
+        headers = request_headers(path, validators)
+
+        try:
+            with session.get(url, headers=headers, stream=True, allow_redirects=True,
+                             timeout=TIMEOUT_SECONDS) as response:
+                if response.status_code == 304:
+                    return False
+
+                if response.status_code >= 500:
+                    raise ServerError(
+                        f'Could not retrieve anything from {url} ({response.status_code})')
+                if response.status_code not in (200, 206):
+                    raise DownloadError(
+                        f'Could not retrieve anything from {url} ({response.status_code})')
+
+                # Remember the validator of the partial body so a retry can resume it
+                validators['partial_etag'] = response.headers.get('ETag')
+                with open(f'{path}.meta.json', mode='w', encoding='utf8') as meta_file:
+                    json.dump(validators, meta_file)
+
+                mode = 'ab' if response.status_code == 206 else 'wb'
+                with open(f'{path}.part', mode=mode) as part_file:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        part_file.write(chunk)
+
+                os.replace(f'{path}.part', path)
+                write_validators(path, response)
+                return True
+        except TRANSIENT_ERRORS as e:
+            if attempt == MAX_RETRIES:
+                raise DownloadError(f'Could not retrieve {url}: {e}') from e
+
+            delay = BACKOFF_SECONDS * 2 ** attempt
+            print(f'{e}. Retrying in {delay:.0f}s...')
+            time.sleep(delay)
+        except requests.RequestException as e:
+            raise DownloadError(f'Could not retrieve {url}: {e}') from e
+
+
+def fetch_all(urls, paths):
+    """
+    Downloads every url into its path concurrently
+
+    Returns a list with, for each url, whether a new file was written
+    """
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        futures = [pool.submit(fetch, url, path, session) for url, path in zip(urls, paths)]
+        return [future.result() for future in futures]
@@ -0,0 +1,115 @@
+"""
+This module comprises a persistent cache for the reverse geocoding of stations.
+Entries are keyed by place_id plus rounded coordinates, so only new or moved
+stations need to go through the spatial join
+"""
+
+import os
+import json
+import hashlib
+import pandas as pd
+
+
+COORD_DECIMALS = 5
+CACHE_COLS = ['longitude', 'latitude', 'city', 'state']
+
+
+def file_checksum(paths):
+    """
+    Returns a SHA-256 digest of the contents of every file in paths that exists
+    """
+    digest = hashlib.sha256()
+
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+
+        with open(path, mode='rb') as source:
+            for block in iter(lambda: source.read(1 << 20), b''):
+                digest.update(block)
+
+    return digest.hexdigest()
+
+
+class GeocodeCache:
+    """
+    Maps place_id and rounded coordinates to the city and state found by the
+    spatial join, tracking hit and miss statistics
+
+    Stations that fell outside every boundary are cached too, with empty city
+    and state, so they are not joined again on every run
+    """
+
+    def __init__(self, path, checksum, entries=None):
+        self.path = path
+        self.checksum = checksum
+        self.entries = entries if entries is not None else \
+            pd.DataFrame(columns=CACHE_COLS, index=pd.Index([], name='place_id'))
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path, checksum):
+        """
+        Loads the cache stored at path. The entries are discarded when they were
+        computed against boundaries with a different checksum
+        """
+        try:
+            with open(f'{path}.meta.json', encoding='utf8') as meta_file:
+                meta = json.load(meta_file)
+            if meta.get('checksum') != checksum:
+                print('Boundary file changed, discarding the geocode cache')
+                return cls(path, checksum)
+
+            entries = pd.read_csv(path, index_col='place_id', keep_default_na=False,
+                                  na_values=[''], float_precision='round_trip')
+            return cls(path, checksum, entries)
+        except (FileNotFoundError, ValueError):
+            return cls(path, checksum)
+
+    def save(self):
+        """
+        Writes the entries and the boundary checksum to disk
+        """
+        self.entries.to_csv(self.path, index_label='place_id')
+
+        with open(f'{self.path}.meta.json', mode='w', encoding='utf8') as meta_file:
+            json.dump({'checksum': self.checksum}, meta_file)
+
+    def lookup(self, stations_df):
+        """
+        Looks up the stations of stations_df, indexed by place_id
+
+        Returns a tuple with a DataFrame of the city and state of the cached
+        stations and a boolean Series marking the stations that missed
+        """
+        joined_df = stations_df[['longitude', 'latitude']].join(self.entries, rsuffix='_cached')
+
+        missed = (joined_df['longitude'].round(COORD_DECIMALS) !=
+                  joined_df['longitude_cached']) | \
+                 (joined_df['latitude'].round(COORD_DECIMALS) !=
+                  joined_df['latitude_cached'])
+
+        self.misses += int(missed.sum())
+        self.hits += int((~missed).sum())
+
+        return joined_df.loc[~missed, ['city', 'state']], missed
+
+    def add(self, stations_df, geo_df):
+        """
+        Stores the city and state found in geo_df for the stations of stations_df
+        """
+        entries_df = stations_df[['longitude', 'latitude']].round(COORD_DECIMALS) \
+            .join(geo_df[['city', 'state']])
+        entries_df.index.name = 'place_id'
+
+        self.entries = pd.concat([self.entries.drop(entries_df.index, errors='ignore'),
+                                  entries_df])
+
+    def stats(self):
+        """
+        Returns a summary of the lookups made against the cache
+        """
+        total = self.hits + self.misses
+        ratio = self.hits / total if total else 0
+        return f'Geocode cache: {self.hits} hits, {self.misses} misses ({ratio:.1%} hit ratio)'
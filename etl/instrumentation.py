@@ -0,0 +1,176 @@
+"""
+This module comprises the instrumentation of the ETL system. Each stage of a
+run records its wall time, CPU time, memory, row counts and database round
+trips, and the whole run is written as a JSON report
+"""
+
+import os
+import json
+import time
+import resource
+from contextlib import contextmanager
+from datetime import datetime
+from timeit import default_timer as timer
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class Stage:
+    """
+    Measurements of one stage of a run
+    """
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        # Change of the resident set size from the start to the end of the
+        # stage, and peak of the whole process so far, not of the stage
+        self.rss_delta_mb = None
+        self.process_peak_rss_mb = None
+        self.round_trips = None
+
+    def to_dict(self):
+        """
+        Returns the measurements as a dictionary
+        """
+        return dict(vars(self))
+
+
+class RunReport:
+    """
+    Collects the stages of a run. Stages can be nested, in which case their
+    names are joined with '/'
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.stages = []
+        self.round_trips = 0
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """
+        Measures the block it wraps as a stage. The yielded Stage can be given
+        its rows_out before the block ends
+        """
+        current = Stage('/'.join(self._stack + [name]), rows_in)
+        self._stack.append(name)
+        self.stages.append(current)
+
+        start_wall, start_cpu, start_trips = timer(), time.process_time(), self.round_trips
+        start_rss = rss_mb()
+        try:
+            yield current
+        finally:
+            current.wall_seconds = round(timer() - start_wall, 4)
+            current.cpu_seconds = round(time.process_time() - start_cpu, 4)
+            end_rss = rss_mb()
+            if start_rss is not None and end_rss is not None:
+                current.rss_delta_mb = round(end_rss - start_rss, 1)
+            current.process_peak_rss_mb = round(process_peak_rss_mb(), 1)
+            current.round_trips = self.round_trips - start_trips
+            self._stack.pop()
+
+    def to_dict(self):
+        """
+        Returns the report as a dictionary
+        """
+        return {
+            'started_at': self.started_at.isoformat(),
+            'process_peak_rss_mb': round(process_peak_rss_mb(), 1),
+            'round_trips': self.round_trips,
+            'stages': [stage.to_dict() for stage in self.stages],
+        }
+
+    def write(self, folder):
+        """
+        Writes the report as JSON into folder, returning the path of the file
+        """
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'run_{self.started_at:%Y%m%d_%H%M%S}.json')
+
+        with open(path, mode='w', encoding='utf8') as report_file:
+            json.dump(self.to_dict(), report_file, indent=2)
+
+        return path
+
+    def print_summary(self):
+        """
+        Prints one line per stage: the RSS change of the stage and the peak
+        RSS of the process when the stage ended
+        """
+        print(f'{"stage":<28}{"wall s":>9}{"cpu s":>9}{"rss +MB":>9}{"proc peak":>10}'
+              f'{"rows in":>9}{"rows out":>9}{"trips":>7}')
+
+        for stage in self.stages:
+            print(f'{stage.name:<28}{stage.wall_seconds:>9.2f}{stage.cpu_seconds:>9.2f}'
+                  f'{_megabytes(stage.rss_delta_mb):>9}{stage.process_peak_rss_mb:>10.1f}'
+                  f'{_count(stage.rows_in):>9}{_count(stage.rows_out):>9}'
+                  f'{stage.round_trips:>7}')
+
+
+def _count(value):
+    """
+    Formats an optional row count
+    """
+    return '-' if value is None else value
+
+
+def _megabytes(value):
+    """
+    Formats an optional size in MiB
+    """
+    return '-' if value is None else f'{value:+.1f}'
+
+
+def rss_mb():
+    """
+    Returns the current resident set size of the process in MiB, read from
+    /proc/self/statm, or None where it is not available
+    """
+    try:
+        with open('/proc/self/statm', encoding='ascii') as statm:
+            resident_pages = int(statm.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def process_peak_rss_mb():
+    """
+    Returns the peak resident set size of the whole process so far, in MiB. It
+    never decreases, so it is not the peak of any one stage
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Report of the current run, used by the stages of main.py
+report = RunReport()
+
+
+def stage(name, rows_in=None):
+    """
+    Measures a stage of the current run
+    """
+    return report.stage(name, rows_in)
+
+
+def count_round_trips(n=1):
+    """
+    Records n database round trips made outside SQLAlchemy's execute, such as
+    COPY through a raw DBAPI cursor
+    """
+    report.round_trips += n
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _on_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """
+    Counts every statement sent through a SQLAlchemy engine as a round trip
+    """
+    count_round_trips()
@@ -0,0 +1,616 @@
+"""
+This module comprises the bulk load path of the ETL system. Stations are
+upserted on their register and prices are written in batches, along with the
+current prices, rollups and area statistics they feed. PostgreSQL stages rows
+with COPY, any other dialect falls back to executemany batches
+"""
+
+import io
+import os
+import sys
+import numpy as np
+import pandas as pd
+import sqlalchemy as db
+from timeit import default_timer as timer
+
+from instrumentation import count_round_trips
+
+# The grid, search text, rollup buckets and percentiles are imported from the
+# gasoline app at the repository root, so the ETL writes the same values the
+# API computes. The ETL runs without Django: gasoline.geo, gasoline.search,
+# gasoline.rollups and gasoline.area_stats must not import it
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gasoline.area_stats import PERCENTILES
+from gasoline.geo import GRID_COLUMNS, GRID_DEGREES
+from gasoline.rollups import BUCKETS, DAY, HOUR, WEEK
+from gasoline.search import SEARCH_FIELDS, normalize
+
+
+STATIONS_TABLE_NAME = 'gasoline_station'
+PRICES_TABLE_NAME = 'gasoline_price'
+CURRENT_PRICES_TABLE_NAME = 'gasoline_currentprice'
+PRICE_ROLLUPS_TABLE_NAME = 'gasoline_pricerollup'
+AREA_STATS_TABLE_NAME = 'gasoline_areapricestats'
+DATA_VERSION_TABLE_NAME = 'gasoline_dataversion'
+LOADED_SNAPSHOTS_TABLE_NAME = 'gasoline_loadedsnapshot'
+DATA_VERSION_ID = 1
+BATCH_SIZE = 5000
+
+STATION_COLS = ['id', 'name', 'register', 'longitude', 'latitude', 'town', 'state',
+                'is_active', 'status', 'grid_cell', 'search_text']
+UPDATE_COLS = ['name', 'longitude', 'latitude', 'town', 'state', 'is_active', 'grid_cell',
+               'search_text']
+PRICE_COLS = ['gas_type', 'price', 'date', 'station_id']
+CURRENT_PRICE_KEY_COLS = ['station_id', 'gas_type']
+# Columns of the station copied to its current prices, to rank them by area
+LOCATION_COLS = ['state', 'town', 'latitude', 'longitude', 'grid_cell']
+ROLLUP_KEY_COLS = ['station_id', 'gas_type', 'bucket', 'start']
+ROLLUP_COLS = ROLLUP_KEY_COLS + ['min_price', 'max_price', 'price_sum', 'price_count',
+                                 'last_price', 'last_date']
+# Areas of AreaPriceStats by level, the state level has no town
+AREA_LEVELS = {'state': ['state'], 'town': ['state', 'town']}
+AREA_STATS_COLS = ['level', 'gas_type', 'state', 'town', 'station_count', 'avg_price',
+                   'min_price', 'max_price'] + list(PERCENTILES) + \
+    ['oldest_price_date', 'latest_price_date', 'refreshed']
+
+metadata = db.MetaData()
+
+# Static mirrors of the Django models, so no reflection is needed on each run
+stations_table = db.Table(
+    STATIONS_TABLE_NAME, metadata,
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('name', db.String(200)),
+    db.Column('about', db.String(200)),
+    db.Column('picture', db.String(100)),
+    db.Column('register', db.String(64), unique=True),
+    db.Column('latitude', db.Float),
+    db.Column('longitude', db.Float),
+    db.Column('town', db.String(50)),
+    db.Column('state', db.String(50)),
+    db.Column('is_active', db.Boolean),
+    db.Column('status', db.String(10)),
+    db.Column('grid_cell', db.Integer, index=True),
+    db.Column('search_text', db.Text, default=''),
+)
+
+prices_table = db.Table(
+    PRICES_TABLE_NAME, metadata,
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('gas_type', db.String(20)),
+    db.Column('price', db.Float),
+    db.Column('date', db.DateTime(timezone=True)),
+    db.Column('station_id', db.Integer, db.ForeignKey(f'{STATIONS_TABLE_NAME}.id')),
+)
+
+current_prices_table = db.Table(
+    CURRENT_PRICES_TABLE_NAME, metadata,
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('gas_type', db.String(20)),
+    db.Column('price', db.Float),
+    db.Column('date', db.DateTime(timezone=True)),
+    db.Column('station_id', db.Integer, db.ForeignKey(f'{STATIONS_TABLE_NAME}.id')),
+    db.Column('town', db.String(50)),
+    db.Column('state', db.String(50)),
+    db.Column('latitude', db.Float),
+    db.Column('longitude', db.Float),
+    db.Column('grid_cell', db.Integer),
+    db.UniqueConstraint(*CURRENT_PRICE_KEY_COLS),
+)
+
+price_rollups_table = db.Table(
+    PRICE_ROLLUPS_TABLE_NAME, metadata,
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('station_id', db.Integer, db.ForeignKey(f'{STATIONS_TABLE_NAME}.id')),
+    db.Column('gas_type', db.String(20)),
+    db.Column('bucket', db.String(4)),
+    db.Column('start', db.DateTime(timezone=True)),
+    db.Column('min_price', db.Float),
+    db.Column('max_price', db.Float),
+    db.Column('price_sum', db.Float),
+    db.Column('price_count', db.Integer),
+    db.Column('last_price', db.Float),
+    db.Column('last_date', db.DateTime(timezone=True)),
+    db.UniqueConstraint(*ROLLUP_KEY_COLS),
+)
+
+area_stats_table = db.Table(
+    AREA_STATS_TABLE_NAME, metadata,
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('level', db.String(5)),
+    db.Column('gas_type', db.String(20)),
+    db.Column('state', db.String(50)),
+    db.Column('town', db.String(50)),
+    db.Column('station_count', db.Integer),
+    db.Column('avg_price', db.Float),
+    db.Column('min_price', db.Float),
+    db.Column('max_price', db.Float),
+    *(db.Column(col, db.Float) for col in PERCENTILES),
+    db.Column('oldest_price_date', db.DateTime(timezone=True)),
+    db.Column('latest_price_date', db.DateTime(timezone=True)),
+    db.Column('refreshed', db.DateTime(timezone=True)),
+    db.UniqueConstraint('level', 'gas_type', 'state', 'town'),
+)
+
+data_version_table = db.Table(
+    DATA_VERSION_TABLE_NAME, metadata,
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('version', db.Integer),
+    db.Column('updated', db.DateTime(timezone=True)),
+)
+
+loaded_snapshots_table = db.Table(
+    LOADED_SNAPSHOTS_TABLE_NAME, metadata,
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('snapshot', db.String(32), unique=True),
+    db.Column('loaded', db.DateTime(timezone=True)),
+)
+
+
+def batches(rows, size=BATCH_SIZE):
+    """
+    Yields consecutive slices of rows with at most size elements
+    """
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def grid_cells(latitudes, longitudes):
+    """
+    Returns the grid cell of each coordinate, as Station.grid_cell does
+    """
+    rows = np.floor((latitudes + 90) / GRID_DEGREES).astype('int64')
+    columns = np.floor((longitudes + 180) / GRID_DEGREES).astype('int64')
+    return rows * GRID_COLUMNS + columns
+
+
+def search_texts(df):
+    """
+    Returns the search text of each station, as Station.search_text does:
+    name, town and state normalized by gasoline.search
+    """
+    parts = []
+
+    # Towns and states repeat, each distinct value is normalized once
+    for col in SEARCH_FIELDS:
+        values = df[col].fillna('').astype(str)
+        distinct = values.unique()
+        parts.append(values.map(dict(zip(distinct, map(normalize, distinct)))))
+
+    return parts[0].str.cat(parts[1:], sep=' ').str.split().str.join(' ')
+
+
+def station_frame(stations_df):
+    """
+    Maps the stations DataFrame produced by transform() to the columns of the
+    stations table
+    """
+    stations = stations_df.rename(columns={'cre_id': 'register', 'city': 'town'})
+    return stations.assign(is_active=True, status='ghost',
+                           grid_cell=grid_cells(stations['latitude'], stations['longitude']),
+                           search_text=search_texts(stations))[STATION_COLS]
+
+
+def price_frame(prices_df, station_ids):
+    """
+    Maps the long prices DataFrame produced by transform(), keyed by register,
+    to the columns of the prices table using the station ids keyed by register.
+    Prices whose register is missing or has no station id are dropped
+    """
+    mapped_df = prices_df.assign(station_id=prices_df['register'].map(station_ids))
+    unmapped = mapped_df['station_id'].isna()
+
+    if unmapped.any():
+        print(f'Skipped {unmapped.sum()} prices without a station')
+    return mapped_df[~unmapped].astype({'station_id': 'int64'})[PRICE_COLS]
+
+
+def rollup_frame(prices_df):
+    """
+    Returns the rollups of prices_df in the columns of the price rollups
+    table: the min, max, sum, count and last price of each station and
+    gas_type by hour, day and week. Buckets start in UTC, naive dates being
+    UTC already, and weeks start on monday, as PriceRollup does
+    """
+    dates = pd.to_datetime(prices_df['date'])
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_convert('UTC').dt.tz_localize(None)
+    days = dates.dt.floor(BUCKETS[DAY])
+    starts = {HOUR: dates.dt.floor(BUCKETS[HOUR]), DAY: days,
+              WEEK: days - pd.to_timedelta(days.dt.weekday, unit='D')}
+
+    ordered = prices_df.assign(date=dates).sort_values('date', kind='stable')
+    frames = []
+    for bucket in BUCKETS:
+        frames.append(
+            ordered.assign(bucket=bucket, start=starts[bucket])
+            .groupby(ROLLUP_KEY_COLS, sort=False)
+            .agg(min_price=('price', 'min'), max_price=('price', 'max'),
+                 price_sum=('price', 'sum'), price_count=('price', 'size'),
+                 last_price=('price', 'last'), last_date=('date', 'last'))
+            .reset_index())
+
+    return pd.concat(frames, ignore_index=True)[ROLLUP_COLS]
+
+
+def area_stats_frame(current_df, refreshed):
+    """
+    Returns the statistics of the current prices of current_df, with the
+    gas_type, price, date, state and town of each active station, in the
+    columns of the area stats table: the station count, average, extremes
+    and percentiles of the prices and their oldest and latest dates by
+    gas_type in each state and town, as gasoline/area_stats.py computes them
+    """
+    frames = []
+
+    for level, keys in AREA_LEVELS.items():
+        area_df = current_df[current_df[keys].notna().all(axis=1) &
+                             (current_df[keys] != '').all(axis=1)]
+        grouped = area_df.groupby(keys + ['gas_type'])
+        stats = grouped['price'].agg(station_count='size', avg_price='mean',
+                                     min_price='min', max_price='max')
+        for col, q in PERCENTILES.items():
+            stats[col] = grouped['price'].quantile(q)
+        stats = stats.join(grouped['date'].agg(oldest_price_date='min',
+                                               latest_price_date='max'))
+        frames.append(stats.reset_index().assign(level=level))
+
+    return pd.concat(frames, ignore_index=True).fillna({'town': ''}) \
+        .assign(refreshed=refreshed)[AREA_STATS_COLS]
+
+
+def frame_rows(df):
+    """
+    Returns the rows of df as tuples of native Python values, as the DBAPI
+    executemany expects them
+    """
+    columns = []
+
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = list(series.dt.to_pydatetime())
+        else:
+            values = series.astype(object).where(series.notna(), None).tolist()
+        columns.append(values)
+
+    return list(zip(*columns))
+
+
+def markers(connection, n):
+    """
+    Returns n comma separated parameter markers in the DBAPI paramstyle of the
+    connection
+    """
+    mark = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+    return ', '.join([mark] * n)
+
+
+def upsert_stations_sql(source, update=True):
+    """
+    Returns the set-based upsert of stations read from source, which is either
+    a VALUES placeholder list or a staging table. Without update, stations
+    whose register already exists are left untouched
+    """
+    action = 'DO UPDATE SET ' + ', '.join(f'{col} = excluded.{col}' for col in UPDATE_COLS) \
+        if update else 'DO NOTHING'
+    return (f'INSERT INTO {STATIONS_TABLE_NAME} ({", ".join(STATION_COLS)}) {source} '
+            f'ON CONFLICT (register) {action}')
+
+
+def upsert_current_prices_sql(source):
+    """
+    Returns the set-based upsert of current prices read from source, a SELECT
+    of the price columns followed by the location columns of the station. A
+    current price is only replaced by a price with the same or a later date
+    """
+    columns = PRICE_COLS + LOCATION_COLS
+    return (f'INSERT INTO {CURRENT_PRICES_TABLE_NAME} ({", ".join(columns)}) {source} '
+            f'ON CONFLICT ({", ".join(CURRENT_PRICE_KEY_COLS)}) DO UPDATE SET '
+            f'price = excluded.price, date = excluded.date, '
+            + ', '.join(f'{col} = excluded.{col}' for col in LOCATION_COLS) +
+            f' WHERE excluded.date >= {CURRENT_PRICES_TABLE_NAME}.date')
+
+
+def upsert_price_rollups_sql(source):
+    """
+    Returns the set-based upsert of price rollups read from source, in the
+    rollup columns. Rollups of a bucket already in the table are merged: the
+    extremes are kept, sums and counts are added and the last price is the
+    one with the latest date
+    """
+    table = PRICE_ROLLUPS_TABLE_NAME
+
+    def latest(col):
+        return (f'{col} = CASE WHEN excluded.last_date >= {table}.last_date '
+                f'THEN excluded.{col} ELSE {table}.{col} END')
+
+    return (f'INSERT INTO {table} ({", ".join(ROLLUP_COLS)}) {source} '
+            f'ON CONFLICT ({", ".join(ROLLUP_KEY_COLS)}) DO UPDATE SET '
+            f'min_price = CASE WHEN excluded.min_price < {table}.min_price '
+            f'THEN excluded.min_price ELSE {table}.min_price END, '
+            f'max_price = CASE WHEN excluded.max_price > {table}.max_price '
+            f'THEN excluded.max_price ELSE {table}.max_price END, '
+            f'price_sum = {table}.price_sum + excluded.price_sum, '
+            f'price_count = {table}.price_count + excluded.price_count, '
+            f'{latest("last_price")}, {latest("last_date")}')
+
+
+def sync_current_price_areas(connection, station_ids, batch_size=BATCH_SIZE):
+    """
+    Copies the location of the stations of station_ids to their current
+    prices, so upserted stations that moved keep the rankings consistent
+    """
+    for batch in batches(list(station_ids), batch_size):
+        area = {col: f'(SELECT s.{col} FROM {STATIONS_TABLE_NAME} s '
+                     f'WHERE s.id = {CURRENT_PRICES_TABLE_NAME}.station_id)'
+                for col in LOCATION_COLS}
+        connection.execute(
+            f'UPDATE {CURRENT_PRICES_TABLE_NAME} SET '
+            + ', '.join(f'{col} = {value}' for col, value in area.items())
+            + f' WHERE station_id IN ({markers(connection, len(batch))})', tuple(batch))
+
+
+def copy_frame(cursor, table, df):
+    """
+    Streams the rows of df into the matching columns of table through a single
+    COPY ... FROM STDIN
+    """
+    buffer = io.StringIO()
+    df.to_csv(buffer, header=False, index=False, na_rep='\\N')
+
+    buffer.seek(0)
+    cursor.copy_expert(
+        f'COPY {table} ({", ".join(df.columns)}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')',
+        buffer)
+    count_round_trips()
+
+
+def upsert_stations(connection, stations_df, batch_size=BATCH_SIZE, update=True):
+    """
+    Upserts the rows of stations_df, in the columns of the stations table, on
+    their register in set-based statements. PostgreSQL stages them with COPY
+    into a temporary table, other dialects go through executemany batches.
+    Without update, only the stations with a new register are inserted;
+    with it, the current prices of the stations take their new area
+
+    Returns the register to id mapping of the upserted stations
+    """
+    if stations_df.empty:
+        return {}
+
+    if connection.dialect.name == 'postgresql':
+        cursor = connection.connection.cursor()
+
+        cursor.execute(f'CREATE TEMP TABLE tmp_station (LIKE {STATIONS_TABLE_NAME} '
+                       'INCLUDING DEFAULTS)')
+        count_round_trips()
+
+        for start in range(0, len(stations_df), batch_size):
+            copy_frame(cursor, 'tmp_station', stations_df.iloc[start:start + batch_size])
+
+        cursor.execute(upsert_stations_sql(f'SELECT {", ".join(STATION_COLS)} FROM tmp_station',
+                                           update))
+        cursor.execute(f'SELECT s.register, s.id FROM {STATIONS_TABLE_NAME} s '
+                       'JOIN tmp_station t ON t.register = s.register')
+        station_ids = dict(cursor.fetchall())
+        cursor.execute('DROP TABLE tmp_station')
+        count_round_trips(3)  # upsert, select and drop
+    else:
+        upsert = upsert_stations_sql(f'VALUES ({markers(connection, len(STATION_COLS))})',
+                                     update)
+        register_position = STATION_COLS.index('register')
+        station_ids = {}
+
+        for batch in batches(frame_rows(stations_df), batch_size):
+            connection.execute(upsert, batch)
+
+            registers = tuple(row[register_position] for row in batch)
+            query = (f'SELECT register, id FROM {STATIONS_TABLE_NAME} '
+                     f'WHERE register IN ({markers(connection, len(registers))})')
+            station_ids.update(connection.execute(query, registers).fetchall())
+
+    if update:
+        sync_current_price_areas(connection, station_ids.values(), batch_size)
+    return station_ids
+
+
+def insert_prices(connection, prices_df, batch_size=BATCH_SIZE):
+    """
+    Inserts the rows of prices_df, in the columns of the prices table, with a
+    single COPY on PostgreSQL or executemany batches on other dialects, and
+    upserts them as the current prices and into the price rollups
+    """
+    if prices_df.empty:
+        return
+
+    if connection.dialect.name == 'postgresql':
+        copy_frame(connection.connection.cursor(), PRICES_TABLE_NAME, prices_df)
+    else:
+        insert = (f'INSERT INTO {PRICES_TABLE_NAME} ({", ".join(prices_df.columns)}) '
+                  f'VALUES ({markers(connection, len(prices_df.columns))})')
+
+        for batch in batches(frame_rows(prices_df), batch_size):
+            connection.execute(insert, batch)
+
+    upsert_current_prices(connection, prices_df, batch_size)
+    upsert_price_rollups(connection, prices_df, batch_size)
+
+
+def upsert_current_prices(connection, prices_df, batch_size=BATCH_SIZE):
+    """
+    Upserts the latest row of each (station_id, gas_type) of prices_df as its
+    current price, along with the location read from its station. PostgreSQL
+    stages them with COPY into a temporary table, other dialects go through
+    executemany batches
+    """
+    current_df = prices_df.sort_values('date', kind='stable') \
+        .drop_duplicates(CURRENT_PRICE_KEY_COLS, keep='last')[PRICE_COLS]
+
+    if connection.dialect.name == 'postgresql':
+        cursor = connection.connection.cursor()
+
+        cursor.execute(f'CREATE TEMP TABLE tmp_currentprice (LIKE {CURRENT_PRICES_TABLE_NAME} '
+                       'INCLUDING DEFAULTS)')
+        copy_frame(cursor, 'tmp_currentprice', current_df)
+        cursor.execute(upsert_current_prices_sql(
+            f'SELECT {", ".join("t." + col for col in PRICE_COLS)}, '
+            f'{", ".join("s." + col for col in LOCATION_COLS)} '
+            f'FROM tmp_currentprice t JOIN {STATIONS_TABLE_NAME} s ON s.id = t.station_id'))
+        cursor.execute('DROP TABLE tmp_currentprice')
+        count_round_trips(3)  # create, upsert and drop
+        return
+
+    # The station id is bound twice, as a value and to look up the location
+    upsert = upsert_current_prices_sql(
+        f'SELECT {markers(connection, len(PRICE_COLS))}, '
+        f'{", ".join("s." + col for col in LOCATION_COLS)} '
+        f'FROM {STATIONS_TABLE_NAME} s WHERE s.id = {markers(connection, 1)}')
+    current_df = current_df.assign(area_station_id=current_df['station_id'])
+
+    for batch in batches(frame_rows(current_df), batch_size):
+        connection.execute(upsert, batch)
+
+
+def upsert_price_rollups(connection, prices_df, batch_size=BATCH_SIZE):
+    """
+    Merges the rollups of prices_df into the price rollups, so each load only
+    touches the buckets of its own prices. PostgreSQL stages them with COPY
+    into a temporary table, other dialects go through executemany batches
+    """
+    rollups_df = rollup_frame(prices_df)
+
+    if connection.dialect.name == 'postgresql':
+        cursor = connection.connection.cursor()
+
+        cursor.execute(f'CREATE TEMP TABLE tmp_pricerollup (LIKE {PRICE_ROLLUPS_TABLE_NAME} '
+                       'INCLUDING DEFAULTS)')
+        copy_frame(cursor, 'tmp_pricerollup', rollups_df)
+        cursor.execute(upsert_price_rollups_sql(
+            f'SELECT {", ".join(ROLLUP_COLS)} FROM tmp_pricerollup'))
+        cursor.execute('DROP TABLE tmp_pricerollup')
+        count_round_trips(3)  # create, upsert and drop
+        return
+
+    upsert = upsert_price_rollups_sql(f'VALUES ({markers(connection, len(ROLLUP_COLS))})')
+    for batch in batches(frame_rows(rollups_df), batch_size):
+        connection.execute(upsert, batch)
+
+
+def refresh_area_stats(connection, states=None, batch_size=BATCH_SIZE):
+    """
+    Recomputes the price statistics of the states and of their towns, or of
+    every area without states, from the current prices of the active
+    stations. The rows of the areas are replaced, so areas left without
+    prices are dropped
+    """
+    query = db.select([current_prices_table.c.gas_type, current_prices_table.c.price,
+                       current_prices_table.c.date, stations_table.c.state,
+                       stations_table.c.town]) \
+        .select_from(current_prices_table.join(stations_table)) \
+        .where(stations_table.c.is_active.is_(True))
+    delete = area_stats_table.delete()
+
+    if states is not None:
+        states = sorted(states)
+        if not states:
+            return
+        query = query.where(stations_table.c.state.in_(states))
+        delete = delete.where(area_stats_table.c.state.in_(states))
+
+    current_df = pd.DataFrame(connection.execute(query).fetchall(),
+                              columns=['gas_type', 'price', 'date', 'state', 'town'])
+    connection.execute(delete)
+    if current_df.empty:
+        return
+
+    stats_df = area_stats_frame(current_df, pd.Timestamp.now(tz='UTC'))
+    if connection.dialect.name == 'postgresql':
+        copy_frame(connection.connection.cursor(), AREA_STATS_TABLE_NAME, stats_df)
+        return
+
+    insert = (f'INSERT INTO {AREA_STATS_TABLE_NAME} ({", ".join(AREA_STATS_COLS)}) '
+              f'VALUES ({markers(connection, len(AREA_STATS_COLS))})')
+    for batch in batches(frame_rows(stats_df), batch_size):
+        connection.execute(insert, batch)
+
+
+def bump_data_version(connection):
+    """
+    Increases the data version of the API within the load transaction, so the
+    responses it cached before the load are not served anymore
+    """
+    now = pd.Timestamp.now(tz='UTC').to_pydatetime()
+    updated = connection.execute(
+        data_version_table.update()
+        .where(data_version_table.c.id == DATA_VERSION_ID)
+        .values(version=data_version_table.c.version + 1, updated=now)).rowcount
+
+    if not updated:
+        connection.execute(data_version_table.insert()
+                           .values(id=DATA_VERSION_ID, version=1, updated=now))
+
+
+def report_throughput(start, n_stations, n_prices):
+    """
+    Prints the number of station and price rows written since start, returning
+    their total
+    """
+    elapsed = timer() - start
+    n_rows = n_stations + n_prices
+    print(f'Loaded {n_stations} stations and {n_prices} prices in {elapsed:.2f}s '
+          f'({n_rows / elapsed if elapsed else 0:.0f} rows/s)')
+
+    return n_rows
+
+
+def bulk_load(connection, stations_df, prices_df, batch_size=BATCH_SIZE, update_stations=True):
+    """
+    Loads the stations and long prices DataFrames produced by transform()
+    through the bulk path that fits the connection's dialect and prints the
+    throughput. Every station is upserted and every price is inserted; without
+    update_stations the stations already in the database keep their values.
+    The statistics of every area are refreshed and the data version is bumped
+    along with the rows
+
+    Returns the number of rows written
+    """
+    start = timer()
+
+    station_ids = upsert_stations(connection, station_frame(stations_df), batch_size,
+                                  update_stations)
+    prices_df = price_frame(prices_df, station_ids)
+    insert_prices(connection, prices_df, batch_size)
+    refresh_area_stats(connection, batch_size=batch_size)
+    bump_data_version(connection)
+
+    return report_throughput(start, len(stations_df), len(prices_df))
+
+
+def record_snapshot(connection, snapshot):
+    """
+    Records the snapshot, the stamp of its run, as loaded within the load
+    transaction, so it is only recorded along with its rows
+    """
+    connection.execute(loaded_snapshots_table.insert().values(
+        snapshot=snapshot, loaded=pd.Timestamp.now(tz='UTC').to_pydatetime()))
+
+
+def loaded_snapshots(connection):
+    """
+    Returns the set of the stamps of the snapshots recorded as loaded
+    """
+    query = db.select([loaded_snapshots_table.c.snapshot])
+    return {snapshot for snapshot, in connection.execute(query)}
+
+
+def loaded_run_dates(connection, start, end):
+    """
+    Returns the set of distinct price dates in the database from start,
+    included, to end, excluded. Every run stamps its prices with a single date,
+    so these identify the runs loaded before their snapshots were recorded,
+    except the delta runs that wrote no price
+    """
+    query = db.select([prices_table.c.date]).distinct() \
+        .where(prices_table.c.date >= start).where(prices_table.c.date < end)
+
+    return {date.replace(tzinfo=None) for date, in connection.execute(query)}
@@ -5,18 +5,23 @@ insert records into a database
 """
 
 import os
+import argparse
+import cProfile
 import sys
-import random
-import requests
 import traceback
-import numpy as np
 import pandas as pd
-import geopandas as gpd
 import sqlalchemy as db
-import xmltodict as x2d
 from pathlib import Path
-from datetime import timedelta, datetime
-from timeit import default_timer as timer
+from datetime import datetime, timedelta
+from parsers import PARSERS, PRICE_COLS
+from loaders import bulk_load, loaded_run_dates, loaded_snapshots, record_snapshot
+from archive import list_snapshots, read_snapshot, snapshot_stamp, write_snapshot
+from delta import delta_load
+from download import DownloadError, commit_validators, fetch_all
+from geocache import GeocodeCache
+from boundaries import BoundaryStore
+from validation import validate, write_quarantine
+from instrumentation import report, stage
 
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -25,129 +30,117 @@ URL_SOURCES = [
     'https://publicacionexterna.azurewebsites.net/publicaciones/prices'
 ]
 DB_STRING = os.environ['DATABASE_URL']
-STATIONS_TABLE_NAME = 'gasoline_station'
-PRICES_TABLE_NAME = 'gasoline_price'
 DATA_FOLDER = f'{BASE_DIR}/data'
 GEO_FOLDER = f'{DATA_FOLDER}/geodata'
 DATASET_FILES = [f'{DATA_FOLDER}/places.xml', f'{DATA_FOLDER}/prices.xml']
 GEO_FILE = f'{GEO_FOLDER}/MEX_adm2.shp'
-DF_COLS = ['place_id', 'name', 'cre_id', 'longitude', 'latitude', 'regular_price',
-           'diesel_price', 'premium_price']
+GEO_SOURCE_FILES = [GEO_FILE, f'{GEO_FOLDER}/MEX_adm2.dbf']
+GEOCACHE_FILE = f'{DATA_FOLDER}/geocache.csv'
+BOUNDARY_STORE_FILE = f'{DATA_FOLDER}/boundaries.pickle'
+QUARANTINE_FOLDER = f'{DATA_FOLDER}/quarantine'
+REPORTS_FOLDER = f'{DATA_FOLDER}/reports'
+ARCHIVE_FOLDER = f'{DATA_FOLDER}/archive'
+STATION_COLS = ['id', 'name', 'cre_id', 'longitude', 'latitude', 'city', 'state']
 N_STATES = 3
 N_ROWS = 2250
+EXTRACT_PARSER = 'stream'
 
 
-def get_dataset(index):
+def get_datasets():
     """
-    Attempts to retrieve the dataset file with the specified index from the source
-    website (deleting first any previously existing file)
+    Retrieves the dataset files from the source website concurrently, keeping
+    the previous files when the source reports them as not modified
+
+    Returns True if any of the dataset files changed
     """
-    try:
-        print('Deleting previous files...')
-        os.remove(DATASET_FILES[index])
-    except FileNotFoundError:
-        pass
+    print(f'Retrieving {", ".join(URL_SOURCES)}')
 
     try:
-        print(f'Retrieving {URL_SOURCES[index]}')
-        response = requests.get(URL_SOURCES[index], allow_redirects=True)
-
-        if response.status_code != 200:
-            raise Exception(f'Could not retrieve anything from {URL_SOURCES[index]}')
-
-        with open(DATASET_FILES[index], mode='wb') as new_file:
-            new_file.write(response.content)
-    except Exception as e:
+        with stage('download'):
+            changed = fetch_all(URL_SOURCES, DATASET_FILES)
+    except DownloadError as e:
         print(e)
         sys.exit(1)
 
+    for url, is_changed in zip(URL_SOURCES, changed):
+        print(f'{url}: {"updated" if is_changed else "not modified"}')
 
-def create_price_data(record, primary_key, price_type):
-    """
-    Creates a dictionary for the record according to the specified price type
-    Returns the dictionary or None if the record doesn't have that price type
-    """
-    price_key = f'{price_type}_price'
-    if pd.notna(record[price_key]):
-        return {
-            'gas_type': price_type,
-            'price': record[price_key],
-            'date': datetime.now(),
-            'station_id': primary_key
-        }
-    else:
-        return None
+    return any(changed)
 
 
 def extract():
     """
     Extract stage. Returns a tuple with:
-        GeoDataFrame of retrieved stations from datasets
-        GeoDataFrame of cities from local DIVA-GIS data
-        GeoDataFrame of states from local DIVA-GIS data
+        DataFrame of retrieved stations from datasets
+        BoundaryStore of cities and states from local DIVA-GIS data
     """
     stations_df = extract_stations()
-    geo_gdf = gpd.read_file(GEO_FILE)
-    return stations_df, geo_gdf
-
 
-def extract_stations():
-    """
-    Obtains dataset files of places and prices from the source website and then
-    loads it into a Pandas DataFrame, which is returned
-    """
-    get_dataset(0)
-    get_dataset(1)
+    with stage('boundaries'):
+        boundaries = BoundaryStore.load(GEO_SOURCE_FILES, BOUNDARY_STORE_FILE)
 
-    places_and_prices = {}
+    return stations_df, boundaries
 
-    with open(DATASET_FILES[0], encoding='utf8') as dataset:
-        xml_tree = x2d.parse(dataset.read())
 
-        places_list = xml_tree['places']['place']
+def extract_stations(parser=EXTRACT_PARSER):
+    """
+    Loads the dataset files of places and prices into a Pandas DataFrame,
+    which is returned
 
-        for place in places_list:
-            pid = int(place['@place_id'])
+    The parser argument selects one of the PARSERS: 'stream' walks <place>
+    elements one at a time, 'xmltodict' builds the complete document tree
+    """
+    with stage('parse') as parse_stage:
+        stations_df = PARSERS[parser](DATASET_FILES[0], DATASET_FILES[1])
+        parse_stage.rows_out = len(stations_df)
 
-            if not places_and_prices.get(pid):
-                places_and_prices[pid] = {}
+    return stations_df
 
-            places_and_prices[pid]['name'] = place['name']
-            places_and_prices[pid]['cre_id'] = place['cre_id']
-            places_and_prices[pid]['longitude'] = place['location']['x']
-            places_and_prices[pid]['latitude'] = place['location']['y']
 
-    with open(DATASET_FILES[1], encoding='utf8') as dataset:
-        xml_tree = x2d.parse(dataset.read(), force_list=('gas_price',))
+def spatial_join(stations_df, boundaries, workers=1):
+    """
+    Performs the point-in-polygon join of stations_df against the DIVA-GIS data,
+    across a pool of processes when workers is greater than one
 
-        prices_list = xml_tree['places']['place']
+    Returns a DataFrame with the city and state of each station, empty for the
+    stations outside every boundary
+    """
+    if workers > 1:
+        states, cities = boundaries.locate_parallel(
+            stations_df['longitude'], stations_df['latitude'], workers)
+    else:
+        states, cities = boundaries.locate(stations_df['longitude'], stations_df['latitude'])
+    return pd.DataFrame({'city': cities, 'state': states}, index=stations_df.index)
 
-        for price in prices_list:
-            pid = int(price['@place_id'])
 
-            if not places_and_prices.get(pid):
-                places_and_prices[pid] = {}
+def reverse_geocode(stations_df, boundaries, workers=1):
+    """
+    Performs reverse geocoding on stations_df against the DIVA-GIS data to obtain
+    city and state information. Stations already in the geocode cache with the
+    same coordinates skip the spatial join
+    
+    Returns the stations DataFrame with new columns for city and state
+    """
+    with stage('reverse_geocode', rows_in=len(stations_df)) as geocode_stage:
+        cache = GeocodeCache.load(GEOCACHE_FILE, boundaries.checksum)
+        cached_df, missed = cache.lookup(stations_df)
+        geo_dfs = [cached_df]
 
-            gas_prices = price['gas_price']
+        if missed.any():
+            missed_df = stations_df[missed]
+            joined_df = spatial_join(missed_df, boundaries, workers)
 
-            for g_price in gas_prices:
-                places_and_prices[pid][f'{g_price["@type"]}_price'] = float(
-                    g_price['#text'])
+            cache.add(missed_df, joined_df)
+            cache.save()
+            geo_dfs.append(joined_df)
 
-    return pd.DataFrame.from_dict(places_and_prices, orient='index')
+        print(cache.stats())
 
+        geo_df = pd.concat(geo_dfs).dropna(subset=['state'])
+        stations_geo_df = stations_df.join(geo_df, how='inner')
+        geocode_stage.rows_out = len(stations_geo_df)
 
-def reverse_geocode(stations_df, geo_gdf):
-    """
-    Performs reverse geocoding on stations_gdf against the DIVA-GIS data to obtain
-    city and state information
-    
-    Returns the stations GeoDataFrame with new columns for city and state
-    """
-    stations_gdf = gpd.GeoDataFrame(stations_df, geometry=gpd.points_from_xy(stations_df.longitude, stations_df.latitude)).set_crs(epsg=4326)
-    stations_geo_gdf = gpd.sjoin(stations_gdf, geo_gdf[['NAME_1', 'NAME_2', 'geometry']])
-    stations_geo_gdf = stations_geo_gdf.rename(columns={'NAME_1': 'state', 'NAME_2': 'city'})
-    return stations_geo_gdf
+    return stations_geo_df
 
 
 def get_states_with_most_rows(gdf, n):
@@ -160,98 +153,214 @@ def get_states_with_most_rows(gdf, n):
     return counts
 
 
-def transform(stations_df, geo_gdf):
+def transform(stations_df, boundaries, national=False, workers=1, run_date=None):
     """
     This function cleans the gas stations dataframe in order to obtain records
     with at least one gas type price and correct values 
 
-    It returns the representation of the cleaned dataframe as a list of dictionaries
+    Unless national is set, the output is capped to the N_STATES states with
+    the most stations and to N_ROWS rows
+
+    It returns a tuple with the cleaned stations DataFrame and the long prices
+    DataFrame built by prices_frame() with a single run timestamp, run_date or
+    the current time
     """
+    run_date = run_date or datetime.now()
     print('Cleaning and packing data...')
 
-    stations_complete_data_df = stations_df[stations_df['latitude'].notna() & stations_df['longitude'].notna() &
-        (stations_df['regular_price'].notna() | stations_df['premium_price'].notna() | stations_df['diesel_price'].notna())].copy()
+    with stage('validate', rows_in=len(stations_df)) as validate_stage:
+        stations_complete_data_df, quarantine_df, counts = validate(stations_df)
+        write_quarantine(quarantine_df, counts, QUARANTINE_FOLDER, run_date)
+        validate_stage.rows_out = len(stations_complete_data_df)
 
-    bad_records = stations_complete_data_df[(stations_complete_data_df['regular_price'] <= 1) | 
-        (stations_complete_data_df['diesel_price'] <= 1) | (stations_complete_data_df['premium_price'] <= 1) | 
-        (stations_complete_data_df['regular_price'] >= 40) | (stations_complete_data_df['diesel_price'] >= 40) |
-        (stations_complete_data_df['premium_price'] >= 40)]
+    stations_complete_data_df.index.names = ['id']
 
-    stations_complete_data_df.drop(bad_records.index, inplace=True)
+    stations_geo_gdf = reverse_geocode(stations_complete_data_df, boundaries, workers)
 
-    stations_complete_data_df.index.names = ['id']
+    if national:
+        clean_stations_df = stations_geo_gdf.sort_index().reset_index()
+    else:
+        frequent_states = get_states_with_most_rows(stations_geo_gdf, N_STATES)
+        clean_stations_df = stations_geo_gdf[stations_geo_gdf['state'].isin(frequent_states)].reset_index()[:N_ROWS]
+
+    return clean_stations_df[STATION_COLS], prices_frame(clean_stations_df, run_date)
 
-    stations_geo_gdf = reverse_geocode(stations_complete_data_df, geo_gdf)
 
-    frequent_states = get_states_with_most_rows(stations_geo_gdf, N_STATES)
+def prices_frame(stations_df, run_date):
+    """
+    Reshapes the price columns of stations_df into one row per available
+    (register, gas_type) price, all stamped with run_date
+    """
+    prices_df = stations_df.melt(id_vars='cre_id', value_vars=PRICE_COLS,
+                                 var_name='gas_type', value_name='price') \
+        .dropna(subset=['price']).rename(columns={'cre_id': 'register'})
+
+    prices_df['gas_type'] = prices_df['gas_type'].str[:-len('_price')]
+    prices_df['date'] = run_date
 
-    return stations_geo_gdf[stations_geo_gdf['state'].isin(frequent_states)].reset_index()[:N_ROWS].to_dict('records')
+    return prices_df.reset_index(drop=True)
 
 
-def load(stations_dict):
+def load(stations_df, prices_df, delta=False, national=False, run_date=None):
     """
-    Loads the information in the data structure stations_dict to the database
+    Loads the stations and long prices DataFrames produced by transform() to
+    the database, recording the snapshot of the run started at run_date as
+    loaded in the same transaction
+
+    With delta, only new or modified stations and moved prices are written and,
+    for national snapshots, stations missing from the snapshot are deactivated
     """
     print(f'Connecting to the database...')
 
     engine = db.create_engine(DB_STRING)
-    metadata = db.MetaData()
-    prices_table = db.Table(
-        PRICES_TABLE_NAME, metadata, autoload=True, autoload_with=engine)
-    stations_table = db.Table(
-        STATIONS_TABLE_NAME, metadata, autoload=True, autoload_with=engine)
 
-    with engine.begin() as connection:
+    with stage('load', rows_in=len(stations_df) + len(prices_df)) as load_stage, \
+            engine.begin() as connection:
         print('Inserting data...')
 
-        for record in stations_dict:
-            stations_data = {
-                'id': record['id'],
-                'name': record['name'],
-                'register': record['cre_id'],
-                'longitude': record['longitude'],
-                'latitude': record['latitude'],
-                'town': record['city'],
-                'state': record['state'],
-                'is_active': True,
-                'status': 'ghost'
-            }
-
-            try:
-                result = connection.execute(db.insert(stations_table), stations_data)
-
-                pk = result.inserted_primary_key[0]
-
-                regular_price_data = create_price_data(record, pk, 'regular')
-                diesel_price_data = create_price_data(record, pk, 'diesel')
-                premium_price_data = create_price_data(record, pk, 'premium')
-
-                if regular_price_data:
-                    connection.execute(db.insert(prices_table), regular_price_data)
-                if diesel_price_data:
-                    connection.execute(db.insert(prices_table), diesel_price_data)
-                if premium_price_data:
-                    connection.execute(db.insert(prices_table), premium_price_data)
-            except Exception:
-                print('A problem ocurred when inserting records')
-                traceback.print_exc()
-                sys.exit(1)
+        try:
+            if delta:
+                load_stage.rows_out = delta_load(connection, stations_df, prices_df,
+                                                 complete=national)['rows_written']
+            else:
+                load_stage.rows_out = bulk_load(connection, stations_df, prices_df)
+
+            if run_date is not None:
+                record_snapshot(connection, snapshot_stamp(run_date))
+        except Exception:
+            print('A problem ocurred when inserting records')
+            traceback.print_exc()
+            sys.exit(1)
 
         print('Finished inserting records')
 
 
+def archive_snapshot(stations_df, prices_df, run_date):
+    """
+    Writes the cleaned stations and prices of the run to the columnar archive
+    """
+    with stage('archive', rows_in=len(stations_df) + len(prices_df)):
+        paths = write_snapshot(ARCHIVE_FOLDER, stations_df, prices_df, run_date)
+
+    print(f'Snapshot archived to {", ".join(paths)}')
+
+
+def replay(start, end):
+    """
+    Backfills the snapshots archived from the day start to the day end into the
+    database through the bulk load path, oldest first and one transaction per
+    snapshot. Snapshots recorded as loaded are skipped and the stations already
+    in the database keep their current values
+    """
+    snapshots = list_snapshots(ARCHIVE_FOLDER, start, end)
+    print(f'Replaying {len(snapshots)} archived snapshots from {start:%Y-%m-%d} '
+          f'to {end:%Y-%m-%d}')
+
+    engine = db.create_engine(DB_STRING)
+
+    with stage('replay') as replay_stage:
+        with engine.connect() as connection:
+            recorded = loaded_snapshots(connection)
+            # Runs older than the first recorded snapshot were loaded before
+            # snapshots were recorded, only the dates of their prices tell them
+            first_recorded = min(recorded, default=None)
+            unrecorded_dates = loaded_run_dates(connection, start, end + timedelta(days=1))
+
+        replay_stage.rows_in = replay_stage.rows_out = 0
+
+        for run_date, stations_path, prices_path in snapshots:
+            snapshot = snapshot_stamp(run_date)
+            is_unrecorded = first_recorded is None or snapshot < first_recorded
+            if snapshot in recorded or (is_unrecorded and run_date in unrecorded_dates):
+                print(f'Snapshot of {run_date} already loaded, skipping')
+                continue
+
+            stations_df, prices_df = read_snapshot(stations_path, prices_path)
+            replay_stage.rows_in += len(stations_df) + len(prices_df)
+
+            with engine.begin() as connection:
+                replay_stage.rows_out += bulk_load(connection, stations_df, prices_df,
+                                                   update_stations=False)
+                record_snapshot(connection, snapshot)
+
+
+def parse_date(value):
+    """
+    Parses a YYYY-MM-DD command line date
+    """
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{value} is not a YYYY-MM-DD date')
+
+
+def parse_args():
+    """
+    Parses the command line options of the ETL
+    """
+    parser = argparse.ArgumentParser(description='Cuarto de Milla ETL')
+    parser.add_argument('--delta', action='store_true',
+                        help='only write prices that changed since the last run')
+    parser.add_argument('--force', action='store_true',
+                        help='process the datasets even if the source did not change')
+    parser.add_argument('--national', action='store_true',
+                        help=f'load every station instead of the {N_STATES} busiest states')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes used for the spatial join')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='write a cProfile dump of the run to PATH')
+    parser.add_argument('--replay', nargs=2, type=parse_date, metavar=('START', 'END'),
+                        help='load the snapshots archived between two dates instead '
+                             'of downloading the datasets')
+    return parser.parse_args()
+
+
+def run_stages(args):
+    """
+    Runs every stage of the ETL with the parsed command line options
+    """
+    if not get_datasets() and not args.force:
+        print('Datasets not modified since the last run, nothing to do')
+        return
+
+    run_date = datetime.now()
+    raw_stations_df, boundaries = extract()
+
+    with stage('transform', rows_in=len(raw_stations_df)) as transform_stage:
+        stations_df, prices_df = transform(raw_stations_df, boundaries, national=args.national,
+                                           workers=args.workers, run_date=run_date)
+        transform_stage.rows_out = len(stations_df)
+
+    load(stations_df, prices_df, delta=args.delta, national=args.national, run_date=run_date)
+
+    # Only a loaded dataset stops being downloaded again, and is archived
+    commit_validators(DATASET_FILES)
+    archive_snapshot(stations_df, prices_df, run_date)
+
+
 def run():
     """
     Entry point for this module
     """    
-    raw_stations_df, geo_gdf = extract()
-    clean_stations_dict = transform(raw_stations_df, geo_gdf)
+    args = parse_args()
+    profiler = cProfile.Profile() if args.profile else None
 
-    start = timer()
-    load(clean_stations_dict)
-    end = timer()
+    if profiler:
+        profiler.enable()
 
-    print(f'Load process took {timedelta(seconds=end-start)} (HH:MM:SS)')
+    try:
+        if args.replay:
+            replay(*args.replay)
+        else:
+            run_stages(args)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            print(f'Profile written to {args.profile}')
+
+        report.print_summary()
+        print(f'Run report written to {report.write(REPORTS_FOLDER)}')
 
 
 if __name__ == '__main__':
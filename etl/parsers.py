@@ -0,0 +1,162 @@
+"""
+This module comprises the parsers that turn the places.xml and prices.xml
+dataset files into a single stations DataFrame indexed by place_id
+"""
+
+import xml.etree.ElementTree as ET
+import numpy as np
+import pandas as pd
+import xmltodict as x2d
+
+
+PRICE_TYPES = ['regular', 'diesel', 'premium']
+PRICE_COLS = [f'{price_type}_price' for price_type in PRICE_TYPES]
+PLACE_COLS = ['name', 'cre_id', 'longitude', 'latitude']
+
+
+def _to_float(value):
+    """
+    Converts a text value from the XML into a float, returning None when the
+    value is missing or malformed
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_places(path, tag='place'):
+    """
+    Walks the XML file at path event by event, yielding every <place> element
+    once it has been completely read. The element is cleared after the caller
+    is done with it, so only one place is held in memory at a time
+    """
+    context = ET.iterparse(path, events=('start', 'end'))
+    _, root = next(context)
+
+    for event, elem in context:
+        if event == 'end' and elem.tag == tag:
+            yield elem
+            elem.clear()
+            root.clear()
+
+
+def parse_places_streaming(path):
+    """
+    Parses places.xml incrementally into columnar buffers
+
+    Returns a DataFrame indexed by place_id with the PLACE_COLS columns
+    """
+    place_ids, names, cre_ids, longitudes, latitudes = [], [], [], [], []
+
+    for place in iter_places(path):
+        place_ids.append(int(place.get('place_id')))
+        names.append(place.findtext('name') or None)
+        cre_ids.append(place.findtext('cre_id') or None)
+        longitudes.append(_to_float(place.findtext('location/x')))
+        latitudes.append(_to_float(place.findtext('location/y')))
+
+    return pd.DataFrame({
+        'name': names,
+        'cre_id': cre_ids,
+        'longitude': np.array(longitudes, dtype='float64'),
+        'latitude': np.array(latitudes, dtype='float64'),
+    }, index=pd.Index(place_ids, name='place_id'))
+
+
+def parse_prices_streaming(path):
+    """
+    Parses prices.xml incrementally into long columnar buffers (one entry per
+    <gas_price>) and pivots them once at the end
+
+    Returns a DataFrame indexed by place_id with the PRICE_COLS columns
+    """
+    place_ids, gas_types, prices = [], [], []
+
+    for place in iter_places(path):
+        pid = int(place.get('place_id'))
+
+        for g_price in place.iter('gas_price'):
+            place_ids.append(pid)
+            gas_types.append(f'{g_price.get("type")}_price')
+            prices.append(_to_float(g_price.text))
+
+    prices_df = pd.DataFrame({'place_id': place_ids, 'gas_type': gas_types,
+                              'price': np.array(prices, dtype='float64')})
+
+    # The last price reported for a place and gas type wins, as it did when
+    # filling the dict-of-dicts
+    wide_df = prices_df.drop_duplicates(['place_id', 'gas_type'], keep='last') \
+        .pivot(index='place_id', columns='gas_type', values='price')
+    wide_df.columns.name = None
+
+    return wide_df.reindex(columns=PRICE_COLS)
+
+
+def parse_datasets_streaming(places_path, prices_path):
+    """
+    Event-driven extract: parses both dataset files without building a full
+    document tree and joins them on place_id
+    """
+    places_df = parse_places_streaming(places_path)
+    prices_df = parse_prices_streaming(prices_path)
+
+    stations_df = places_df.join(prices_df, how='outer')
+    stations_df.index.name = None
+
+    return stations_df[PLACE_COLS + PRICE_COLS]
+
+
+def parse_datasets_xmltodict(places_path, prices_path):
+    """
+    Original extract: loads each dataset file into a string, parses it into a
+    complete xmltodict tree and fills a dict-of-dicts keyed by place_id
+
+    Returns the same DataFrame as parse_datasets_streaming
+    """
+    places_and_prices = {}
+
+    with open(places_path, encoding='utf8') as dataset:
+        xml_tree = x2d.parse(dataset.read(), force_list=('place',))
+
+        places_list = xml_tree['places']['place']
+
+        for place in places_list:
+            pid = int(place['@place_id'])
+
+            if not places_and_prices.get(pid):
+                places_and_prices[pid] = {}
+
+            location = place.get('location') or {}
+            places_and_prices[pid]['name'] = place.get('name') or None
+            places_and_prices[pid]['cre_id'] = place.get('cre_id') or None
+            places_and_prices[pid]['longitude'] = _to_float(location.get('x'))
+            places_and_prices[pid]['latitude'] = _to_float(location.get('y'))
+
+    with open(prices_path, encoding='utf8') as dataset:
+        xml_tree = x2d.parse(dataset.read(), force_list=('place', 'gas_price'))
+
+        prices_list = xml_tree['places']['place']
+
+        for price in prices_list:
+            pid = int(price['@place_id'])
+
+            if not places_and_prices.get(pid):
+                places_and_prices[pid] = {}
+
+            gas_prices = price.get('gas_price') or []
+
+            for g_price in gas_prices:
+                places_and_prices[pid][f'{g_price["@type"]}_price'] = _to_float(
+                    g_price.get('#text'))
+
+    stations_df = pd.DataFrame.from_dict(places_and_prices, orient='index') \
+        .reindex(columns=PLACE_COLS + PRICE_COLS).sort_index()
+
+    return stations_df.astype({col: 'float64' for col in PLACE_COLS[2:] + PRICE_COLS})
+
+
+PARSERS = {
+    'stream': parse_datasets_streaming,
+    'xmltodict': parse_datasets_xmltodict,
+}
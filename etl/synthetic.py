@@ -0,0 +1,152 @@
+"""
+This module writes synthetic places.xml and prices.xml files that follow the
+structure of the government datasets, so the ETL can be exercised offline
+
+Usage: python synthetic.py FOLDER [--places N] [--shapefile PATH] ...
+"""
+
+import os
+import random
+import argparse
+from itertools import accumulate
+from xml.sax.saxutils import escape
+from shapely.geometry import Point
+
+from boundaries import BoundaryStore
+from validation import MEXICO_BBOX
+
+
+BASE_PRICES = {'regular': 20.5, 'premium': 22.3, 'diesel': 21.9}
+DEFECTS = ['swapped', 'missing', 'duplicate']
+
+
+class BoundaryPoints:
+    """
+    Draws random points inside the polygons of a BoundaryStore, choosing each
+    polygon with a probability proportional to its area
+    """
+
+    def __init__(self, store, rng):
+        self.store = store
+        self.rng = rng
+        self.indexes = range(len(store.geometries))
+        self.cum_areas = list(accumulate(geometry.area for geometry in store.geometries))
+
+    def __call__(self):
+        i = self.rng.choices(self.indexes, cum_weights=self.cum_areas)[0]
+        geometry = self.store.geometries[i]
+        min_lon, min_lat, max_lon, max_lat = geometry.bounds
+
+        while True:
+            longitude = self.rng.uniform(min_lon, max_lon)
+            latitude = self.rng.uniform(min_lat, max_lat)
+            if geometry.contains(Point(longitude, latitude)):
+                return longitude, latitude
+
+
+def bbox_points(rng):
+    """
+    Returns a function drawing random points inside MEXICO_BBOX
+    """
+    min_lon, min_lat, max_lon, max_lat = MEXICO_BBOX
+    return lambda: (rng.uniform(min_lon, max_lon), rng.uniform(min_lat, max_lat))
+
+
+def write_places(path, n_places, seed=0, point=None, bad_values=0.0):
+    """
+    Writes a places.xml file with n_places <place> elements located by point,
+    a function returning (longitude, latitude). A bad_values fraction of the
+    places gets swapped or missing coordinates or repeats a cre_id
+    """
+    rng = random.Random(seed)
+    point = point or bbox_points(rng)
+
+    with open(path, mode='w', encoding='utf8') as places_file:
+        places_file.write('<?xml version="1.0" encoding="utf-8"?>\n<places>\n')
+
+        for pid in range(1, n_places + 1):
+            longitude, latitude = point()
+            cre_id = f'PL/{pid}/EXP/ES/2015'
+            defect = rng.choice(DEFECTS) if rng.random() < bad_values else None
+
+            if defect == 'swapped':
+                longitude, latitude = latitude, longitude
+            elif defect == 'duplicate' and pid > 1:
+                cre_id = f'PL/{rng.randint(1, pid - 1)}/EXP/ES/2015'
+
+            location = '' if defect == 'missing' else (f'    <location>\n'
+                                                       f'      <x>{longitude:.5f}</x>\n'
+                                                       f'      <y>{latitude:.5f}</y>\n'
+                                                       f'    </location>\n')
+
+            places_file.write(
+                f'  <place place_id="{pid}">\n'
+                f'    <name>{escape(f"ESTACION {pid}, S.A. DE C.V.")}</name>\n'
+                f'    <cre_id>{cre_id}</cre_id>\n'
+                f'{location}'
+                f'  </place>\n')
+
+        places_file.write('</places>\n')
+
+
+def write_prices(path, n_places, seed=0, missing_prices=0.1, bad_values=0.0):
+    """
+    Writes a prices.xml file for n_places places. Each gas type is missing from
+    a place with probability missing_prices (every place keeps at least one) and
+    a bad_values fraction of the prices is out of bounds
+    """
+    rng = random.Random(seed)
+
+    with open(path, mode='w', encoding='utf8') as prices_file:
+        prices_file.write('<?xml version="1.0" encoding="utf-8"?>\n<places>\n')
+
+        for pid in range(1, n_places + 1):
+            prices_file.write(f'  <place place_id="{pid}">\n')
+
+            gas_types = [gas_type for gas_type in BASE_PRICES if rng.random() >= missing_prices]
+
+            for gas_type in gas_types or ['regular']:
+                if rng.random() < bad_values:
+                    price = rng.choice([0.0, 0.99, 45.0, 199.9])
+                else:
+                    price = BASE_PRICES[gas_type] + rng.uniform(-1.5, 1.5)
+                prices_file.write(
+                    f'    <gas_price type="{gas_type}">{price:.2f}</gas_price>\n')
+
+            prices_file.write('  </place>\n')
+
+        prices_file.write('</places>\n')
+
+
+def write_datasets(places_path, prices_path, n_places, seed=0, store=None,
+                   missing_prices=0.1, bad_values=0.0):
+    """
+    Writes both dataset files for n_places places. When a BoundaryStore is
+    given the places are located inside its polygons, otherwise anywhere in
+    the bounding box of Mexico
+    """
+    point = BoundaryPoints(store, random.Random(seed)) if store else None
+
+    write_places(places_path, n_places, seed, point, bad_values)
+    write_prices(prices_path, n_places, seed + 1, missing_prices, bad_values)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Writes synthetic dataset files')
+    parser.add_argument('folder')
+    parser.add_argument('--places', type=int, default=12000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--shapefile', help='locate places inside these boundaries')
+    parser.add_argument('--missing-prices', type=float, default=0.1)
+    parser.add_argument('--bad-values', type=float, default=0.01)
+    args = parser.parse_args()
+
+    boundary_store = None
+    if args.shapefile:
+        source_files = [args.shapefile, f'{os.path.splitext(args.shapefile)[0]}.dbf']
+        boundary_store = BoundaryStore.load(source_files, f'{args.shapefile}.store.pickle')
+
+    os.makedirs(args.folder, exist_ok=True)
+    write_datasets(os.path.join(args.folder, 'places.xml'),
+                   os.path.join(args.folder, 'prices.xml'), args.places, args.seed,
+                   boundary_store, args.missing_prices, args.bad_values)
@@ -0,0 +1,436 @@
+"""
+This module comprises the tests of the ETL, run from this folder with
+python -m unittest tests. The dataset fixtures are small places.xml and
+prices.xml files in fixtures/ with one station per defect
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import geopandas as gpd
+import pandas as pd
+import sqlalchemy as db
+from shapely.geometry import box
+
+# main reads the connection string on import, the tests use their own engines
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import download
+import instrumentation
+import main
+from archive import write_snapshot
+from boundaries import BoundaryStore
+from main import STATION_COLS, prices_frame
+from delta import delta_load
+from loaders import bulk_load, metadata, price_frame
+from parsers import PARSERS, PLACE_COLS, PRICE_COLS
+from validation import in_bbox, validate
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+PLACES_PATH = os.path.join(FIXTURES, 'places.xml')
+PRICES_PATH = os.path.join(FIXTURES, 'prices.xml')
+
+
+def snapshot_frames(run_date, unique=True):
+    """
+    Returns the stations and prices DataFrames that transform() produces for
+    the fixture stations with coordinates, placed in one town. Unless unique,
+    the stations without cre_id or with a repeated one are kept too
+    """
+    stations_df = PARSERS['stream'](PLACES_PATH, PRICES_PATH) \
+        .dropna(subset=['longitude', 'latitude'])
+    if unique:
+        stations_df = stations_df.dropna(subset=['cre_id']).drop_duplicates('cre_id')
+    return (stations_df.assign(id=stations_df.index, city='Guadalajara',
+                               state='Jalisco')[STATION_COLS],
+            prices_frame(stations_df, run_date))
+
+
+class ParsersTestCase(unittest.TestCase):
+    """
+    Both extract parsers read the datasets into the same stations DataFrame
+    """
+
+    def test_parsers_are_equivalent(self):
+        """
+        The same XML gives identical frames, values, dtypes and order included
+        """
+        streaming = PARSERS['stream'](PLACES_PATH, PRICES_PATH)
+        xmltodict = PARSERS['xmltodict'](PLACES_PATH, PRICES_PATH)
+
+        pd.testing.assert_frame_equal(streaming, xmltodict)
+        self.assertEqual(list(streaming.columns), PLACE_COLS + PRICE_COLS)
+
+    def test_coordinates_are_floats(self):
+        """
+        Coordinates are parsed into floats, missing ones into NaN, so they can
+        be compared with the bounding box
+        """
+        for name, parser in PARSERS.items():
+            with self.subTest(parser=name):
+                stations_df = parser(PLACES_PATH, PRICES_PATH)
+                self.assertEqual(stations_df['longitude'].dtype, 'float64')
+                self.assertEqual(stations_df.loc[1, 'longitude'], -103.35)
+                self.assertTrue(pd.isna(stations_df.loc[3, 'latitude']))
+                self.assertEqual(
+                    in_bbox(stations_df['longitude'], stations_df['latitude']).tolist(),
+                    [True, True, False, True, False, True, False])
+
+    def test_prices(self):
+        """
+        The last price of a place and gas type wins, and empty cre_id are None
+        """
+        stations_df = PARSERS['stream'](PLACES_PATH, PRICES_PATH)
+
+        self.assertEqual(stations_df.loc[2, 'regular_price'], 20.2)
+        self.assertTrue(stations_df.loc[6, PRICE_COLS].isna().all())
+        self.assertIsNone(stations_df.loc[4, 'cre_id'])
+        self.assertTrue(pd.isna(stations_df.loc[7, 'name']))
+
+
+class ValidationTestCase(unittest.TestCase):
+    """
+    Every station that fails a rule is rejected with the rules it failed
+    """
+
+    def setUp(self):
+        self.stations_df = PARSERS['stream'](PLACES_PATH, PRICES_PATH)
+
+    def test_rules(self):
+        """
+        Each defective station of the fixtures fails its rule
+        """
+        valid_df, quarantine_df, counts = validate(self.stations_df)
+
+        self.assertEqual(valid_df.index.tolist(), [1])
+        self.assertEqual(quarantine_df['rules'].to_dict(), {
+            2: 'diesel_price_bounds',
+            3: 'missing_coordinates',
+            4: 'missing_cre_id',
+            5: 'swapped_coordinates',
+            6: 'missing_prices',
+            7: 'missing_cre_id,missing_coordinates',
+        })
+        self.assertEqual(counts['missing_cre_id'], 2)
+
+    def test_duplicates_among_valid_stations(self):
+        """
+        A duplicate cre_id only rejects a station when an earlier valid
+        station has it
+        """
+        stations_df = self.stations_df.copy()
+        stations_df.loc[5, ['longitude', 'latitude']] = [-99.13, 19.43]
+
+        valid_df, _, counts = validate(stations_df)
+        self.assertEqual(valid_df.index.tolist(), [1, 5])
+        self.assertEqual(counts['duplicate_cre_id'], 0)
+
+        stations_df.loc[2, 'diesel_price'] = 21.5
+        valid_df, quarantine_df, counts = validate(stations_df)
+        self.assertEqual(valid_df.index.tolist(), [1, 2])
+        self.assertEqual(quarantine_df.loc[5, 'rules'], 'duplicate_cre_id')
+        self.assertEqual(counts['duplicate_cre_id'], 1)
+
+
+class LoadersTestCase(unittest.TestCase):
+    """
+    The bulk and delta loads write the prices of the stations they upsert
+    """
+
+    def setUp(self):
+        self.stations_df, self.prices_df = snapshot_frames(datetime(2026, 10, 12, 9, 30),
+                                                           unique=False)
+
+        self.engine = db.create_engine('sqlite://')
+        metadata.create_all(self.engine)
+
+    def test_price_frame_drops_unmapped_prices(self):
+        """
+        Prices without register or whose register has no station are dropped
+        instead of failing the cast of the station ids
+        """
+        station_ids = {'PL/1/EXP/ES/2015': 10, 'PL/6/EXP/ES/2015': 60}
+        prices_df = price_frame(self.prices_df, station_ids)
+
+        self.assertEqual(prices_df['station_id'].dtype, 'int64')
+        self.assertEqual(sorted(prices_df['station_id']), [10, 10, 10])
+
+    def test_bulk_load(self):
+        """
+        A snapshot with stations without cre_id loads the prices of the others
+        """
+        with self.engine.begin() as connection:
+            bulk_load(connection, self.stations_df, self.prices_df)
+
+        with self.engine.connect() as connection:
+            registers = dict(connection.execute(
+                'SELECT s.register, COUNT(*) FROM gasoline_price p '
+                'JOIN gasoline_station s ON s.id = p.station_id GROUP BY s.register').fetchall())
+        self.assertEqual(registers, {'PL/1/EXP/ES/2015': 3, 'PL/2/EXP/ES/2015': 3})
+
+        # Current prices carry the location of their station
+        with self.engine.connect() as connection:
+            mismatches = connection.execute(
+                'SELECT COUNT(*) FROM gasoline_currentprice c JOIN gasoline_station s '
+                'ON s.id = c.station_id WHERE c.grid_cell IS NOT s.grid_cell '
+                'OR c.latitude IS NOT s.latitude OR c.state IS NOT s.state').scalar()
+        self.assertEqual(mismatches, 0)
+
+    def active_registers(self):
+        """
+        Returns the registers of the active stations in the database
+        """
+        with self.engine.connect() as connection:
+            return {register for register, in connection.execute(
+                'SELECT register FROM gasoline_station WHERE is_active')}
+
+    def test_delta_deactivates_only_with_complete_snapshots(self):
+        """
+        Stations missing from a capped snapshot stay active, those missing
+        from a complete one are deactivated
+        """
+        with self.engine.begin() as connection:
+            bulk_load(connection, self.stations_df, self.prices_df)
+        registers = self.active_registers()
+
+        capped_df = self.stations_df.loc[[1]]
+        capped_prices_df = self.prices_df[self.prices_df['register'] == 'PL/1/EXP/ES/2015']
+        with self.engine.begin() as connection, mock.patch('builtins.print'):
+            counts = delta_load(connection, capped_df, capped_prices_df, complete=False)
+        self.assertEqual(counts['removed'], 0)
+        self.assertEqual(self.active_registers(), registers)
+
+        with self.engine.begin() as connection, mock.patch('builtins.print'):
+            counts = delta_load(connection, capped_df, capped_prices_df)
+        self.assertEqual(counts['removed'], len(registers) - 1)
+        self.assertEqual(self.active_registers(), {'PL/1/EXP/ES/2015'})
+
+
+class ReplayTestCase(unittest.TestCase):
+    """
+    Replaying the archive loads the snapshots not recorded as loaded
+    """
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.archive_folder = os.path.join(folder.name, 'archive')
+        db_string = f'sqlite:///{os.path.join(folder.name, "etl.sqlite3")}'
+
+        self.engine = db.create_engine(db_string)
+        metadata.create_all(self.engine)
+
+        for name, value in (('ARCHIVE_FOLDER', self.archive_folder), ('DB_STRING', db_string)):
+            patcher = mock.patch.object(main, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        printer = mock.patch('builtins.print')
+        printer.start()
+        self.addCleanup(printer.stop)
+
+    def price_dates(self):
+        """
+        Returns the number of prices in the database by date
+        """
+        with self.engine.connect() as connection:
+            return dict(connection.execute(
+                'SELECT date, COUNT(*) FROM gasoline_price GROUP BY date').fetchall())
+
+    def test_skips_recorded_snapshots(self):
+        """
+        The snapshot of a loaded run is skipped even when a delta load wrote
+        none of its prices, and replaying twice loads each snapshot once
+        """
+        run_dates = [datetime(2026, 10, 12, 9, 30), datetime(2026, 10, 13, 9, 30),
+                     datetime(2026, 10, 14, 9, 30)]
+        for run_date in run_dates:
+            write_snapshot(self.archive_folder, *snapshot_frames(run_date), run_date)
+
+        main.load(*snapshot_frames(run_dates[0]), run_date=run_dates[0])
+        main.load(*snapshot_frames(run_dates[1]), delta=True, run_date=run_dates[1])
+        self.assertEqual(list(self.price_dates().values()), [5])
+
+        main.replay(datetime(2026, 10, 12), datetime(2026, 10, 14))
+        main.replay(datetime(2026, 10, 12), datetime(2026, 10, 14))
+        self.assertEqual(list(self.price_dates().values()), [5, 5])
+
+    def test_skips_runs_loaded_before_recording(self):
+        """
+        Without recorded snapshots, the runs whose prices are in the database
+        are skipped
+        """
+        run_date = datetime(2026, 10, 12, 9, 30)
+        write_snapshot(self.archive_folder, *snapshot_frames(run_date), run_date)
+        main.load(*snapshot_frames(run_date))
+
+        main.replay(datetime(2026, 10, 12), datetime(2026, 10, 12))
+        self.assertEqual(list(self.price_dates().values()), [5])
+
+
+class BoundaryStoreTestCase(unittest.TestCase):
+    """
+    The boundary store is rebuilt when any of its files is missing
+    """
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+
+        shapefile = os.path.join(folder.name, 'boundaries.shp')
+        gpd.GeoDataFrame({'NAME_1': ['Jalisco'], 'NAME_2': ['Guadalajara']},
+                         geometry=[box(-104, 20, -103, 21)]).to_file(shapefile)
+        self.source_files = [shapefile, os.path.join(folder.name, 'boundaries.dbf')]
+        self.store_path = os.path.join(folder.name, 'boundaries.pickle')
+
+    def test_missing_index_files(self):
+        """
+        Opening a store without its index fails instead of answering from an
+        empty index, and loading it rebuilds the index
+        """
+        with mock.patch('builtins.print'):
+            BoundaryStore.build(self.source_files, self.store_path).tree.close()
+
+        for suffix in ('.dat', '.idx'):
+            with self.subTest(suffix=suffix):
+                os.remove(f'{self.store_path}{suffix}')
+                with self.assertRaises(FileNotFoundError):
+                    BoundaryStore.open(self.store_path)
+
+                with mock.patch('builtins.print') as print_mock:
+                    store = BoundaryStore.load(self.source_files, self.store_path)
+                print_mock.assert_called_with('Building the boundary store...')
+                self.assertEqual(store.locate([-103.35], [20.67]), (['Jalisco'], ['Guadalajara']))
+                store.tree.close()
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    """
+    Stages measure their own memory apart from the peak of the process
+    """
+
+    @unittest.skipIf(instrumentation.rss_mb() is None, '/proc/self/statm is not available')
+    def test_rss_delta(self):
+        """
+        A stage that frees memory reports a negative change while the
+        process peak stays where an earlier stage left it
+        """
+        run_report = instrumentation.RunReport()
+
+        with run_report.stage('allocate'):
+            buffer = bytearray(64 * 1024 * 1024)
+            buffer[::4096] = b'\x01' * len(buffer[::4096])
+        with run_report.stage('free'):
+            del buffer
+
+        allocate, free = run_report.stages
+        self.assertGreater(allocate.rss_delta_mb, 48)
+        self.assertLess(free.rss_delta_mb, -48)
+        self.assertGreaterEqual(free.process_peak_rss_mb, allocate.process_peak_rss_mb)
+
+
+class DatasetHandler(BaseHTTPRequestHandler):
+    """
+    Serves the places fixture with an ETag, after failing the number of
+    requests given by the path: /fail/2 answers 503 twice. /missing is a 404
+    """
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        failures = int(self.path.split('/')[-1]) if self.path.startswith('/fail/') else 0
+
+        if self.path == '/missing':
+            self.send_response(404)
+        elif self.requests.count(self.path) <= failures:
+            self.send_response(503)
+        elif self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+        else:
+            with open(PLACES_PATH, mode='rb') as places_file:
+                body = places_file.read()
+            self.send_response(200)
+            self.send_header('ETag', self.etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadTestCase(unittest.TestCase):
+    """
+    Datasets are downloaded with conditional requests and transient failures
+    are retried, against a local HTTP server
+    """
+
+    def setUp(self):
+        DatasetHandler.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), DatasetHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.path = os.path.join(folder.name, 'places.xml')
+
+        backoff = mock.patch.object(download, 'BACKOFF_SECONDS', 0)
+        backoff.start()
+        self.addCleanup(backoff.stop)
+
+    def url(self, path):
+        """
+        Returns the URL of path on the local server
+        """
+        return f'http://127.0.0.1:{self.server.server_port}{path}'
+
+    def test_not_modified_once_committed(self):
+        """
+        The validators of a download are only sent once it is committed, so
+        a dataset whose load failed is downloaded again
+        """
+        self.assertTrue(download.fetch(self.url('/places'), self.path))
+        with open(self.path, mode='rb') as dataset, open(PLACES_PATH, mode='rb') as fixture:
+            self.assertEqual(dataset.read(), fixture.read())
+
+        self.assertTrue(download.fetch(self.url('/places'), self.path))
+        download.commit_validators([self.path])
+        self.assertFalse(download.fetch(self.url('/places'), self.path))
+        self.assertEqual(len(DatasetHandler.requests), 3)
+
+    def test_retries_server_errors(self):
+        """
+        5xx answers are retried until the download succeeds, or fail once
+        every retry is used
+        """
+        with mock.patch('builtins.print'):
+            self.assertTrue(download.fetch(self.url('/fail/2'), self.path))
+            self.assertEqual(DatasetHandler.requests, ['/fail/2'] * 3)
+
+            with self.assertRaises(download.DownloadError):
+                download.fetch(self.url(f'/fail/{download.MAX_RETRIES + 1}'), self.path)
+
+    def test_client_errors_are_not_retried(self):
+        """
+        A 4xx answer fails the download after a single request
+        """
+        with self.assertRaises(download.DownloadError):
+            download.fetch(self.url('/missing'), self.path)
+        self.assertEqual(DatasetHandler.requests, ['/missing'])
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+This module comprises the validation rules applied to the raw stations before
+they are geocoded. Every rule is a vectorized mask over the whole DataFrame, so
+the cost of cleaning stays a single O(n) pass as rules are added
+"""
+
+import os
+import pandas as pd
+from collections import namedtuple
+
+
+# Exclusive bounds of a valid price for each gas type
+PRICE_BOUNDS = {
+    'regular': (1, 40),
+    'premium': (1, 40),
+    'diesel': (1, 40),
+}
+# Bounding box of Mexico as (min_longitude, min_latitude, max_longitude, max_latitude)
+MEXICO_BBOX = (-118.5, 14.5, -86.5, 32.8)
+
+Rule = namedtuple('Rule', ['name', 'violations'])
+
+
+def in_bbox(longitudes, latitudes):
+    """
+    Returns a mask of the coordinates that fall inside MEXICO_BBOX
+    """
+    min_lon, min_lat, max_lon, max_lat = MEXICO_BBOX
+    return longitudes.between(min_lon, max_lon) & latitudes.between(min_lat, max_lat)
+
+
+def price_rule(gas_type, bounds):
+    """
+    Builds the rule rejecting prices of gas_type outside the exclusive bounds
+    """
+    low, high = bounds
+    column = f'{gas_type}_price'
+    return Rule(f'{gas_type}_price_bounds',
+                lambda df: df[column].notna() & ((df[column] <= low) | (df[column] >= high)))
+
+
+RULES = [
+    Rule('missing_cre_id', lambda df: df['cre_id'].fillna('').astype(str).str.strip() == ''),
+    Rule('missing_coordinates', lambda df: df['latitude'].isna() | df['longitude'].isna()),
+    Rule('missing_prices', lambda df: df[[f'{gas_type}_price' for gas_type in PRICE_BOUNDS]]
+         .isna().all(axis=1)),
+    *[price_rule(gas_type, bounds) for gas_type, bounds in PRICE_BOUNDS.items()],
+    Rule('swapped_coordinates', lambda df: ~in_bbox(df['longitude'], df['latitude']) &
+         in_bbox(df['latitude'], df['longitude'])),
+    Rule('outside_mexico', lambda df: df['latitude'].notna() & df['longitude'].notna() &
+         ~in_bbox(df['longitude'], df['latitude']) & ~in_bbox(df['latitude'], df['longitude'])),
+]
+
+# Rules evaluated only over the stations that pass every rule in RULES, so a
+# rejected station never shadows a valid one with the same cre_id
+UNIQUE_RULES = [
+    Rule('duplicate_cre_id', lambda df: df['cre_id'].duplicated(keep='first')),
+]
+
+
+def validate(stations_df, rules=RULES, unique_rules=UNIQUE_RULES):
+    """
+    Evaluates every rule over stations_df in one pass, then the unique rules
+    over the stations that passed them
+
+    Returns a tuple with the DataFrame of valid stations, the DataFrame of
+    rejected stations with the comma separated names of the rules they failed
+    in a 'rules' column, and a dictionary with the number of violations per rule
+    """
+    masks_df = pd.DataFrame({rule.name: rule.violations(stations_df).fillna(False).astype(bool)
+                             for rule in rules}, index=stations_df.index)
+    passed = ~masks_df.any(axis=1)
+
+    for rule in unique_rules:
+        masks_df[rule.name] = rule.violations(stations_df[passed]) \
+            .reindex(stations_df.index, fill_value=False).fillna(False).astype(bool)
+    rejected = masks_df.any(axis=1)
+
+    quarantine_df = stations_df[rejected].copy()
+    quarantine_df['rules'] = masks_df[rejected].dot(masks_df.columns + ',').str.rstrip(',')
+
+    return stations_df[~rejected], quarantine_df, masks_df.sum().astype(int).to_dict()
+
+
+def write_quarantine(quarantine_df, counts, folder, run_date):
+    """
+    Writes the rejected stations of a run to a CSV file in folder and prints
+    the number of violations of each rule
+
+    Returns the path of the file written, or None if nothing was rejected
+    """
+    print(f'Validation: {len(quarantine_df)} stations rejected')
+    for name, count in counts.items():
+        if count:
+            print(f'  {name}: {count}')
+
+    if quarantine_df.empty:
+        return None
+
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'quarantine_{run_date:%Y%m%d_%H%M%S}.csv')
+    quarantine_df.to_csv(path, index_label='place_id')
+    return path
@@ -4,7 +4,7 @@
 from django.contrib import admin
 
 # Models
-from gasoline.models import Station, Price
+from gasoline.models import Station, Price, CurrentPrice
 
 @admin.register(Station)
 class StationAdmin(admin.ModelAdmin):
@@ -46,3 +46,24 @@ class PriceAdmin(admin.ModelAdmin):
         'gas_type',
         'date',
     )
+
+
+@admin.register(CurrentPrice)
+class CurrentPriceAdmin(admin.ModelAdmin):
+    """Current price model admin"""
+
+    list_display = (
+        'id',
+        'station',
+        'gas_type',
+        'price',
+        'date',
+        'town',
+        'state',
+    )
+
+    list_filter = (
+        'gas_type',
+        'state',
+        'date',
+    )
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class GasolineConfig(AppConfig):
     name = 'gasoline'
+
+    def ready(self):
+        """ Connect the signals of the app"""
+        from gasoline import signals  # noqa: F401
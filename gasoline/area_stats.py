@@ -0,0 +1,56 @@
+""" Area price statistics helpers for gasoline app """
+
+# Python
+from collections import defaultdict
+from math import floor
+
+# Levels of AreaPriceStats
+STATE = 'state'
+TOWN = 'town'
+
+# Percentiles of AreaPriceStats, interpolated linearly as pandas does
+PERCENTILES = {
+    'p25_price': 0.25,
+    'median_price': 0.5,
+    'p75_price': 0.75,
+    'p90_price': 0.9,
+}
+
+
+def percentile(prices, q):
+    """ Return the q quantile of sorted prices, interpolated linearly"""
+    position = (len(prices) - 1) * q
+    lower = floor(position)
+    upper = min(lower + 1, len(prices) - 1)
+    return prices[lower] + (prices[upper] - prices[lower]) * (position - lower)
+
+
+def area_stats(current_prices):
+    """ Return the AreaPriceStats fields of every area of current_prices, an
+    iterable of (gas_type, price, date, state, town), keyed by
+    (level, gas_type, state, town)
+
+    Prices without state are left out, and so are the towns without name.
+    """
+    areas = defaultdict(list)
+    for gas_type, price, date, state, town in current_prices:
+        if not state:
+            continue
+        areas[(STATE, gas_type, state, '')].append((price, date))
+        if town:
+            areas[(TOWN, gas_type, state, town)].append((price, date))
+
+    stats = {}
+    for key, values in areas.items():
+        prices = sorted(price for price, _ in values)
+        dates = [date for _, date in values]
+        stats[key] = {
+            'station_count': len(prices),
+            'avg_price': sum(prices) / len(prices),
+            'min_price': prices[0],
+            'max_price': prices[-1],
+            'oldest_price_date': min(dates),
+            'latest_price_date': max(dates),
+            **{field: percentile(prices, q) for field, q in PERCENTILES.items()},
+        }
+    return stats
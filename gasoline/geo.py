@@ -0,0 +1,50 @@
+""" Geographic helpers for gasoline app """
+
+# Python
+from math import asin, cos, floor, radians, sin, sqrt
+
+# Size in degrees of the square cells of Station.grid_cell
+GRID_DEGREES = 0.05
+GRID_COLUMNS = int(360 / GRID_DEGREES)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.195
+
+
+def grid_cell(latitude, longitude):
+    """ Return the grid cell that contains a coordinate"""
+    row = floor((latitude + 90) / GRID_DEGREES)
+    column = floor((longitude + 180) / GRID_DEGREES)
+    return row * GRID_COLUMNS + column
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """ Return the (min_lat, min_lon, max_lat, max_lon) box around a
+    coordinate that contains the circle of radius_km"""
+    delta_lat = radius_km / KM_PER_DEGREE
+    delta_lon = radius_km / (KM_PER_DEGREE * max(cos(radians(latitude)), 0.01))
+    return (latitude - delta_lat, longitude - delta_lon,
+            latitude + delta_lat, longitude + delta_lon)
+
+
+def cells_within(latitude, longitude, radius_km):
+    """ Return the grid cells that intersect the circle of radius_km"""
+    return cells_in_box(*bounding_box(latitude, longitude, radius_km))
+
+
+def cells_in_box(min_lat, min_lon, max_lat, max_lon):
+    """ Return the grid cells that intersect a box"""
+    first, last = grid_cell(min_lat, min_lon), grid_cell(max_lat, max_lon)
+    first_row, first_column = divmod(first, GRID_COLUMNS)
+    last_row, last_column = divmod(last, GRID_COLUMNS)
+
+    return [row * GRID_COLUMNS + column
+            for row in range(first_row, last_row + 1)
+            for column in range(first_column, last_column + 1)]
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """ Return the great circle distance between two coordinates in km"""
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
@@ -0,0 +1,159 @@
+""" Benchmark of the gasoline queries """
+
+# Python
+import random
+import statistics
+from timeit import default_timer as timer
+
+# Django
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+
+# Models
+from gasoline.models import CurrentPrice, Station
+
+# Geo
+from gasoline.geo import grid_cell, haversine_km
+
+# Schema
+from oilApp.schema import schema
+
+# Centers the synthetic stations are spread around, as (latitude, longitude)
+CITIES = [
+    (19.43, -99.13), (20.67, -103.35), (25.69, -100.32), (19.04, -98.21), (32.51, -117.04),
+    (21.12, -101.68), (31.69, -106.42), (20.97, -89.62), (21.88, -102.29), (22.15, -100.98),
+    (25.54, -103.41), (29.07, -110.96), (19.70, -101.19), (16.85, -99.82), (17.06, -96.73),
+    (21.16, -86.85), (24.80, -107.39), (20.59, -100.39), (18.92, -99.23), (16.75, -93.12),
+]
+GAS_TYPES = ['regular', 'premium', 'diesel']
+BASE_PRICES = {'regular': 20.5, 'premium': 22.3, 'diesel': 21.9}
+
+CHEAPEST_QUERY = '''
+query ($gasType: String!, $town: String) {
+    cheapestStations(gasType: $gasType, town: $town, first: 10) {
+        price
+        station { name latitude longitude }
+    }
+}
+'''
+
+NEAR_QUERY = '''
+query ($lat: Float!, $lon: Float!) {
+    stationsNear(lat: $lat, lon: $lon, radiusKm: 5, first: 20) {
+        distanceKm
+        station { name currentPrices { gasType price } }
+    }
+}
+'''
+
+
+def seed(n_stations, rng):
+    """ Create n_stations active stations around CITIES with their current prices"""
+    stations = []
+    for i in range(n_stations):
+        city = rng.randrange(len(CITIES))
+        latitude, longitude = CITIES[city]
+        latitude, longitude = rng.gauss(latitude, 0.15), rng.gauss(longitude, 0.15)
+        stations.append(Station(name=f'ESTACION {i}', register=f'PL/{i}/EXP/ES/2015',
+                                latitude=latitude, longitude=longitude, is_active=True,
+                                town=town_name(city), state=f'ESTADO {city % 5}',
+                                grid_cell=grid_cell(latitude, longitude)))
+    Station.objects.bulk_create(stations, batch_size=5000)
+
+    CurrentPrice.objects.bulk_create([
+        CurrentPrice(station_id=pk, gas_type=gas_type, town=town, state=state,
+                     price=round(BASE_PRICES[gas_type] + rng.uniform(-1.5, 1.5), 2),
+                     date='2020-11-01T12:00:00Z')
+        for pk, town, state in Station.objects.values_list('id', 'town', 'state')
+        for gas_type in GAS_TYPES
+    ], batch_size=5000)
+
+
+def town_name(city):
+    """ Return the town of the synthetic stations around CITIES[city]"""
+    return f'CIUDAD {city}'
+
+
+def near_point(rng):
+    """ Return a random location close to one of CITIES"""
+    latitude, longitude = rng.choice(CITIES)
+    return rng.gauss(latitude, 0.1), rng.gauss(longitude, 0.1)
+
+
+def bench_near(rng, runs):
+    """ Time stationsNear against a scan of every station"""
+    def indexed():
+        lat, lon = near_point(rng)
+        result = schema.execute(NEAR_QUERY, variables={'lat': lat, 'lon': lon},
+                                context_value=RequestFactory().post('/graphql'))
+        assert result.errors is None, result.errors
+
+    def scan():
+        lat, lon = near_point(rng)
+        sorted((haversine_km(lat, lon, latitude, longitude), pk) for pk, latitude, longitude
+               in Station.objects.values_list('id', 'latitude', 'longitude'))[:20]
+
+    return {'stationsNear': timings(indexed, runs), 'full scan': timings(scan, runs)}
+
+
+def bench_cheapest(rng, runs):
+    """ Time cheapestStations against joining the stations of the town and
+    sorting their prices"""
+    def variables():
+        return {'gasType': rng.choice(GAS_TYPES), 'town': town_name(rng.randrange(len(CITIES)))}
+
+    def ranked():
+        result = schema.execute(CHEAPEST_QUERY, variables=variables(),
+                                context_value=RequestFactory().post('/graphql'))
+        assert result.errors is None, result.errors
+
+    def join():
+        area = variables()
+        list(CurrentPrice.objects.filter(gas_type=area['gasType'], station__town=area['town'])
+             .select_related('station').order_by('price', 'id')[:10])
+
+    return {'cheapestStations': timings(ranked, runs), 'join and sort': timings(join, runs)}
+
+
+BENCHMARKS = {
+    'cheapest': bench_cheapest,
+    'near': bench_near,
+}
+
+
+def timings(function, runs):
+    """ Return the median and 95th percentile of the wall time of function in ms"""
+    samples = []
+    for _ in range(runs):
+        start = timer()
+        function()
+        samples.append((timer() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(0.95 * (len(samples) - 1))]
+
+
+class Command(BaseCommand):
+    """ Times GraphQL queries of the gasoline app on synthetic data"""
+    help = 'Times GraphQL queries of the gasoline app on synthetic data in a test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+        parser.add_argument('--stations', type=int, default=100000)
+        parser.add_argument('--runs', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        try:
+            start = timer()
+            seed(options['stations'], rng)
+            self.stdout.write(f'Seeded {options["stations"]} stations in {timer() - start:.1f}s')
+
+            results = BENCHMARKS[options['benchmark']](rng, options['runs'])
+            for name, (median, p95) in results.items():
+                self.stdout.write(f'{name:<24} p50 {median:8.2f} ms   p95 {p95:8.2f} ms')
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,26 @@
+""" Statistics of the GraphQL response cache """
+
+# Django
+from django.conf import settings
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+# Views
+from oilApp.views import cache_stats, get_cache
+
+
+class Command(BaseCommand):
+    """ Prints the hit ratio of the GraphQL response cache"""
+    help = 'Prints the hits, misses and hit ratio of the GraphQL response cache'
+
+    def handle(self, *args, **options):
+        # The counters of a process-local cache live in the serving processes,
+        # this process would only ever read zeros
+        if isinstance(get_cache(), (DummyCache, LocMemCache)):
+            raise CommandError(f'The {settings.GRAPHQL_CACHE_ALIAS} cache is local to each '
+                               'process, set CACHE_URL to a shared cache to read its statistics')
+
+        stats = cache_stats()
+        ratio = 'n/a' if stats['hit_ratio'] is None else f'{stats["hit_ratio"]:.1%}'
+        self.stdout.write(f'{stats["hits"]} hits, {stats["misses"]} misses, hit ratio {ratio}')
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gasoline', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='price',
+            index=models.Index(fields=['date', 'id'], name='price_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Seeds the current prices from the latest price of each station and gas type
+# by date, the last written on ties, as the signals and the ETL pick them
+BACKFILL_CURRENT_PRICES = """
+INSERT INTO gasoline_currentprice (station_id, gas_type, price, date)
+SELECT p.station_id, p.gas_type, p.price, p.date
+FROM gasoline_price p
+WHERE p.id = (
+    SELECT latest.id FROM gasoline_price latest
+    WHERE latest.station_id = p.station_id AND latest.gas_type = p.gas_type
+    ORDER BY latest.date DESC, latest.id DESC
+    LIMIT 1
+)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gasoline', '0002_price_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrentPrice',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gas_type', models.CharField(choices=[('premium', 'premium'), ('regular', 'regular'), ('diesel', 'diesel')], help_text='Type of gasoline between the GAS_CHOICES', max_length=20)),
+                ('price', models.FloatField(max_length=5)),
+                ('date', models.DateTimeField(help_text='Date Time on wich the price was registred')),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='current_prices', to='gasoline.station')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='currentprice',
+            constraint=models.UniqueConstraint(fields=('station', 'gas_type'), name='current_price_station_gas_type'),
+        ),
+        migrations.RunSQL(BACKFILL_CURRENT_PRICES, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:14
+
+from math import floor
+
+from django.db import migrations, models
+
+# Frozen copy of the grid of gasoline/geo.py at this migration, so later
+# changes to the app do not change what the backfill computes
+GRID_DEGREES = 0.05
+GRID_COLUMNS = int(360 / GRID_DEGREES)
+
+
+def grid_cell(latitude, longitude):
+    """ Return the grid cell that contains a coordinate"""
+    row = floor((latitude + 90) / GRID_DEGREES)
+    column = floor((longitude + 180) / GRID_DEGREES)
+    return row * GRID_COLUMNS + column
+
+
+def fill_grid_cells(apps, schema_editor):
+    """ Place the existing stations in their grid cell"""
+    Station = apps.get_model('gasoline', 'Station')
+    stations = list(Station.objects.only('id', 'latitude', 'longitude'))
+    for station in stations:
+        station.grid_cell = grid_cell(station.latitude, station.longitude)
+    Station.objects.bulk_update(stations, ['grid_cell'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gasoline', '0003_currentprice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='station',
+            name='grid_cell',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, help_text='Cell of the location in the grid of gasoline.geo, used to find near stations', null=True),
+        ),
+        migrations.RunPython(fill_grid_cells, migrations.RunPython.noop),
+    ]
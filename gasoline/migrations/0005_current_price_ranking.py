@@ -0,0 +1,43 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+# Copies the area of each station to its current prices
+BACKFILL_AREAS = """
+UPDATE gasoline_currentprice SET
+state = (SELECT s.state FROM gasoline_station s WHERE s.id = gasoline_currentprice.station_id),
+town = (SELECT s.town FROM gasoline_station s WHERE s.id = gasoline_currentprice.station_id)
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gasoline', '0004_station_grid_cell'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='currentprice',
+            name='state',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='currentprice',
+            name='town',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='currentprice',
+            index=models.Index(fields=['gas_type', 'price'], name='current_price_ranking'),
+        ),
+        migrations.AddIndex(
+            model_name='currentprice',
+            index=models.Index(fields=['gas_type', 'state', 'price'], name='current_price_state_ranking'),
+        ),
+        migrations.AddIndex(
+            model_name='currentprice',
+            index=models.Index(fields=['gas_type', 'town', 'price'], name='current_price_town_ranking'),
+        ),
+        migrations.RunSQL(BACKFILL_AREAS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:23
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def create_data_version(apps, schema_editor):
+    """ Create the single row the ETL bumps"""
+    DataVersion = apps.get_model('gasoline', 'DataVersion')
+    DataVersion.objects.using(schema_editor.connection.alias).create(id=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gasoline', '0005_current_price_ranking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(create_data_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:30
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+from unidecode import unidecode
+
+# Frozen copy of the search text of gasoline/search.py at this migration, so
+# later changes to the app do not change what the backfill computes
+SEARCH_FIELDS = ['name', 'town', 'state']
+
+
+def search_text(station):
+    """ Return the name, town and state of station transliterated to ASCII,
+    lowercase and with single spaces"""
+    text = ' '.join(getattr(station, field) or '' for field in SEARCH_FIELDS)
+    return ' '.join(unidecode(text).lower().split())
+
+
+def fill_search_texts(apps, schema_editor):
+    """ Normalize the search text of the existing stations"""
+    Station = apps.get_model('gasoline', 'Station')
+    stations = list(Station.objects.only('id', 'name', 'town', 'state'))
+    for station in stations:
+        station.search_text = search_text(station)
+    Station.objects.bulk_update(stations, ['search_text'], batch_size=1000)
+
+
+def create_trigram_index(apps, schema_editor):
+    """ Index the search text by trigrams on PostgreSQL, other databases
+    search it with LIKE"""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE INDEX station_search_text_trgm ON gasoline_station '
+                              'USING gin (search_text gin_trgm_ops)')
+
+
+def drop_trigram_index(apps, schema_editor):
+    """ Drop the trigram index of the search text"""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS station_search_text_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gasoline', '0006_dataversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='station',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Name, town and state without accents nor case, indexed for searchStations'),
+        ),
+        migrations.RunPython(fill_search_texts, migrations.RunPython.noop),
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
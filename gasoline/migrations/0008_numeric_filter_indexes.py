@@ -0,0 +1,25 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gasoline', '0007_station_search_text'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='price',
+            index=models.Index(fields=['gas_type', 'price'], name='price_gas_type_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='price',
+            index=models.Index(fields=['station', 'gas_type', 'date'], name='price_station_gas_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='station',
+            index=models.Index(fields=['latitude', 'longitude'], name='station_lat_lon_idx'),
+        ),
+    ]
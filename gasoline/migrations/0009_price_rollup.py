@@ -0,0 +1,87 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:34
+
+from datetime import timedelta, timezone
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Frozen copy of the buckets of gasoline/rollups.py at this migration, so
+# later changes to the app do not change what the backfill computes
+BUCKETS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+}
+
+
+def bucket_start(date, bucket):
+    """ Return the start in UTC of the bucket that contains date"""
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc)
+    start = date.replace(minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
+
+    if bucket != 'hour':
+        start = start.replace(hour=0)
+    if bucket == 'week':
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def fill_price_rollups(apps, schema_editor):
+    """ Roll up the existing prices"""
+    Price = apps.get_model('gasoline', 'Price')
+    PriceRollup = apps.get_model('gasoline', 'PriceRollup')
+    alias = schema_editor.connection.alias
+
+    rollups = {}
+    prices = Price.objects.using(alias).order_by('date', 'id') \
+        .values_list('station_id', 'gas_type', 'price', 'date').iterator()
+    for station_id, gas_type, price, date in prices:
+        for bucket in BUCKETS:
+            key = (station_id, gas_type, bucket, bucket_start(date, bucket))
+            stats = rollups.get(key)
+            if stats is None:
+                rollups[key] = {'min_price': price, 'max_price': price, 'price_sum': price,
+                                'price_count': 1, 'last_price': price, 'last_date': date}
+                continue
+            stats['min_price'] = min(stats['min_price'], price)
+            stats['max_price'] = max(stats['max_price'], price)
+            stats['price_sum'] += price
+            stats['price_count'] += 1
+            stats['last_price'], stats['last_date'] = price, date
+
+    PriceRollup.objects.using(alias).bulk_create([
+        PriceRollup(station_id=station_id, gas_type=gas_type, bucket=bucket, start=start, **stats)
+        for (station_id, gas_type, bucket, start), stats in rollups.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gasoline', '0008_numeric_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gas_type', models.CharField(choices=[('premium', 'premium'), ('regular', 'regular'), ('diesel', 'diesel')], help_text='Type of gasoline between the GAS_CHOICES', max_length=20)),
+                ('bucket', models.CharField(choices=[('hour', 'hour'), ('day', 'day'), ('week', 'week')], max_length=4)),
+                ('start', models.DateTimeField(help_text='Start of the bucket in UTC, weeks start on monday')),
+                ('min_price', models.FloatField()),
+                ('max_price', models.FloatField()),
+                ('price_sum', models.FloatField()),
+                ('price_count', models.PositiveIntegerField()),
+                ('last_price', models.FloatField()),
+                ('last_date', models.DateTimeField()),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_rollups', to='gasoline.station')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='pricerollup',
+            constraint=models.UniqueConstraint(fields=('station', 'gas_type', 'bucket', 'start'), name='price_rollup_bucket'),
+        ),
+        migrations.RunPython(fill_price_rollups, migrations.RunPython.noop),
+    ]
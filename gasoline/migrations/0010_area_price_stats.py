@@ -0,0 +1,98 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:39
+
+from collections import defaultdict
+from math import floor
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# Frozen copy of the percentiles of gasoline/area_stats.py at this
+# migration, so later changes to the app do not change what the backfill
+# computes
+PERCENTILES = {
+    'p25_price': 0.25,
+    'median_price': 0.5,
+    'p75_price': 0.75,
+    'p90_price': 0.9,
+}
+
+
+def percentile(prices, q):
+    """ Return the q quantile of sorted prices, interpolated linearly"""
+    position = (len(prices) - 1) * q
+    lower = floor(position)
+    upper = min(lower + 1, len(prices) - 1)
+    return prices[lower] + (prices[upper] - prices[lower]) * (position - lower)
+
+
+def fill_area_price_stats(apps, schema_editor):
+    """ Compute the statistics of the current prices"""
+    CurrentPrice = apps.get_model('gasoline', 'CurrentPrice')
+    AreaPriceStats = apps.get_model('gasoline', 'AreaPriceStats')
+    alias = schema_editor.connection.alias
+
+    areas = defaultdict(list)
+    current = CurrentPrice.objects.using(alias).filter(station__is_active=True) \
+        .values_list('gas_type', 'price', 'date', 'station__state', 'station__town')
+    for gas_type, price, date, state, town in current.iterator():
+        if not state:
+            continue
+        areas[('state', gas_type, state, '')].append((price, date))
+        if town:
+            areas[('town', gas_type, state, town)].append((price, date))
+
+    refreshed = timezone.now()
+    rows = []
+    for (level, gas_type, state, town), values in areas.items():
+        prices = sorted(price for price, _ in values)
+        dates = [date for _, date in values]
+        rows.append(AreaPriceStats(
+            level=level, gas_type=gas_type, state=state, town=town, refreshed=refreshed,
+            station_count=len(prices),
+            avg_price=sum(prices) / len(prices),
+            min_price=prices[0],
+            max_price=prices[-1],
+            oldest_price_date=min(dates),
+            latest_price_date=max(dates),
+            **{field: percentile(prices, q) for field, q in PERCENTILES.items()},
+        ))
+    AreaPriceStats.objects.using(alias).bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gasoline', '0009_price_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AreaPriceStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('state', 'state'), ('town', 'town')], max_length=5)),
+                ('gas_type', models.CharField(choices=[('premium', 'premium'), ('regular', 'regular'), ('diesel', 'diesel')], help_text='Type of gasoline between the GAS_CHOICES', max_length=20)),
+                ('state', models.CharField(max_length=50)),
+                ('town', models.CharField(blank=True, default='', help_text='Empty for the statistics of a state', max_length=50)),
+                ('station_count', models.PositiveIntegerField()),
+                ('avg_price', models.FloatField()),
+                ('min_price', models.FloatField()),
+                ('max_price', models.FloatField()),
+                ('p25_price', models.FloatField()),
+                ('median_price', models.FloatField()),
+                ('p75_price', models.FloatField()),
+                ('p90_price', models.FloatField()),
+                ('oldest_price_date', models.DateTimeField()),
+                ('latest_price_date', models.DateTimeField()),
+                ('refreshed', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'area price stats',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='areapricestats',
+            constraint=models.UniqueConstraint(fields=('level', 'gas_type', 'state', 'town'), name='area_price_stats_area'),
+        ),
+        migrations.RunPython(fill_area_price_stats, migrations.RunPython.noop),
+    ]
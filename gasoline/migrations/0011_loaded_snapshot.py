@@ -0,0 +1,22 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:59
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gasoline', '0010_area_price_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoadedSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot', models.CharField(help_text='Stamp of the run that produced the snapshot, as in its archive files', max_length=32, unique=True)),
+                ('loaded', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.1.2 on 2026-10-18 19:02
+
+from django.db import migrations, models
+
+
+# Copies the location of each station to its current prices
+BACKFILL_LOCATIONS = """
+UPDATE gasoline_currentprice SET
+latitude = (SELECT s.latitude FROM gasoline_station s WHERE s.id = gasoline_currentprice.station_id),
+longitude = (SELECT s.longitude FROM gasoline_station s WHERE s.id = gasoline_currentprice.station_id),
+grid_cell = (SELECT s.grid_cell FROM gasoline_station s WHERE s.id = gasoline_currentprice.station_id)
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gasoline', '0011_loaded_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='currentprice',
+            name='grid_cell',
+            field=models.IntegerField(help_text='Cell of the location of the station in the grid of gasoline.geo', null=True),
+        ),
+        migrations.AddField(
+            model_name='currentprice',
+            name='latitude',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='currentprice',
+            name='longitude',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='currentprice',
+            index=models.Index(fields=['gas_type', 'grid_cell', 'price'], name='current_price_cell_ranking'),
+        ),
+        migrations.RunSQL(BACKFILL_LOCATIONS, migrations.RunSQL.noop),
+    ]
@@ -1,2 +1,7 @@
 from .price import *
-from .station import *
\ No newline at end of file
+from .station import *
+from .current_price import *
+from .data_version import *
+from .price_rollup import *
+from .area_price_stats import *
+from .loaded_snapshot import *
\ No newline at end of file
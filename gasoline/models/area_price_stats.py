@@ -0,0 +1,70 @@
+"""Area price stats model """
+
+# Django
+from django.db import models
+
+# Models
+from gasoline.models.price import Price
+
+class AreaPriceStats(models.Model):
+    """ Area Price Stats Model
+
+    Summary of the current prices of one type of gasoline in a state or a
+    town, recomputed by the ETL at the end of each load and by the signals
+    of Price and Station, so the statistics of an area are read from one
+    row instead of aggregating its prices.
+    """
+    STATE = 'state'
+    TOWN = 'town'
+    LEVEL_CHOICES = [
+        (STATE, 'state'),
+        (TOWN, 'town'),
+    ]
+
+    level = models.CharField(
+        max_length=5,
+        choices=LEVEL_CHOICES,
+        )
+    gas_type = models.CharField(
+        max_length=20,
+        choices=Price.GAS_CHOICES,
+        help_text='Type of gasoline between the GAS_CHOICES',
+        )
+    state = models.CharField(
+        max_length=50,
+        )
+    town = models.CharField(
+        max_length=50,
+        blank=True,
+        default='',
+        help_text='Empty for the statistics of a state',
+        )
+
+    # Statistics of the current prices of the active stations of the area
+    station_count = models.PositiveIntegerField()
+    avg_price = models.FloatField()
+    min_price = models.FloatField()
+    max_price = models.FloatField()
+    p25_price = models.FloatField()
+    median_price = models.FloatField()
+    p75_price = models.FloatField()
+    p90_price = models.FloatField()
+
+    # Freshness of the prices and of the statistics
+    oldest_price_date = models.DateTimeField()
+    latest_price_date = models.DateTimeField()
+    refreshed = models.DateTimeField()
+
+    class Meta:
+        """ Class Meta"""
+        verbose_name_plural = 'area price stats'
+        constraints = [
+            # Also the index the statistics of a level are read by
+            models.UniqueConstraint(fields=['level', 'gas_type', 'state', 'town'],
+                                    name='area_price_stats_area'),
+        ]
+
+    def __str__(self):
+        """ Returns area and gas type."""
+        area = f'{self.town}, {self.state}' if self.town else self.state
+        return f'{self.gas_type} en {area}'
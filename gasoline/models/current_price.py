@@ -0,0 +1,78 @@
+"""Current price model """
+
+# Django
+from django.db import models
+
+# Models
+from gasoline.models.price import Price
+from gasoline.models.station import Station
+
+class CurrentPrice(models.Model):
+    """ Current Price Model
+
+    Latest price of one type of gasoline by station. It holds one row per
+    station and gas type, kept up to date by the ETL load and by the
+    post_save signal of Price, so reading it does not depend on the size
+    of the price history. The town, state, coordinates and grid cell of
+    the station are copied so the cheapest prices of an area are read from
+    an index.
+    """
+    station = models.ForeignKey(
+        Station,
+        on_delete=models.CASCADE,
+        related_name='current_prices',
+        )
+    gas_type = models.CharField(
+        max_length=20,
+        choices=Price.GAS_CHOICES,
+        help_text='Type of gasoline between the GAS_CHOICES',
+        )
+    price = models.FloatField(
+        max_length=5,
+        )
+    date = models.DateTimeField(
+        help_text='Date Time on wich the price was registred'
+        )
+
+    # Area of the station, copied to rank the prices of an area by index
+    town = models.CharField(
+        max_length=50,
+        blank=True,
+        null=True,
+        )
+    state = models.CharField(
+        max_length=50,
+        blank=True,
+        null=True,
+        )
+    latitude = models.FloatField(
+        null=True,
+        )
+    longitude = models.FloatField(
+        null=True,
+        )
+    grid_cell = models.IntegerField(
+        null=True,
+        help_text='Cell of the location of the station in the grid of gasoline.geo',
+        )
+
+    class Meta:
+        """ Class Meta"""
+        constraints = [
+            models.UniqueConstraint(fields=['station', 'gas_type'],
+                                    name='current_price_station_gas_type'),
+        ]
+        indexes = [
+            # Rankings of cheapestStations, read in price order
+            models.Index(fields=['gas_type', 'price'], name='current_price_ranking'),
+            models.Index(fields=['gas_type', 'state', 'price'],
+                         name='current_price_state_ranking'),
+            models.Index(fields=['gas_type', 'town', 'price'],
+                         name='current_price_town_ranking'),
+            models.Index(fields=['gas_type', 'grid_cell', 'price'],
+                         name='current_price_cell_ranking'),
+        ]
+
+    def __str__(self):
+        """ Returns current price."""
+        return f'{self.gas_type} cuesta {self.price} en {self.station}'
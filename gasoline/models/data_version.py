@@ -0,0 +1,37 @@
+"""Data version model """
+
+# Django
+from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+
+class DataVersion(models.Model):
+    """ Data Version Model
+
+    Single row counter of the changes to the data served by the API. The ETL
+    bumps it with every load and the model signals with every write, so
+    responses cached under one version are never served after a change.
+    """
+    version = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(default=timezone.now)
+
+    SINGLETON_ID = 1
+
+    @classmethod
+    def current(cls):
+        """ Return the current version"""
+        version = cls.objects.filter(pk=cls.SINGLETON_ID).values_list('version', flat=True)
+        return version.first() or 0
+
+    @classmethod
+    def bump(cls):
+        """ Increase the version, creating its row when missing"""
+        updated = cls.objects.filter(pk=cls.SINGLETON_ID).update(
+            version=F('version') + 1, updated=timezone.now())
+        if not updated:
+            cls.objects.get_or_create(pk=cls.SINGLETON_ID, defaults={'version': 1})
+
+    def __str__(self):
+        """Return version number"""
+        return str(self.version)
@@ -0,0 +1,24 @@
+"""Loaded snapshot model """
+
+# Django
+from django.db import models
+from django.utils import timezone
+
+
+class LoadedSnapshot(models.Model):
+    """ Loaded Snapshot Model
+
+    Every snapshot the ETL loaded, written in the transaction of its load,
+    so replaying the archive skips the runs already in the database, whatever
+    prices they wrote.
+    """
+    snapshot = models.CharField(
+        max_length=32,
+        unique=True,
+        help_text='Stamp of the run that produced the snapshot, as in its archive files',
+        )
+    loaded = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        """Return snapshot stamp"""
+        return self.snapshot
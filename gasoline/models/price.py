@@ -33,6 +33,19 @@ class Price(models.Model):
         auto_now_add=True,
         help_text='Date Time on wich the prices are registred'
         )
+
+    class Meta:
+        """ Class Meta"""
+        indexes = [
+            # Keyset pagination of allPricesKeyset
+            models.Index(fields=['date', 'id'], name='price_date_id_idx'),
+            # Price bands of a gas type
+            models.Index(fields=['gas_type', 'price'], name='price_gas_type_price_idx'),
+            # History of a station and gas type by date
+            models.Index(fields=['station', 'gas_type', 'date'],
+                         name='price_station_gas_date_idx'),
+        ]
+
     def __str__(self):
         """ Returns price."""
         return f'{self.gas_type} cuesta {self.price} en {self.station}'
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""Price rollup model """
+
+# Django
+from django.db import models
+
+# Models
+from gasoline.models.price import Price
+from gasoline.models.station import Station
+
+class PriceRollup(models.Model):
+    """ Price Rollup Model
+
+    Aggregate of the prices of one type of gasoline by station over an
+    hour, a day or a week, kept up to date by the ETL load and by the
+    signals of Price, so price history charts read one row per bucket.
+    """
+    HOUR = 'hour'
+    DAY = 'day'
+    WEEK = 'week'
+    BUCKET_CHOICES = [
+        (HOUR, 'hour'),
+        (DAY, 'day'),
+        (WEEK, 'week'),
+    ]
+
+    station = models.ForeignKey(
+        Station,
+        on_delete=models.CASCADE,
+        related_name='price_rollups',
+        )
+    gas_type = models.CharField(
+        max_length=20,
+        choices=Price.GAS_CHOICES,
+        help_text='Type of gasoline between the GAS_CHOICES',
+        )
+    bucket = models.CharField(
+        max_length=4,
+        choices=BUCKET_CHOICES,
+        )
+    start = models.DateTimeField(
+        help_text='Start of the bucket in UTC, weeks start on monday'
+        )
+
+    # Aggregates, the sum and count give the average
+    min_price = models.FloatField()
+    max_price = models.FloatField()
+    price_sum = models.FloatField()
+    price_count = models.PositiveIntegerField()
+    last_price = models.FloatField()
+    last_date = models.DateTimeField()
+
+    class Meta:
+        """ Class Meta"""
+        constraints = [
+            # Also the index of the priceHistory range reads
+            models.UniqueConstraint(fields=['station', 'gas_type', 'bucket', 'start'],
+                                    name='price_rollup_bucket'),
+        ]
+
+    @property
+    def avg_price(self):
+        """ Return the average price of the bucket"""
+        return self.price_sum / self.price_count
+
+    def __str__(self):
+        """ Returns bucket."""
+        return f'{self.gas_type} {self.bucket} {self.start:%Y-%m-%d %H:%M} en {self.station}'
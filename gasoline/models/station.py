@@ -42,6 +42,19 @@ class Station(models.Model):
         null=True,
         help_text='Official name of the Mexican state where is located the station'
         )
+    grid_cell = models.IntegerField(
+        blank=True,
+        null=True,
+        db_index=True,
+        editable=False,
+        help_text='Cell of the location in the grid of gasoline.geo, used to find near stations'
+        )
+    search_text = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        help_text='Name, town and state without accents nor case, indexed for searchStations'
+        )
 
     # Status
     is_active = models.BooleanField(default=False)
@@ -51,6 +64,13 @@ class Station(models.Model):
         help_text="Station' status based on their activity. It changes when a user verify the station "
         )
 
+    class Meta:
+        """ Class Meta"""
+        indexes = [
+            # Bounding box and coordinate range filters
+            models.Index(fields=['latitude', 'longitude'], name='station_lat_lon_idx'),
+        ]
+
     def __str__(self):
         """Return station name"""
         return self.name
\ No newline at end of file
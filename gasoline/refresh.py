@@ -0,0 +1,126 @@
+""" Refresh of the data derived from the prices of gasoline app """
+
+# Python
+from collections import defaultdict
+
+# Django
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.utils import timezone
+
+# Models
+from gasoline.models import AreaPriceStats, CurrentPrice, DataVersion, Price, PriceRollup, Station
+
+# Area stats
+from gasoline.area_stats import area_stats
+
+# Rollups
+from gasoline.rollups import BUCKETS, bucket_start
+
+
+def refresh_rollup(station_id, gas_type, bucket, start):
+    """ Recompute from the prices the rollup of one bucket of a station and
+    gas type"""
+    key = {'station_id': station_id, 'gas_type': gas_type, 'bucket': bucket, 'start': start}
+    prices = Price.objects.filter(station_id=station_id, gas_type=gas_type,
+                                  date__gte=start, date__lt=start + BUCKETS[bucket])
+
+    stats = prices.aggregate(min_price=Min('price'), max_price=Max('price'),
+                             price_sum=Sum('price'), price_count=Count('id'))
+    if not stats['price_count']:
+        PriceRollup.objects.filter(**key).delete()
+        return
+
+    stats['last_price'], stats['last_date'] = prices.order_by('-date', '-id') \
+        .values_list('price', 'date').first()
+    PriceRollup.objects.update_or_create(**key, defaults=stats)
+
+
+def refresh_area_stats(areas):
+    """ Recompute the statistics of the (state, town, gas_type) areas and of
+    their states, reading the current prices of each state and gas type once"""
+    towns = defaultdict(set)
+    for state, town, gas_type in areas:
+        if state:
+            towns[(state, gas_type)].add(town or '')
+
+    refreshed = timezone.now()
+    for (state, gas_type), state_towns in towns.items():
+        current = CurrentPrice.objects.filter(
+            station__is_active=True, station__state=state, gas_type=gas_type,
+        ).values_list('gas_type', 'price', 'date', 'station__state', 'station__town')
+        stats = area_stats(current.iterator())
+
+        keys = [(AreaPriceStats.STATE, gas_type, state, '')] + \
+            [(AreaPriceStats.TOWN, gas_type, state, town) for town in state_towns if town]
+        AreaPriceStats.objects.filter(gas_type=gas_type, state=state).filter(
+            Q(level=AreaPriceStats.STATE) | Q(level=AreaPriceStats.TOWN, town__in=state_towns)
+        ).delete()
+        AreaPriceStats.objects.bulk_create([
+            AreaPriceStats(level=level, gas_type=gas_type, state=state, town=town,
+                           refreshed=refreshed, **stats[level, gas_type, state, town])
+            for level, gas_type, state, town in keys if (level, gas_type, state, town) in stats
+        ])
+
+
+class PendingRefresh:
+    """ Derived data the writes of a transaction left stale
+
+    The signals collect the keys it must refresh, deduplicated, so a cascade
+    over many prices refreshes every bucket and area, and bumps the data
+    version, once when the transaction commits.
+    """
+    def __init__(self):
+        self.prices = set()
+        self.areas = set()
+        self.data_version = False
+
+    def refresh(self):
+        """ Recompute the derived data of the collected keys"""
+        # Rollups of deleted stations are deleted with them, and their areas
+        # are collected by the deletion of the station
+        stations = dict((pk, (state, town)) for pk, state, town in Station.objects.filter(
+            pk__in={station_id for station_id, _, _ in self.prices},
+        ).values_list('id', 'state', 'town'))
+        prices = {key for key in self.prices if key[0] in stations}
+
+        for station_id, gas_type, bucket, start in sorted({
+                (station_id, gas_type, bucket, bucket_start(date, bucket))
+                for station_id, gas_type, date in prices for bucket in BUCKETS}):
+            refresh_rollup(station_id, gas_type, bucket, start)
+
+        refresh_area_stats(self.areas | {(*stations[station_id], gas_type)
+                                         for station_id, gas_type, _ in prices})
+
+        # Bumped last, so no response is cached against stale derived data
+        if self.data_version:
+            DataVersion.bump()
+
+
+def defer(prices=(), areas=(), data_version=False):
+    """ Refresh the derived data of the (station_id, gas_type, date) prices and of
+    the (state, town, gas_type) areas, and bump the data version if asked, when
+    the current transaction commits, or right away outside transactions"""
+    connection = transaction.get_connection()
+    pending = getattr(connection, 'pending_refresh', None)
+    if pending is None:
+        pending = connection.pending_refresh = PendingRefresh()
+    pending.prices.update(prices)
+    pending.areas.update(areas)
+    pending.data_version |= data_version
+
+    # Rolled back transactions drop their callbacks, the keys they collected
+    # are refreshed along with the next commit
+    transaction.on_commit(refresh_pending)
+
+
+def refresh_pending():
+    """ Refresh the derived data collected for the committed transaction"""
+    connection = transaction.get_connection()
+    pending = getattr(connection, 'pending_refresh', None)
+    if pending is None:
+        return
+
+    connection.pending_refresh = None
+    with transaction.atomic():
+        pending.refresh()
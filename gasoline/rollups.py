@@ -0,0 +1,49 @@
+""" Price rollup helpers for gasoline app """
+
+# Python
+from datetime import timedelta, timezone
+
+# Buckets of PriceRollup by length
+HOUR = 'hour'
+DAY = 'day'
+WEEK = 'week'
+BUCKETS = {
+    HOUR: timedelta(hours=1),
+    DAY: timedelta(days=1),
+    WEEK: timedelta(weeks=1),
+}
+
+
+def bucket_start(date, bucket):
+    """ Return the start in UTC of the bucket that contains date, naive
+    dates being UTC already"""
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc)
+    start = date.replace(minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
+
+    if bucket != HOUR:
+        start = start.replace(hour=0)
+    if bucket == WEEK:
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def rollup_prices(prices):
+    """ Return the rollup fields of every bucket of prices, an iterable of
+    (station_id, gas_type, price, date) ordered by date, keyed by
+    (station_id, gas_type, bucket, start)"""
+    rollups = {}
+    for station_id, gas_type, price, date in prices:
+        for bucket in BUCKETS:
+            key = (station_id, gas_type, bucket, bucket_start(date, bucket))
+            stats = rollups.get(key)
+            if stats is None:
+                rollups[key] = {'min_price': price, 'max_price': price, 'price_sum': price,
+                                'price_count': 1, 'last_price': price, 'last_date': date}
+                continue
+            stats['min_price'] = min(stats['min_price'], price)
+            stats['max_price'] = max(stats['max_price'], price)
+            stats['price_sum'] += price
+            stats['price_count'] += 1
+            stats['last_price'], stats['last_date'] = price, date
+    return rollups
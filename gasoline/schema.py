@@ -1,15 +1,66 @@
 """Schemas for gasoline app """
+# Python
+import heapq
+from datetime import timezone
+
 # Django
 import django_filters
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import Q
 
 # Models
-from gasoline.models import Price, Station
+from gasoline.models import AreaPriceStats, CurrentPrice, Price, PriceRollup, Station
+
+# Geo
+from gasoline.geo import bounding_box, cells_in_box, cells_within, haversine_km
+
+# Search
+from gasoline.search import normalize
+
+# Rollups
+from gasoline.rollups import BUCKETS, bucket_start
 
 # Graphene
 import graphene
 from graphene import relay, ObjectType, Connection, Node, ConnectionField
 from graphene_django import DjangoObjectType
 from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError
+from graphql_relay import from_global_id
+
+# Loaders
+from oilApp.loaders import load_related, load_related_list
+from oilApp.optimizer import optimize
+from oilApp.pagination import KeysetConnection, KeysetConnectionField, LimitedConnectionField, \
+    check_page_size
+
+MAX_RADIUS_KM = 50
+# Boxes over this many grid cells are ranked without narrowing them by cell
+MAX_BOX_CELLS = 400
+# Shorter searches match too many stations to be served from the trigram index
+MIN_SEARCH_LENGTH = 3
+# Longest price history served in buckets, a year by day fits
+MAX_HISTORY_BUCKETS = 400
+
+class CurrentPriceType(DjangoObjectType):
+    """ Type for current price model"""
+    class Meta:
+        """Class Meta"""
+        model = CurrentPrice
+        fields = (
+            'id',
+            'station',
+            'gas_type',
+            'price',
+            'date',
+        )
+
+    def resolve_station(root, info):
+        """ Return the station of the price, joined or batched by the request loader"""
+        return load_related(info, root, 'station')
+
 
 class StationType(DjangoObjectType):	
     """Type for Station Model"""	
@@ -29,7 +80,13 @@ class StationType(DjangoObjectType):
             'is_active',	
             'status',	
         )
-        
+
+    current_prices = graphene.List(CurrentPriceType)
+
+    def resolve_current_prices(root, info):
+        """ Return the current price of each gas type of the station"""
+        return load_related_list(info, root, 'current_prices')
+
 class PriceType(DjangoObjectType):	
     """ Type for price model"""	
     class Meta:	
@@ -43,25 +100,148 @@ class PriceType(DjangoObjectType):
             'date',	
         )
 
+    def resolve_station(root, info):
+        """ Return the station of the price, joined or batched by the request loader"""
+        return load_related(info, root, 'station')
+
+class NearStationType(graphene.ObjectType):
+    """ Station with its distance to the searched location"""
+    station = graphene.Field(StationType)
+    distance_km = graphene.Float()
+
+class PriceBucket(graphene.Enum):
+    """ Length of the buckets of a price history"""
+    HOUR = PriceRollup.HOUR
+    DAY = PriceRollup.DAY
+    WEEK = PriceRollup.WEEK
+
+class PriceRollupType(DjangoObjectType):
+    """ Type for the prices of a station over a bucket"""
+    class Meta:
+        """Class Meta"""
+        model = PriceRollup
+        fields = (
+            'start',
+            'min_price',
+            'max_price',
+            'last_price',
+            'last_date',
+            'price_count',
+        )
+
+    avg_price = graphene.Float()
+
+class AreaLevel(graphene.Enum):
+    """ Areas the price statistics are summarized by"""
+    STATE = AreaPriceStats.STATE
+    TOWN = AreaPriceStats.TOWN
+
+class AreaPriceStatsType(DjangoObjectType):
+    """ Type for the price statistics of a state or a town"""
+    class Meta:
+        """Class Meta"""
+        model = AreaPriceStats
+        fields = (
+            'gas_type',
+            'state',
+            'station_count',
+            'avg_price',
+            'min_price',
+            'max_price',
+            'p25_price',
+            'median_price',
+            'p75_price',
+            'p90_price',
+            'oldest_price_date',
+            'latest_price_date',
+            'refreshed',
+        )
+
+    town = graphene.String()
+
+    def resolve_town(root, info):
+        """ Return the town of the statistics, or None for a state"""
+        return root.town or None
+
+class BoundingBoxInput(graphene.InputObjectType):
+    """ Area between two parallels and two meridians"""
+    min_lat = graphene.Float(required=True)
+    min_lon = graphene.Float(required=True)
+    max_lat = graphene.Float(required=True)
+    max_lon = graphene.Float(required=True)
+
+
 #-----------NODE-QUERIES----------
-class StationNode(DjangoObjectType):
-    """Node of the stations of gasoline"""
+def filter_range(queryset, name, value):
+    """ Return the rows of queryset with name between the bounds of value"""
+    try:
+        low, high = (float(part) for part in value.split(','))
+    except ValueError:
+        raise GraphQLError('range must be min,max')
+    return queryset.filter(**{name + '__range': (low, high)})
+
+
+def range_filter(field_name):
+    """ Return a filter of field_name between the bounds of a min,max string"""
+    # graphene-django declares lookups of the model fields with a single
+    # Float argument, which cannot carry the two bounds of a range
+    return django_filters.CharFilter(field_name=field_name, method=filter_range,
+                                     help_text='Range as min,max')
+
+
+class StationFilter(django_filters.FilterSet):
+    """Filters of the stations of gasoline"""
+    bbox = django_filters.CharFilter(
+        method='filter_bbox',
+        help_text='Bounding box as minLat,minLon,maxLat,maxLon',
+    )
+    latitude__range = range_filter('latitude')
+    longitude__range = range_filter('longitude')
+
     class Meta:
-        """Meta class."""
+        """Class Meta"""
         model = Station
-        filter_fields = {
+        fields = {
             'id':['exact'],
             'name':['exact', 'icontains','istartswith'],
             'register':['exact', 'icontains','istartswith'],
-            'latitude':['exact', 'icontains','istartswith'], 
-            'longitude':['exact', 'icontains','istartswith'],
+            'latitude':['exact', 'icontains','istartswith', 'gte', 'lte'],
+            'longitude':['exact', 'icontains','istartswith', 'gte', 'lte'],
             'town':['exact', 'icontains','istartswith'],
             'state':['exact', 'icontains','istartswith'],
             'is_active':['exact'],
             'status':['exact'],
         }
+
+    def filter_bbox(self, queryset, name, value):
+        """ Return the stations inside the bounding box of value"""
+        try:
+            min_lat, min_lon, max_lat, max_lon = (float(part) for part in value.split(','))
+        except ValueError:
+            raise GraphQLError('bbox must be minLat,minLon,maxLat,maxLon')
+        return queryset.filter(latitude__range=(min_lat, max_lat),
+                               longitude__range=(min_lon, max_lon))
+
+
+class StationNode(DjangoObjectType):
+    """Node of the stations of gasoline"""
+    class Meta:
+        """Meta class."""
+        model = Station
+        filterset_class = StationFilter
         interfaces = (relay.Node, Node)
 
+    current_prices = graphene.List(CurrentPriceType)
+
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        """ Fetch only what the selection set asks for"""
+        return optimize(queryset, info)
+
+    def resolve_current_prices(root, info):
+        """ Return the current price of each gas type of the station"""
+        return load_related_list(info, root, 'current_prices')
+
 
 class StationConnection(Connection):
     """Station Connection"""
@@ -70,20 +250,39 @@ class StationConnection(Connection):
         node = StationNode
 
 
-class PriceNode(DjangoObjectType):
-    """Node of prices of each station of gasoline"""
+class PriceFilter(django_filters.FilterSet):
+    """Filters of the prices of gasoline"""
+    price__range = range_filter('price')
+
     class Meta:
-        """Meta class."""
+        """Class Meta"""
         model = Price
-        filter_fields = {
+        fields = {
             'id': ['exact'],
             'station__name': ['exact', 'icontains','istartswith'],
             'gas_type': ['exact', 'icontains','istartswith'],
-            'price':['exact', 'icontains','istartswith'],
-            'date':['exact'],
+            'price':['exact', 'icontains','istartswith', 'gte', 'lte'],
+            'date':['exact', 'gte', 'lte'],
         }
+
+
+class PriceNode(DjangoObjectType):
+    """Node of prices of each station of gasoline"""
+    class Meta:
+        """Meta class."""
+        model = Price
+        filterset_class = PriceFilter
         interfaces = (relay.Node,Node)
 
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        """ Fetch only what the selection set asks for"""
+        return optimize(queryset, info)
+
+    def resolve_station(root, info):
+        """ Return the station of the price, joined or batched by the request loader"""
+        return load_related(info, root, 'station')
+
 
 class PriceConnection(Connection):
     """Price Connection"""
@@ -92,19 +291,240 @@ class PriceConnection(Connection):
         node = PriceNode
 
 
+class StationKeysetConnection(KeysetConnection):
+    """Station Connection paginated by id"""
+    keys = ('id',)
+
+    class Meta:
+        """Class Meta"""
+        node = StationNode
+
+
+class PriceKeysetConnection(KeysetConnection):
+    """Price Connection paginated by date and id"""
+    keys = ('date', 'id')
+
+    class Meta:
+        """Class Meta"""
+        node = PriceNode
+
+
+class CurrentPriceConnection(KeysetConnection):
+    """Current Price Connection paginated by id"""
+    keys = ('id',)
+
+    class Meta:
+        """Class Meta"""
+        node = CurrentPriceType
+
+
 #---------------SCHEMA---------------
 class Query(graphene.ObjectType):
     """Gasoline Query class"""
-    all_stations = ConnectionField(StationConnection)
-    all_prices = ConnectionField(PriceConnection)
+    stations_near = graphene.List(
+        NearStationType,
+        lat=graphene.Float(required=True),
+        lon=graphene.Float(required=True),
+        radius_km=graphene.Float(default_value=5),
+        first=graphene.Int(default_value=20),
+    )
+    cheapest_stations = graphene.List(
+        CurrentPriceType,
+        gas_type=graphene.String(required=True),
+        state=graphene.String(),
+        town=graphene.String(),
+        bbox=BoundingBoxInput(),
+        first=graphene.Int(default_value=10),
+    )
+    search_stations = graphene.List(
+        StationType,
+        text=graphene.String(required=True),
+        first=graphene.Int(default_value=20),
+    )
+    price_history = graphene.List(
+        PriceRollupType,
+        station_id=graphene.ID(required=True),
+        gas_type=graphene.String(required=True),
+        from_=graphene.DateTime(required=True, name='from'),
+        to=graphene.DateTime(required=True),
+        bucket=PriceBucket(default_value=PriceBucket.DAY.value),
+    )
+    area_price_stats = graphene.List(
+        AreaPriceStatsType,
+        level=AreaLevel(required=True),
+        gas_type=graphene.String(required=True),
+        state=graphene.String(),
+    )
+    all_stations = LimitedConnectionField(StationConnection)
+    all_prices = LimitedConnectionField(PriceConnection)
+    all_stations_keyset = KeysetConnectionField(StationKeysetConnection)
+    all_prices_keyset = KeysetConnectionField(PriceKeysetConnection)
+    latest_prices = KeysetConnectionField(CurrentPriceConnection, gas_type=graphene.String())
 
     def resolve_all_stations(root, info,  **kwargs):
         """ Return all the stations """
-        return Station.objects.filter(is_active=True)
+        return optimize(Station.objects.filter(is_active=True), info)
 
     def resolve_all_prices(root, info, **kwargs):
         """ Return all prices """
-        return Price.objects.filter(station__is_active=True)
+        return optimize(Price.objects.filter(station__is_active=True), info)
+
+    def resolve_all_stations_keyset(root, info, **kwargs):
+        """ Return all the stations, paginated by id"""
+        return optimize(Station.objects.filter(is_active=True), info)
+
+    def resolve_all_prices_keyset(root, info, **kwargs):
+        """ Return all prices, paginated by date and id"""
+        return optimize(Price.objects.filter(station__is_active=True), info)
+
+    def resolve_latest_prices(root, info, gas_type=None, **kwargs):
+        """ Return the current price of each gas type of each station"""
+        queryset = CurrentPrice.objects.filter(station__is_active=True)
+        if gas_type is not None:
+            queryset = queryset.filter(gas_type=gas_type)
+        return optimize(queryset, info)
+
+    def resolve_stations_near(root, info, lat, lon, radius_km, first):
+        """ Return the active stations within radius_km of (lat, lon), nearest first
+
+        Candidates come from the grid cells around the location, so only
+        a few cells are read whatever the number of stations.
+        """
+        if not 0 < radius_km <= MAX_RADIUS_KM:
+            raise GraphQLError(f'radiusKm must be between 0 and {MAX_RADIUS_KM}')
+        check_page_size({'first': first})
+        first = min(first, graphene_settings.RELAY_CONNECTION_MAX_LIMIT)
+
+        min_lat, min_lon, max_lat, max_lon = bounding_box(lat, lon, radius_km)
+        candidates = Station.objects.filter(
+            is_active=True,
+            grid_cell__in=cells_within(lat, lon, radius_km),
+            latitude__range=(min_lat, max_lat),
+            longitude__range=(min_lon, max_lon),
+        ).values_list('id', 'latitude', 'longitude')
+
+        distances = []
+        for pk, latitude, longitude in candidates:
+            distance = haversine_km(lat, lon, latitude, longitude)
+            if distance <= radius_km:
+                distances.append((distance, pk))
+        distances = heapq.nsmallest(first, distances)
+
+        stations = Station.objects.in_bulk([pk for _, pk in distances])
+        return [NearStationType(station=stations[pk], distance_km=round(distance, 3))
+                for distance, pk in distances]
+
+    def resolve_cheapest_stations(root, info, gas_type, first, state=None, town=None,
+                                  bbox=None):
+        """ Return the current prices of gas_type of the active stations in an
+        area, cheapest first
+
+        The current prices are ranked by the (gas_type, state|town|grid_cell,
+        price) indexes and carry the coordinates of their station, so only the
+        first rows of the area are read.
+        """
+        if gas_type not in dict(Price.GAS_CHOICES):
+            raise GraphQLError(f'Unknown gasType {gas_type}')
+        check_page_size({'first': first})
+        first = min(first, graphene_settings.RELAY_CONNECTION_MAX_LIMIT)
+
+        queryset = CurrentPrice.objects.filter(gas_type=gas_type, station__is_active=True)
+        if state is not None:
+            queryset = queryset.filter(state=state)
+        if town is not None:
+            queryset = queryset.filter(town=town)
+        if bbox is not None:
+            if bbox.min_lat > bbox.max_lat or bbox.min_lon > bbox.max_lon:
+                raise GraphQLError('bbox minimums must not exceed its maximums')
+            queryset = queryset.filter(
+                latitude__range=(bbox.min_lat, bbox.max_lat),
+                longitude__range=(bbox.min_lon, bbox.max_lon),
+            )
+            # Small boxes are read by cell from the (gas_type, grid_cell,
+            # price) index, large ones along the ranking
+            cells = cells_in_box(bbox.min_lat, bbox.min_lon, bbox.max_lat, bbox.max_lon)
+            if len(cells) <= MAX_BOX_CELLS:
+                queryset = queryset.filter(grid_cell__in=cells)
+
+        return optimize(queryset, info).order_by('price', 'id')[:first]
+
+    def resolve_search_stations(root, info, text, first):
+        """ Return the active stations whose name, town or state match text,
+        best matches first
+
+        Text is matched without accents nor case against Station.search_text.
+        On PostgreSQL every word is matched with LIKE, or the whole text by
+        trigram similarity, both served by the trigram index and ranked by
+        similarity; other databases match the words only, by name.
+        """
+        check_page_size({'first': first})
+        text = normalize(text)
+        if len(text) < MIN_SEARCH_LENGTH:
+            return []
+        first = min(first, graphene_settings.RELAY_CONNECTION_MAX_LIMIT)
+
+        words = Q()
+        for word in text.split():
+            words &= Q(search_text__contains=word)
+        queryset = Station.objects.filter(is_active=True)
+
+        if connection.vendor == 'postgresql':
+            queryset = queryset.filter(words | Q(search_text__trigram_similar=text)) \
+                .annotate(rank=TrigramSimilarity('search_text', text)) \
+                .order_by('-rank', 'name', 'id')
+        else:
+            queryset = queryset.filter(words).order_by('name', 'id')
+
+        return optimize(queryset, info)[:first]
+
+    def resolve_price_history(root, info, station_id, gas_type, from_, to, bucket):
+        """ Return the prices of gas_type of a station from from_ to to, one
+        rollup per bucket, oldest first
+
+        The rollups are maintained as the prices are written, so a chart reads
+        one row per bucket instead of every price in the range.
+        """
+        try:
+            node_type, station_id = from_global_id(station_id)
+            station_id = int(station_id)
+        except ValueError:
+            node_type = None
+        if node_type != StationNode._meta.name:
+            raise GraphQLError('stationId must be the id of a StationNode')
+        if gas_type not in dict(Price.GAS_CHOICES):
+            raise GraphQLError(f'Unknown gasType {gas_type}')
+        # Naive dates are UTC, as the buckets are
+        from_, to = (date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+                     for date in (from_, to))
+        start = bucket_start(from_, bucket)
+        if to <= start:
+            raise GraphQLError('from must be before to')
+        if (to - start) / BUCKETS[bucket] > MAX_HISTORY_BUCKETS:
+            raise GraphQLError(f'Price history is limited to {MAX_HISTORY_BUCKETS} buckets, '
+                               'use a longer bucket or a shorter range')
+
+        return PriceRollup.objects.filter(
+            station_id=station_id,
+            gas_type=gas_type,
+            bucket=bucket,
+            start__gte=start,
+            start__lt=to,
+        ).order_by('start')
+
+    def resolve_area_price_stats(root, info, level, gas_type, state=None):
+        """ Return the price statistics of gas_type by state or by town, of
+        every area or of the towns of a state
+
+        The statistics are refreshed as the prices are loaded, so they are
+        read as one row per area whatever the number of prices.
+        """
+        if gas_type not in dict(Price.GAS_CHOICES):
+            raise GraphQLError(f'Unknown gasType {gas_type}')
+
+        queryset = AreaPriceStats.objects.filter(level=level, gas_type=gas_type)
+        if state is not None:
+            queryset = queryset.filter(state=state)
+        return queryset.order_by('state', 'town')
 
     # Node Query class
     station = relay.Node.Field(StationNode)
@@ -0,0 +1,18 @@
+""" Search helpers for gasoline app """
+
+# Unidecode
+from unidecode import unidecode
+
+# Fields of a station concatenated in its search text
+SEARCH_FIELDS = ['name', 'town', 'state']
+
+
+def normalize(text):
+    """ Return text transliterated to ASCII, lowercase and with single spaces,
+    so Nezahualcóyotl matches nezahualcoyotl"""
+    return ' '.join(unidecode(text or '').lower().split())
+
+
+def search_text(station):
+    """ Return the normalized text a station is searched by"""
+    return normalize(' '.join(getattr(station, field) or '' for field in SEARCH_FIELDS))
@@ -0,0 +1,159 @@
+""" Gasoline signals """
+
+# Django
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+# Models
+from gasoline.models import CurrentPrice, Price, Station
+
+# Geo
+from gasoline.geo import grid_cell
+
+# Search
+from gasoline.search import search_text
+
+# Refresh
+from gasoline.refresh import defer
+
+# Models served by the API, their writes invalidate cached responses. The
+# rollups and area statistics are derived from the prices, their refresh
+# bumps the version itself
+SERVED_MODELS = {'gasoline.Station', 'gasoline.Price', 'gasoline.CurrentPrice',
+                 'complaints.Complaint', 'users.Profile', 'auth.User'}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_data_version(sender, update_fields=None, **kwargs):
+    """ Bump the data version once the transaction that writes the served
+    data commits, whatever the number of rows it writes
+
+    Logins only save the last_login of the user, which is not served. Bulk
+    writes send no signal, the ETL bumps the version of its loads itself.
+    """
+    if sender._meta.label not in SERVED_MODELS:
+        return
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    defer(data_version=True)
+
+
+@receiver(pre_save, sender=Station)
+def update_grid_cell(sender, instance, **kwargs):
+    """ Place the station in the grid cell of its coordinates"""
+    if instance.latitude is not None and instance.longitude is not None:
+        instance.grid_cell = grid_cell(float(instance.latitude), float(instance.longitude))
+
+
+@receiver(pre_save, sender=Station)
+def update_search_text(sender, instance, **kwargs):
+    """ Normalize the name, town and state the station is searched by"""
+    instance.search_text = search_text(instance)
+
+
+def station_location(station):
+    """ Return the fields of station copied to its current prices"""
+    return {'state': station.state, 'town': station.town, 'latitude': station.latitude,
+            'longitude': station.longitude, 'grid_cell': station.grid_cell}
+
+
+@receiver(post_save, sender=Station)
+def update_current_price_areas(sender, instance, created, **kwargs):
+    """ Copy the location of a saved station to its current prices"""
+    if not created:
+        CurrentPrice.objects.filter(station_id=instance.pk).update(**station_location(instance))
+
+
+@receiver(post_save, sender=Price)
+def update_current_price(sender, instance, **kwargs):
+    """ Make a saved price the current one of its station and gas type,
+    unless a newer price is already current
+
+    bulk_create() does not send post_save, the ETL upserts the current
+    prices of its loads itself.
+    """
+    values = {'price': instance.price, 'date': instance.date,
+              **station_location(instance.station)}
+    updated = CurrentPrice.objects.filter(
+        station_id=instance.station_id,
+        gas_type=instance.gas_type,
+        date__lte=instance.date,
+    ).update(**values)
+
+    if not updated:
+        CurrentPrice.objects.get_or_create(
+            station_id=instance.station_id,
+            gas_type=instance.gas_type,
+            defaults=values,
+        )
+
+
+@receiver(post_delete, sender=Price)
+def restore_current_price(sender, instance, **kwargs):
+    """ Fall back to the previous price when the current one is deleted"""
+    current = CurrentPrice.objects.filter(
+        station_id=instance.station_id,
+        gas_type=instance.gas_type,
+        date__lte=instance.date,
+    )
+    if not current.exists():
+        return
+
+    previous = Price.objects.filter(
+        station_id=instance.station_id,
+        gas_type=instance.gas_type,
+    ).order_by('-date', '-id').first()
+
+    if previous is None:
+        current.delete()
+    else:
+        current.update(price=previous.price, date=previous.date)
+
+
+@receiver(pre_save, sender=Price)
+def remember_price_rollup(sender, instance, **kwargs):
+    """ Remember the station, gas type and date a price is saved over, so
+    the rollups of its previous buckets are recomputed too"""
+    instance.previous_rollup = None
+    if instance.pk is not None:
+        instance.previous_rollup = Price.objects.filter(pk=instance.pk) \
+            .values_list('station_id', 'gas_type', 'date').first()
+
+
+@receiver(post_save, sender=Price)
+@receiver(post_delete, sender=Price)
+def update_price_derived(sender, instance, **kwargs):
+    """ Refresh the rollups of the buckets and the statistics of the area of
+    a saved or deleted price, and of the ones it was saved over, when the
+    transaction commits
+
+    The ETL only inserts prices, bulk_create() sends no signal and it
+    upserts the rollups and statistics of its loads itself.
+    """
+    previous = getattr(instance, 'previous_rollup', None)
+    defer(prices=[(instance.station_id, instance.gas_type, instance.date)] +
+          ([previous] if previous is not None else []))
+
+
+@receiver(pre_save, sender=Station)
+def remember_station_area(sender, instance, **kwargs):
+    """ Remember the state and town a station is saved over, so the
+    statistics of a station that moves are refreshed in both areas"""
+    instance.previous_area = None
+    if instance.pk is not None:
+        instance.previous_area = Station.objects.filter(pk=instance.pk) \
+            .values_list('state', 'town').first()
+
+
+@receiver(post_save, sender=Station)
+@receiver(post_delete, sender=Station)
+def update_station_area_stats(sender, instance, **kwargs):
+    """ Refresh the statistics of the areas of a saved or deleted station
+    when the transaction commits
+
+    The ETL refreshes the statistics of the areas of its loads itself.
+    """
+    areas = {(instance.state, instance.town), getattr(instance, 'previous_area', None)}
+    defer(areas=[(state, town, gas_type) for state, town in areas - {None}
+                 for gas_type, _ in Price.GAS_CHOICES])
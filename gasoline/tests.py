@@ -1,3 +1,812 @@
-from django.test import TestCase
+""" Gasoline tests """
 
-# Create your tests here.
+# Python
+import hashlib
+
+# Django
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils.dateparse import parse_datetime
+
+# Models
+from gasoline.models import AreaPriceStats, CurrentPrice, DataVersion, PriceRollup, Station, Price
+
+# Geo
+from gasoline.geo import cells_within, grid_cell
+
+# Schema
+from oilApp.schema import schema
+from graphql import parse
+from graphql_relay import to_global_id
+from oilApp.cost import CostAnalyzer, QueryCost
+from oilApp.documents import persisted_queries
+from oilApp.views import CachedGraphQLView, cache_stats, get_cache
+
+
+PRICES_QUERY = '''
+query ($first: Int) {
+    allPrices(first: $first) {
+        edges { node { price station { name } } }
+    }
+}
+'''
+
+
+def create_prices(n):
+    """ Create n active stations with one price each"""
+    for i in range(n):
+        station = Station.objects.create(name=f'Station {i}', register=f'PL/{i}',
+                                         latitude=19.4, longitude=-99.1, is_active=True)
+        Price.objects.create(station=station, gas_type='regular', price=20.5)
+
+
+def run_commit_hooks():
+    """ Run the callbacks waiting for the commit of the test transaction,
+    which is rolled back instead"""
+    while connection.run_on_commit:
+        callbacks, connection.run_on_commit = connection.run_on_commit, []
+        for _, callback in callbacks:
+            callback()
+
+
+class PriceStationLoaderTestCase(TestCase):
+    """ Price.station is resolved with a batching loader"""
+
+    def setUp(self):
+        create_prices(50)
+
+    def count_queries(self, first):
+        """ Return the number of queries of a page of first prices"""
+        request = RequestFactory().post('/graphql')
+        with CaptureQueriesContext(connection) as queries:
+            result = schema.execute(PRICES_QUERY, variables={'first': first},
+                                    context_value=request)
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(result.data['allPrices']['edges']), first)
+        return len(queries)
+
+    def test_constant_queries(self):
+        """ The number of queries does not grow with the page size"""
+        self.assertEqual(self.count_queries(5), self.count_queries(50))
+
+    def test_station_names(self):
+        """ Every price gets its own station"""
+        request = RequestFactory().post('/graphql')
+        result = schema.execute(PRICES_QUERY, variables={'first': 3}, context_value=request)
+        names = [edge['node']['station']['name'] for edge in result.data['allPrices']['edges']]
+        self.assertEqual(names, ['Station 0', 'Station 1', 'Station 2'])
+
+
+class OptimizerTestCase(TestCase):
+    """ Node queries fetch only what the selection set asks for"""
+
+    def setUp(self):
+        create_prices(10)
+
+    def capture(self, query):
+        """ Return the SQL of the queries run by query"""
+        request = RequestFactory().post('/graphql')
+        with CaptureQueriesContext(connection) as queries:
+            result = schema.execute(query, context_value=request)
+        self.assertIsNone(result.errors)
+        return [captured['sql'] for captured in queries.captured_queries]
+
+    def test_only_selected_columns(self):
+        """ Unselected columns are deferred"""
+        queries = self.capture('{ nodeStation(first: 5) { edges { node { name } } } }')
+        self.assertNotIn('"gasoline_station"."about"', queries[-1])
+        self.assertIn('"gasoline_station"."name"', queries[-1])
+
+    def test_selected_relation_is_joined(self):
+        """ A selected foreign key is fetched in the same query"""
+        queries = self.capture(
+            '{ nodePrice(first: 5) { edges { node { price station { name } } } } }')
+        self.assertIn('JOIN "gasoline_station"', queries[-1])
+        self.assertEqual(len([sql for sql in queries if 'FROM "gasoline_station"' in sql]), 0)
+
+
+KEYSET_QUERY = '''
+query ($first: Int, $after: String, $last: Int, $before: String) {
+    allPricesKeyset(first: $first, after: $after, last: $last, before: $before) {
+        pageInfo { endCursor startCursor hasNextPage hasPreviousPage }
+        edges { node { price station { name } } }
+    }
+}
+'''
+
+
+class KeysetPaginationTestCase(TestCase):
+    """ allPricesKeyset pages with cursors on date and id"""
+
+    def setUp(self):
+        create_prices(10)
+
+    def page(self, **variables):
+        """ Return the connection of a page and the SQL it ran"""
+        request = RequestFactory().post('/graphql')
+        with CaptureQueriesContext(connection) as queries:
+            result = schema.execute(KEYSET_QUERY, variables=variables, context_value=request)
+        self.assertIsNone(result.errors)
+        return result.data['allPricesKeyset'], [query['sql'] for query in queries]
+
+    def names(self, page):
+        """ Return the station names of a page"""
+        return [edge['node']['station']['name'] for edge in page['edges']]
+
+    def test_pages_cover_every_price(self):
+        """ Following endCursor visits every price once, in order"""
+        names, after = [], None
+        while True:
+            page, _ = self.page(first=3, after=after)
+            names += self.names(page)
+            if not page['pageInfo']['hasNextPage']:
+                break
+            after = page['pageInfo']['endCursor']
+        self.assertEqual(names, [f'Station {i}' for i in range(10)])
+
+    def test_no_offset_nor_count(self):
+        """ A deep page is a single query without OFFSET nor COUNT"""
+        first_page, _ = self.page(first=8)
+        _, queries = self.page(first=3, after=first_page['pageInfo']['endCursor'])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('OFFSET', queries[0])
+        self.assertNotIn('COUNT', queries[0])
+
+    def test_backward(self):
+        """ last and before page towards the start"""
+        page, _ = self.page(last=3)
+        self.assertEqual(self.names(page), ['Station 7', 'Station 8', 'Station 9'])
+        page, _ = self.page(last=3, before=page['pageInfo']['startCursor'])
+        self.assertEqual(self.names(page), ['Station 4', 'Station 5', 'Station 6'])
+        self.assertTrue(page['pageInfo']['hasPreviousPage'])
+
+    def test_page_sizes(self):
+        """ A size of 0 selects an empty page and negative sizes are errors"""
+        for size in ('first', 'last'):
+            page, _ = self.page(**{size: 0})
+            self.assertEqual(page['edges'], [])
+
+            with self.assertLogs('graphql.execution', 'ERROR'):
+                result = schema.execute(KEYSET_QUERY, variables={size: -1},
+                                        context_value=RequestFactory().post('/graphql'))
+            self.assertIsNone(result.data['allPricesKeyset'])
+            self.assertIn('non-negative', result.errors[0].message)
+
+
+class CurrentPriceTestCase(TestCase):
+    """ Current prices follow the writes to Price"""
+
+    def setUp(self):
+        create_prices(3)
+        self.station = Station.objects.get(register='PL/0')
+
+    def test_latest_price_is_current(self):
+        """ A newer price replaces the current one"""
+        Price.objects.create(station=self.station, gas_type='regular', price=21.9)
+        current = CurrentPrice.objects.get(station=self.station, gas_type='regular')
+        self.assertEqual(current.price, 21.9)
+        self.assertEqual(CurrentPrice.objects.count(), 3)
+
+    def test_older_price_is_ignored(self):
+        """ Saving an older price keeps the current one"""
+        old = Price.objects.create(station=self.station, gas_type='regular', price=18.0)
+        Price.objects.create(station=self.station, gas_type='regular', price=21.9)
+        old.save()
+        current = CurrentPrice.objects.get(station=self.station, gas_type='regular')
+        self.assertEqual(current.price, 21.9)
+
+    def test_delete_restores_previous(self):
+        """ Deleting the current price falls back to the previous one"""
+        Price.objects.create(station=self.station, gas_type='regular', price=21.9).delete()
+        current = CurrentPrice.objects.get(station=self.station, gas_type='regular')
+        self.assertEqual(current.price, 20.5)
+
+    def test_station_current_prices(self):
+        """ Station.currentPrices reads the current prices in one query"""
+        Price.objects.create(station=self.station, gas_type='diesel', price=22.1)
+        query = '''{
+            allStationsKeyset(first: 10) {
+                edges { node { name currentPrices { gasType price } } }
+            }
+        }'''
+        with CaptureQueriesContext(connection) as queries:
+            result = schema.execute(query, context_value=RequestFactory().post('/graphql'))
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(queries), 2)
+        prices = result.data['allStationsKeyset']['edges'][0]['node']['currentPrices']
+        self.assertEqual(sorted(price['gasType'] for price in prices), ['DIESEL', 'REGULAR'])
+
+    def test_latest_prices(self):
+        """ latestPrices filters the current prices by gas type"""
+        query = '''{
+            latestPrices(gasType: "regular") { edges { node { price station { name } } } }
+        }'''
+        result = schema.execute(query, context_value=RequestFactory().post('/graphql'))
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(result.data['latestPrices']['edges']), 3)
+
+
+class StationsNearTestCase(TestCase):
+    """ stationsNear returns the stations within a radius, nearest first"""
+
+    NEAR_QUERY = '''{
+        stationsNear(lat: 19.4326, lon: -99.1332, radiusKm: 5) {
+            distanceKm
+            station { name currentPrices { price } }
+        }
+    }'''
+
+    def setUp(self):
+        for name, latitude, longitude in [('Zocalo', 19.4326, -99.1332),
+                                          ('Reforma', 19.4270, -99.1677),
+                                          ('Toluca', 19.2826, -99.6557)]:
+            station = Station.objects.create(name=name, register=name, latitude=latitude,
+                                             longitude=longitude, is_active=True)
+            Price.objects.create(station=station, gas_type='regular', price=20.5)
+
+    def test_grid_cell_is_set(self):
+        """ Saving a station places it in its grid cell"""
+        station = Station.objects.get(name='Zocalo')
+        self.assertEqual(station.grid_cell, grid_cell(19.4326, -99.1332))
+
+    def test_nearest_first(self):
+        """ Stations are ordered by distance and filtered by radius"""
+        result = schema.execute(self.NEAR_QUERY, context_value=RequestFactory().post('/graphql'))
+        self.assertIsNone(result.errors)
+        near = result.data['stationsNear']
+        self.assertEqual([item['station']['name'] for item in near], ['Zocalo', 'Reforma'])
+        self.assertEqual(near[0]['distanceKm'], 0)
+        self.assertAlmostEqual(near[1]['distanceKm'], 3.67, places=1)
+        self.assertEqual(near[1]['station']['currentPrices'], [{'price': 20.5}])
+
+    def test_cells_cover_radius(self):
+        """ The grid cells around a location contain every station in the radius"""
+        cells = cells_within(19.4326, -99.1332, 5)
+        self.assertIn(grid_cell(19.4270, -99.1677), cells)
+        self.assertNotIn(grid_cell(19.2826, -99.6557), cells)
+
+    def test_negative_first(self):
+        """ A negative first is rejected like the page sizes of connections"""
+        with self.assertLogs('graphql.execution', 'ERROR'):
+            result = schema.execute(
+                '{ stationsNear(lat: 19.4, lon: -99.1, first: -1) { distanceKm } }',
+                context_value=RequestFactory().post('/graphql'))
+        self.assertIn('non-negative', result.errors[0].message)
+
+
+class CheapestStationsTestCase(TestCase):
+    """ cheapestStations ranks the current prices of an area"""
+
+    CHEAPEST_QUERY = '''
+    query ($state: String, $town: String, $bbox: BoundingBoxInput) {
+        cheapestStations(gasType: "premium", state: $state, town: $town, bbox: $bbox,
+                         first: 2) {
+            price
+            station { name }
+        }
+    }
+    '''
+
+    def setUp(self):
+        for name, town, latitude, price in [('Centro', 'Zapopan', 20.72, 22.9),
+                                            ('Norte', 'Zapopan', 20.75, 21.5),
+                                            ('Sur', 'Guadalajara', 20.65, 20.1),
+                                            ('Poniente', 'Zapopan', 20.70, 22.1)]:
+            station = Station.objects.create(name=name, register=name, town=town,
+                                             state='Jalisco', latitude=latitude,
+                                             longitude=-103.4, is_active=True)
+            Price.objects.create(station=station, gas_type='premium', price=price)
+            Price.objects.create(station=station, gas_type='regular', price=price - 2)
+
+    def cheapest(self, **variables):
+        """ Return the names of the cheapest stations for variables"""
+        result = schema.execute(self.CHEAPEST_QUERY, variables=variables,
+                                context_value=RequestFactory().post('/graphql'))
+        self.assertIsNone(result.errors)
+        return [item['station']['name'] for item in result.data['cheapestStations']]
+
+    def test_town_ranking(self):
+        """ The first stations of a town are its cheapest"""
+        self.assertEqual(self.cheapest(town='Zapopan'), ['Norte', 'Poniente'])
+        self.assertEqual(self.cheapest(state='Jalisco'), ['Sur', 'Norte'])
+
+    def test_bbox_ranking(self):
+        """ A bounding box ranks only the stations inside it"""
+        bbox = {'minLat': 20.69, 'minLon': -103.5, 'maxLat': 20.73, 'maxLon': -103.3}
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.cheapest(bbox=bbox), ['Poniente', 'Centro'])
+        # The box is read from the cells and coordinates of the current prices
+        ranking = queries[0]['sql']
+        self.assertIn('"gasoline_currentprice"."grid_cell" IN', ranking)
+        self.assertNotIn('"gasoline_station"."latitude"', ranking)
+
+        station = Station.objects.get(name='Sur')
+        station.latitude = 20.71
+        station.save()
+        self.assertEqual(self.cheapest(bbox=bbox), ['Sur', 'Poniente'])
+
+    def test_ranking_follows_changes(self):
+        """ New prices and moved stations update the ranking"""
+        Price.objects.create(station=Station.objects.get(name='Centro'), gas_type='premium',
+                             price=19.9)
+        station = Station.objects.get(name='Sur')
+        station.town = 'Zapopan'
+        station.save()
+        self.assertEqual(self.cheapest(town='Zapopan'), ['Centro', 'Sur'])
+
+    def test_negative_first(self):
+        """ A negative first is rejected like the page sizes of connections"""
+        with self.assertLogs('graphql.execution', 'ERROR'):
+            result = schema.execute(
+                '{ cheapestStations(gasType: "premium", first: -1) { price } }',
+                context_value=RequestFactory().post('/graphql'))
+        self.assertIn('non-negative', result.errors[0].message)
+
+
+class ResponseCacheTestCase(TestCase):
+    """ Anonymous queries are cached until the data version changes"""
+
+    def setUp(self):
+        get_cache().clear()
+        create_prices(2)
+
+    def post(self, query, **headers):
+        """ Return the response of query posted to the GraphQL endpoint"""
+        return self.client.post('/graphql', {'query': query}, content_type='application/json',
+                                **headers)
+
+    def test_repeated_query_is_cached(self):
+        """ The same document, formatted differently, is served from the cache"""
+        first = self.post('{ allStations { edges { node { name } } } }')
+        with CaptureQueriesContext(connection) as queries:
+            second = self.post('{\n  allStations {\n    edges { node { name } }\n  }\n}')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+        # Only the data version is read
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(cache_stats()['hit_ratio'], 0.5)
+
+    def test_stats_need_a_shared_cache(self):
+        """ The statistics of a process-local cache are not read from another process"""
+        with self.assertRaisesMessage(CommandError, 'local to each process'):
+            call_command('graphql_cache')
+
+    def test_writes_invalidate(self):
+        """ Saving a price bumps the data version and misses the cache"""
+        query = '{ allPrices { edges { node { price } } } }'
+        self.post(query)
+        Price.objects.create(station=Station.objects.first(), gas_type='diesel', price=22.0)
+        run_commit_hooks()
+        response = self.post(query)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json()['data']['allPrices']['edges']), 3)
+
+    def test_transaction_bumps_once(self):
+        """ A transaction bumps the version once, whatever it writes, and
+        logins do not bump it"""
+        run_commit_hooks()
+        version = DataVersion.current()
+        station = Station.objects.first()
+        for price in (20.0, 21.0, 22.0):
+            Price.objects.create(station=station, gas_type='diesel', price=price)
+        station.delete()
+        self.assertEqual(DataVersion.current(), version)
+        run_commit_hooks()
+        self.assertEqual(DataVersion.current(), version + 1)
+
+        self.client.force_login(User.objects.create_user('user', password='secret'))
+        run_commit_hooks()
+        version = DataVersion.current()
+        self.client.logout()
+        self.client.force_login(User.objects.get(username='user'))
+        run_commit_hooks()
+        self.assertEqual(DataVersion.current(), version)
+
+    def test_authenticated_and_mutations_skip_cache(self):
+        """ Requests with credentials and mutations are never cached"""
+        view = CachedGraphQLView()
+        request = RequestFactory().post('/graphql', HTTP_AUTHORIZATION='JWT token')
+        self.assertIsNone(view.get_cache_key(request, '{ allStations { edges { cursor } } }',
+                                             None, None))
+        request = RequestFactory().post('/graphql')
+        self.assertIsNone(view.get_cache_key(request, 'mutation { tokenAuth { token } }',
+                                             None, None))
+
+        self.client.force_login(User.objects.create_user('user', password='secret'),
+                                backend='django.contrib.auth.backends.ModelBackend')
+        response = self.post('{ allStations { edges { node { name } } } }')
+        self.assertFalse(response.has_header('X-Cache'))
+
+
+class DocumentCacheTestCase(TestCase):
+    """ Documents are parsed once and persisted queries are sent by hash"""
+
+    def setUp(self):
+        get_cache().clear()
+        create_prices(2)
+
+    def post(self, body):
+        """ Return the response of body posted to the GraphQL endpoint"""
+        return self.client.post('/graphql', body, content_type='application/json')
+
+    def test_document_is_reused(self):
+        """ The second request with a document skips parsing and validation"""
+        query = 'query ($first: Int) { allStations(first: $first) { edges { cursor } } }'
+        first = self.post({'query': query, 'variables': {'first': 1}})
+        second = self.post({'query': query, 'variables': {'first': 2}})
+        self.assertIn('document;desc=new', first['Server-Timing'])
+        self.assertIn('parse;dur=0.000, validate;dur=0.000, document;desc=cached',
+                      second['Server-Timing'])
+        self.assertEqual(len(second.json()['data']['allStations']['edges']), 2)
+
+    def test_persisted_query(self):
+        """ A registered document is executed from its hash"""
+        text, = [text for text in persisted_queries().values() if 'stationsNear' in text]
+        sha256_hash = hashlib.sha256(text.encode()).hexdigest()
+        response = self.post({
+            'variables': {'lat': 19.4, 'lon': -99.1},
+            'extensions': {'persistedQuery': {'version': 1, 'sha256Hash': sha256_hash}},
+        })
+        self.assertEqual(len(response.json()['data']['stationsNear']), 2)
+
+        response = self.post({'extensions': {'persistedQuery': {'sha256Hash': 'unknown'}}})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['message'], 'PersistedQueryNotFound')
+
+
+class QueryCostTestCase(TestCase):
+    """ Operations are priced before execution and rejected over the limits"""
+
+    def setUp(self):
+        get_cache().clear()
+        create_prices(2)
+
+    def cost(self, query, **variables):
+        """ Return the QueryCost of query"""
+        return CostAnalyzer(schema, parse(query), variables).analyze()
+
+    def test_page_sizes(self):
+        """ Connections cost their page size times their nodes, capped at the maximum"""
+        query = '''query ($first: Int) {
+            allPrices(first: $first) { edges { node { price station { name } } } }
+        }'''
+        self.assertEqual(self.cost(query, first=10), QueryCost(complexity=31, depth=5))
+        self.assertEqual(self.cost(query, first=1000), QueryCost(complexity=301, depth=5))
+        self.assertEqual(self.cost(query), QueryCost(complexity=301, depth=5))
+
+    def test_over_budget_is_rejected(self):
+        """ Nested connections over the depth limit are not executed"""
+        query = '''{ allStations { edges { node { priceSet { edges { node {
+            station { priceSet { edges { node { price } } } }
+        } } } } } } }'''
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/graphql', {'query': query},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exceeds the maximum depth', response.json()['errors'][0]['message'])
+        self.assertEqual(len(queries), 1)
+
+    def test_negative_sizes_are_rejected(self):
+        """ A negative page size cannot lower the cost of the other fields"""
+        query = '''{
+            a: stationsNear(lat: 19.4, lon: -99.1, first: -1000000) { station { name } }
+            c: allStations(first: 100) { edges { node { name
+                priceSet(first: 100) { edges { node { price } } } } } }
+        }'''
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/graphql', {'query': query},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('must be a non-negative integer', response.json()['errors'][0]['message'])
+        self.assertEqual(len(queries), 1)
+
+    def test_cost_is_reported(self):
+        """ Executed operations report their cost next to their execution time"""
+        response = self.client.post('/graphql', {'query': '{ allStations { edges { cursor } } }'},
+                                    content_type='application/json')
+        self.assertEqual(len(response.json()['data']['allStations']['edges']), 2)
+        self.assertIn('cost;desc=101', response['Server-Timing'])
+
+
+class SearchStationsTestCase(TestCase):
+    """ searchStations matches names, towns and states without accents"""
+
+    SEARCH_QUERY = '''
+    query ($text: String!) {
+        searchStations(text: $text) { name town }
+    }
+    '''
+
+    def setUp(self):
+        for name, town, state in [('Gasolinera Texcoco', 'Nezahualcóyotl', 'México'),
+                                  ('Servicio Ecatepec', 'Ecatepec de Morelos', 'México'),
+                                  ('Gasolinera Álamo', 'Zapopan', 'Jalisco')]:
+            Station.objects.create(name=name, register=name, town=town, state=state,
+                                   latitude=19.4, longitude=-99.1, is_active=True)
+
+    def search(self, text):
+        """ Return the names of the stations found by text"""
+        result = schema.execute(self.SEARCH_QUERY, variables={'text': text},
+                                context_value=RequestFactory().post('/graphql'))
+        self.assertIsNone(result.errors)
+        return [station['name'] for station in result.data['searchStations']]
+
+    def test_search_text_is_normalized(self):
+        """ The search text drops accents, case and repeated spaces"""
+        station = Station.objects.get(register='Gasolinera Álamo')
+        self.assertEqual(station.search_text, 'gasolinera alamo zapopan jalisco')
+
+    def test_accent_insensitive(self):
+        """ Accented and plain spellings find the same stations"""
+        self.assertEqual(self.search('NEZAHUALCOYOTL'), ['Gasolinera Texcoco'])
+        self.assertEqual(self.search('álamo'), ['Gasolinera Álamo'])
+
+    def test_every_word_matches(self):
+        """ Stations match every word, in any field"""
+        self.assertEqual(self.search('gasolinera méxico'), ['Gasolinera Texcoco'])
+        self.assertEqual(self.search('mexico'), ['Gasolinera Texcoco', 'Servicio Ecatepec'])
+        self.assertEqual(self.search('ga'), [])
+
+    def test_negative_first(self):
+        """ A negative first is rejected like the page sizes of connections"""
+        with self.assertLogs('graphql.execution', 'ERROR'):
+            result = schema.execute('{ searchStations(text: "abc", first: -1) { name } }',
+                                    context_value=RequestFactory().post('/graphql'))
+        self.assertIn('non-negative', result.errors[0].message)
+
+
+class NumericFiltersTestCase(TestCase):
+    """ Coordinates and prices are filtered by numeric ranges on indexes"""
+
+    def setUp(self):
+        for name, latitude, price in [('Norte', 20.75, 21.5), ('Centro', 20.70, 20.4),
+                                      ('Sur', 20.60, 19.9)]:
+            station = Station.objects.create(name=name, register=name, latitude=latitude,
+                                             longitude=-103.4, is_active=True)
+            Price.objects.create(station=station, gas_type='regular', price=price)
+            Price.objects.create(station=station, gas_type='premium', price=price + 2)
+
+    def names(self, query, field):
+        """ Return the station names of the nodes of field in the result of query"""
+        result = schema.execute(query, context_value=RequestFactory().post('/graphql'))
+        self.assertIsNone(result.errors)
+        return sorted(edge['node'].get('name') or edge['node']['station']['name']
+                      for edge in result.data[field]['edges'])
+
+    def test_coordinate_filters(self):
+        """ Stations are filtered by latitude bounds and by bounding box"""
+        self.assertEqual(self.names('''{
+            nodeStation(latitude_Gte: 20.65, latitude_Lte: 20.72) { edges { node { name } } }
+        }''', 'nodeStation'), ['Centro'])
+        self.assertEqual(self.names('''{
+            nodeStation(bbox: "20.65,-103.5,20.8,-103.3") { edges { node { name } } }
+        }''', 'nodeStation'), ['Centro', 'Norte'])
+        self.assertEqual(self.names('''{
+            nodeStation(latitude_Range: "20.65,20.8", longitude_Range: "-103.5,-103.3") {
+                edges { node { name } }
+            }
+        }''', 'nodeStation'), ['Centro', 'Norte'])
+        self.assertEqual(self.names('''{
+            nodeStation(latitude_Istartswith: 20.7) { edges { node { name } } }
+        }''', 'nodeStation'), ['Centro', 'Norte'])
+
+    def test_price_band(self):
+        """ Prices of a gas type are filtered by a price band"""
+        self.assertEqual(self.names('''{
+            nodePrice(gasType: "regular", price_Gte: 20, price_Lte: 21) {
+                edges { node { station { name } } }
+            }
+        }''', 'nodePrice'), ['Centro'])
+        self.assertEqual(self.names('''{
+            nodePrice(gasType: "regular", price_Range: "19,21") {
+                edges { node { station { name } } }
+            }
+        }''', 'nodePrice'), ['Centro', 'Sur'])
+        self.assertEqual(self.names('''{
+            nodePrice(gasType: "regular", price_Istartswith: 21.5) {
+                edges { node { station { name } } }
+            }
+        }''', 'nodePrice'), ['Norte'])
+
+    def test_invalid_range(self):
+        """ Ranges without two numeric bounds are rejected"""
+        with self.assertLogs('graphql.execution', 'ERROR'):
+            result = schema.execute('''{
+                nodePrice(price_Range: "20") { edges { node { price } } }
+            }''', context_value=RequestFactory().post('/graphql'))
+        self.assertEqual(result.errors[0].message, 'range must be min,max')
+
+    def test_query_plans_use_indexes(self):
+        """ The range filters and the price history are read from their indexes"""
+        station = Station.objects.first()
+        plans = {
+            'station_lat_lon_idx': Station.objects.filter(
+                latitude__range=(20.65, 20.8), longitude__range=(-103.5, -103.3)),
+            'price_gas_type_price_idx': Price.objects.filter(
+                gas_type='regular', price__gte=20, price__lte=21),
+            'price_station_gas_date_idx': Price.objects.filter(
+                station=station, gas_type='regular').order_by('-date'),
+        }
+        for index, queryset in plans.items():
+            self.assertIn(index, queryset.explain())
+
+
+class PriceHistoryTestCase(TestCase):
+    """ Price history is read from rollups kept in sync with the prices"""
+
+    QUERY = '''
+    query ($stationId: ID!, $bucket: PriceBucket, $from: DateTime!, $to: DateTime!) {
+        priceHistory(stationId: $stationId, gasType: "regular", from: $from, to: $to,
+                     bucket: $bucket) {
+            start minPrice maxPrice avgPrice lastPrice priceCount
+        }
+    }
+    '''
+
+    def setUp(self):
+        self.station = Station.objects.create(name='Centro', register='PL/1',
+                                              latitude=19.4, longitude=-99.1, is_active=True)
+        self.station_id = to_global_id('StationNode', self.station.id)
+        self.prices = []
+        for date, price in [('2020-11-02T10:15:00Z', 20.0), ('2020-11-02T10:45:00Z', 21.0),
+                            ('2020-11-03T09:00:00Z', 19.5)]:
+            # Dates are set on creation, they are moved by saving again
+            created = Price.objects.create(station=self.station, gas_type='regular', price=price)
+            created.date = parse_datetime(date)
+            created.save()
+            self.prices.append(created)
+        run_commit_hooks()
+
+    def history(self, bucket, start='2020-11-01T00:00:00Z', end='2020-11-08T00:00:00Z'):
+        """ Return the price history of the station by bucket"""
+        result = schema.execute(self.QUERY, variables={
+            'stationId': self.station_id, 'bucket': bucket, 'from': start, 'to': end})
+        self.assertIsNone(result.errors)
+        return result.data['priceHistory']
+
+    def test_buckets(self):
+        """ Every bucket holds the min, max, average and last of its prices"""
+        self.assertEqual(self.history('DAY'), [
+            {'start': '2020-11-02T00:00:00+00:00', 'minPrice': 20.0, 'maxPrice': 21.0,
+             'avgPrice': 20.5, 'lastPrice': 21.0, 'priceCount': 2},
+            {'start': '2020-11-03T00:00:00+00:00', 'minPrice': 19.5, 'maxPrice': 19.5,
+             'avgPrice': 19.5, 'lastPrice': 19.5, 'priceCount': 1},
+        ])
+        self.assertEqual(self.history('WEEK'), [
+            {'start': '2020-11-02T00:00:00+00:00', 'minPrice': 19.5, 'maxPrice': 21.0,
+             'avgPrice': 20.166666666666668, 'lastPrice': 19.5, 'priceCount': 3},
+        ])
+        self.assertEqual([bucket['start'] for bucket in self.history('HOUR')],
+                         ['2020-11-02T10:00:00+00:00', '2020-11-03T09:00:00+00:00'])
+        # Moved prices left no rollups behind
+        self.assertEqual(PriceRollup.objects.count(), 2 + 1 + 2)
+
+    def test_rollups_follow_changes(self):
+        """ Deleted prices leave the rollups of their buckets"""
+        self.prices[1].delete()
+        run_commit_hooks()
+        self.assertEqual(self.history('DAY')[0]['maxPrice'], 20.0)
+        self.prices[2].delete()
+        run_commit_hooks()
+        self.assertEqual(len(self.history('WEEK')), 1)
+        self.assertEqual(len(self.history('DAY')), 1)
+
+    def test_writes_refresh_each_bucket_once(self):
+        """ Prices written in one transaction refresh their buckets once, and
+        the prices of deleted stations none"""
+        with CaptureQueriesContext(connection) as queries:
+            for price in range(10):
+                Price.objects.create(station=self.station, gas_type='regular', price=price)
+        with CaptureQueriesContext(connection) as refresh:
+            run_commit_hooks()
+        self.assertEqual(sum('gasoline_pricerollup' in query['sql'] for query in queries), 0)
+        # One aggregate for each of the three buckets
+        self.assertEqual(sum('SUM("gasoline_price"."price")' in query['sql']
+                             for query in refresh), 3)
+
+        self.station.delete()
+        with CaptureQueriesContext(connection) as refresh:
+            run_commit_hooks()
+        self.assertEqual(sum('gasoline_price"' in query['sql'] for query in refresh), 0)
+        self.assertFalse(PriceRollup.objects.exists())
+
+    def test_long_ranges_are_rejected(self):
+        """ Ranges over the bucket limit must use longer buckets"""
+        with self.assertLogs('graphql.execution', 'ERROR'):
+            result = schema.execute(self.QUERY, variables={
+                'stationId': self.station_id, 'bucket': 'HOUR',
+                'from': '2020-01-01T00:00:00Z', 'to': '2021-01-01T00:00:00Z'})
+        self.assertIn('limited to', result.errors[0].message)
+        self.assertEqual(len(self.history('DAY', '2020-01-01T00:00:00Z',
+                                          '2021-01-01T00:00:00Z')), 2)
+
+    def test_station_ids_are_global(self):
+        """ stationId is the global id of a StationNode"""
+        price_id = to_global_id('PriceNode', self.prices[0].id)
+        for station_id in (str(self.station.id), price_id):
+            with self.assertLogs('graphql.execution', 'ERROR'):
+                result = schema.execute(self.QUERY, variables={
+                    'stationId': station_id, 'from': '2020-11-01T00:00:00Z',
+                    'to': '2020-11-08T00:00:00Z'})
+            self.assertIn('StationNode', result.errors[0].message)
+
+
+class AreaPriceStatsTestCase(TestCase):
+    """ Area statistics are precomputed from the current prices"""
+
+    QUERY = '''
+    query ($level: AreaLevel!, $state: String) {
+        areaPriceStats(level: $level, gasType: "regular", state: $state) {
+            state town stationCount avgPrice minPrice maxPrice medianPrice p90Price
+        }
+    }
+    '''
+
+    def setUp(self):
+        self.stations = {}
+        for name, state, town, price in [('Centro', 'Jalisco', 'Guadalajara', 20.0),
+                                         ('Norte', 'Jalisco', 'Guadalajara', 21.0),
+                                         ('Lago', 'Jalisco', 'Chapala', 22.0),
+                                         ('Puerto', 'Colima', 'Manzanillo', 19.0)]:
+            station = Station.objects.create(name=name, register=name, state=state, town=town,
+                                             latitude=20.6, longitude=-103.4, is_active=True)
+            Price.objects.create(station=station, gas_type='regular', price=price)
+            self.stations[name] = station
+        run_commit_hooks()
+
+    def stats(self, level, state=None):
+        """ Return the statistics of the areas of a level"""
+        result = schema.execute(self.QUERY, variables={'level': level, 'state': state})
+        self.assertIsNone(result.errors)
+        return result.data['areaPriceStats']
+
+    def test_state_and_town_stats(self):
+        """ Areas hold the count, average, extremes and percentiles of their prices"""
+        self.assertEqual(self.stats('STATE'), [
+            {'state': 'Colima', 'town': None, 'stationCount': 1, 'avgPrice': 19.0,
+             'minPrice': 19.0, 'maxPrice': 19.0, 'medianPrice': 19.0, 'p90Price': 19.0},
+            {'state': 'Jalisco', 'town': None, 'stationCount': 3, 'avgPrice': 21.0,
+             'minPrice': 20.0, 'maxPrice': 22.0, 'medianPrice': 21.0, 'p90Price': 21.8},
+        ])
+        self.assertEqual([(area['town'], area['stationCount'])
+                          for area in self.stats('TOWN', 'Jalisco')],
+                         [('Chapala', 1), ('Guadalajara', 2)])
+
+    def test_stats_follow_changes(self):
+        """ New prices and stations that move refresh the areas they touch"""
+        Price.objects.create(station=self.stations['Centro'], gas_type='regular', price=23.0)
+        run_commit_hooks()
+        self.assertEqual(self.stats('TOWN', 'Jalisco')[1]['minPrice'], 21.0)
+
+        station = self.stations['Lago']
+        station.state, station.town = 'Colima', 'Colima'
+        station.save()
+        run_commit_hooks()
+        self.assertEqual([(area['state'], area['stationCount']) for area in self.stats('STATE')],
+                         [('Colima', 2), ('Jalisco', 2)])
+        self.assertFalse(AreaPriceStats.objects.filter(town='Chapala').exists())
+
+    def test_cascades_refresh_once(self):
+        """ Deleting a station with many prices refreshes its areas once"""
+        station = self.stations['Lago']
+        for price in range(20):
+            Price.objects.create(station=station, gas_type='regular', price=20 + price / 10)
+        run_commit_hooks()
+
+        station.delete()
+        with CaptureQueriesContext(connection) as queries:
+            run_commit_hooks()
+        # Once per area and gas type, not once per deleted price
+        self.assertLess(len(queries), 20)
+        self.assertEqual([(area['town'], area['stationCount'])
+                          for area in self.stats('TOWN', 'Jalisco')], [('Guadalajara', 2)])
+
+    def test_stats_are_read_in_one_query(self):
+        """ Responses read the summary rows only"""
+        with CaptureQueriesContext(connection) as queries:
+            self.stats('TOWN')
+        self.assertEqual(len(queries), 1)
@@ -0,0 +1,148 @@
+""" Query cost analysis OilApp """
+
+# Python
+from collections import namedtuple
+
+# Django
+from django.conf import settings
+
+# Graphene
+from graphene_django.settings import graphene_settings
+from graphql.language.ast import FragmentDefinition, FragmentSpread, InlineFragment, \
+    OperationDefinition
+from graphql.type.definition import GraphQLList, GraphQLObjectType, GraphQLNonNull, \
+    get_named_type
+from graphql.utils.value_from_ast import value_from_ast
+
+# Pagination
+from oilApp.pagination import check_page_size
+
+QueryCost = namedtuple('QueryCost', ['complexity', 'depth'])
+
+
+def is_list(graphql_type):
+    """ Return whether graphql_type is a list, required or not"""
+    if isinstance(graphql_type, GraphQLNonNull):
+        graphql_type = graphql_type.of_type
+    return isinstance(graphql_type, GraphQLList)
+
+
+def is_connection(graphql_type):
+    """ Return whether graphql_type is a Relay connection"""
+    return isinstance(graphql_type, GraphQLObjectType) and \
+        'edges' in graphql_type.fields and 'pageInfo' in graphql_type.fields
+
+
+class CostAnalyzer:
+    """ Static estimate of the cost of an operation, before executing it
+
+    Every field costs its weight, from GRAPHQL_COST['FIELD_WEIGHTS'] or 1 for
+    objects and 0 for scalars, plus the cost of its selection times the
+    number of items it returns: the first or last argument of connections and
+    lists, capped at RELAY_CONNECTION_MAX_LIMIT, RELAY_CONNECTION_MAX_LIMIT
+    for connections without them and DEFAULT_LIST_SIZE for other lists.
+    Negative first and last arguments are rejected with a GraphQLError, as
+    their fields would, before they lower the cost. Introspection fields are
+    free.
+    """
+    def __init__(self, schema, document_ast, variables=None):
+        self.schema = schema
+        self.variables = variables or {}
+        self.fragments = {definition.name.value: definition
+                          for definition in document_ast.definitions
+                          if isinstance(definition, FragmentDefinition)}
+        self.operations = [definition for definition in document_ast.definitions
+                           if isinstance(definition, OperationDefinition)]
+        self.weights = settings.GRAPHQL_COST['FIELD_WEIGHTS']
+        self.list_size = settings.GRAPHQL_COST['DEFAULT_LIST_SIZE']
+        self.max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+
+    def analyze(self, operation_name=None):
+        """ Return the QueryCost of the operation operation_name"""
+        for operation in self.operations:
+            name = operation.name.value if operation.name else None
+            if operation_name is None or name == operation_name:
+                root = {
+                    'query': self.schema.get_query_type(),
+                    'mutation': self.schema.get_mutation_type(),
+                }.get(operation.operation)
+                if root is None:
+                    break
+                return QueryCost(*self.selection_cost(root, operation.selection_set, 0))
+        return QueryCost(0, 0)
+
+    def selection_cost(self, parent_type, selection_set, depth):
+        """ Return the complexity and the depth of selection_set on parent_type"""
+        complexity, max_depth = 0, depth
+
+        for selection in selection_set.selections:
+            if isinstance(selection, (FragmentSpread, InlineFragment)):
+                fragment = self.fragments[selection.name.value] \
+                    if isinstance(selection, FragmentSpread) else selection
+                fragment_type = parent_type if fragment.type_condition is None else \
+                    self.schema.get_type(fragment.type_condition.name.value)
+                fragment_complexity, fragment_depth = self.selection_cost(
+                    fragment_type, fragment.selection_set, depth)
+                complexity += fragment_complexity
+                max_depth = max(max_depth, fragment_depth)
+                continue
+
+            name = selection.name.value
+            field = getattr(parent_type, 'fields', {}).get(name)
+            if name.startswith('__') or field is None:
+                continue
+
+            field_type = get_named_type(field.type)
+            weight = self.weights.get(f'{parent_type.name}.{name}',
+                                      0 if selection.selection_set is None else 1)
+            if selection.selection_set is None:
+                complexity += weight
+                max_depth = max(max_depth, depth + 1)
+                continue
+
+            nested_complexity, nested_depth = self.selection_cost(
+                field_type, selection.selection_set, depth + 1)
+            size = self.size(parent_type, selection, field, field_type)
+            complexity += weight + size * nested_complexity
+            max_depth = max(max_depth, nested_depth)
+
+        return complexity, max_depth
+
+    def size(self, parent_type, selection, field, field_type):
+        """ Return the number of items the field selection can return"""
+        if is_connection(parent_type):
+            # Edges are already counted by the size of their connection
+            return 1
+        if not is_connection(field_type) and not is_list(field.type):
+            return 1
+
+        args = {'first': self.argument(selection, field, 'first'),
+                'last': self.argument(selection, field, 'last')}
+        check_page_size(args)
+        limits = [value for value in args.values() if value is not None]
+        if limits:
+            return min(min(limits), self.max_limit)
+        return self.max_limit if is_connection(field_type) else self.list_size
+
+    def argument(self, selection, field, name):
+        """ Return the value of the argument name of a field selection"""
+        definition = field.args.get(name)
+        if definition is None:
+            return None
+
+        for argument in selection.arguments:
+            if argument.name.value == name:
+                return value_from_ast(argument.value, definition.type, self.variables)
+        return definition.default_value
+
+
+def check_cost(cost):
+    """ Return the error message of cost when it is over the limits of
+    GRAPHQL_COST, or None"""
+    limits = settings.GRAPHQL_COST
+    if cost.depth > limits['MAX_DEPTH']:
+        return f'Query depth {cost.depth} exceeds the maximum depth of {limits["MAX_DEPTH"]}'
+    if cost.complexity > limits['MAX_COMPLEXITY']:
+        return (f'Query complexity {cost.complexity} exceeds the maximum complexity of '
+                f'{limits["MAX_COMPLEXITY"]}')
+    return None
@@ -0,0 +1,141 @@
+""" GraphQL documents OilApp """
+
+# Python
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache, partial
+from pathlib import Path
+from timeit import default_timer as timer
+
+# Django
+from django.conf import settings
+
+# Graphene
+from graphql.backend.base import GraphQLDocument
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.error import GraphQLError
+from graphql.execution import ExecutionResult, execute
+from graphql.language.base import parse, print_ast
+from graphql.validation import validate
+
+# Cost
+from oilApp.cost import CostAnalyzer, check_cost
+
+logger = logging.getLogger(__name__)
+
+
+def execute_validated(validation_errors, schema, document_ast, *args, **kwargs):
+    """ Execute a document validated beforehand, unless it was invalid or
+    its static cost is over the limits
+
+    The cost is logged next to the execution time and both are recorded in
+    the timings of the request.
+    """
+    if validation_errors:
+        return ExecutionResult(errors=validation_errors, invalid=True)
+
+    operation_name = kwargs.get('operation_name')
+    try:
+        cost = CostAnalyzer(schema, document_ast, kwargs.get('variable_values')) \
+            .analyze(operation_name)
+        error = check_cost(cost)
+    except GraphQLError as invalid:
+        error = invalid.message
+    if error is not None:
+        logger.info('Rejected GraphQL operation %s: %s', operation_name, error)
+        return ExecutionResult(errors=[GraphQLError(error)], invalid=True)
+
+    start = timer()
+    result = execute(schema, document_ast, *args, **kwargs)
+    elapsed = (timer() - start) * 1000
+    logger.info('GraphQL operation %s complexity=%d depth=%d execution=%.1fms',
+                operation_name, cost.complexity, cost.depth, elapsed)
+
+    timings = getattr(kwargs.get('context_value'), 'graphql_timings', None)
+    if timings is not None:
+        timings.update(execute=elapsed, complexity=cost.complexity)
+    return result
+
+
+class DocumentCache:
+    """ Least recently used cache of parsed and validated documents
+
+    Documents are keyed by schema and query string. Validation runs once,
+    when the document is parsed, and its errors are kept with it.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.documents = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, schema, query, execute_params):
+        """ Return the document of query and the parse and validate timings
+        in ms of this call, which are zero when it was cached"""
+        key = (schema, query)
+        with self.lock:
+            document = self.documents.get(key)
+            if document is not None:
+                self.documents.move_to_end(key)
+                return document, {'parse': 0.0, 'validate': 0.0, 'cached': True}
+
+        start = timer()
+        document_ast = parse(query)
+        parsed = timer()
+        validation_errors = validate(schema, document_ast)
+        validated = timer()
+
+        document = GraphQLDocument(
+            schema=schema,
+            document_string=query,
+            document_ast=document_ast,
+            execute=partial(execute_validated, validation_errors, schema, document_ast,
+                            **execute_params),
+        )
+        # Formatting independent text, used to key the cached responses
+        document.normalized = print_ast(document_ast)
+
+        with self.lock:
+            self.documents[key] = document
+            while len(self.documents) > self.max_size:
+                self.documents.popitem(last=False)
+
+        return document, {'parse': (parsed - start) * 1000,
+                          'validate': (validated - parsed) * 1000, 'cached': False}
+
+
+documents = DocumentCache(settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
+
+
+class CachedDocumentBackend(GraphQLCoreBackend):
+    """ Backend that reads the documents of a request from the shared
+    DocumentCache, recording on the request the timings of its first
+    document"""
+    def __init__(self, request=None, executor=None):
+        super().__init__(executor=executor)
+        self.request = request
+
+    def document_from_string(self, schema, document_string):
+        """ Return the cached document of document_string"""
+        if not isinstance(document_string, str):
+            return super().document_from_string(schema, document_string)
+
+        document, timings = documents.get(schema, document_string, self.execute_params)
+        if self.request is not None and not hasattr(self.request, 'graphql_timings'):
+            self.request.graphql_timings = timings
+        return document
+
+
+@lru_cache(maxsize=None)
+def persisted_queries():
+    """ Return the registered documents keyed by the sha256 of their text
+
+    Documents are the .graphql files of GRAPHQL_PERSISTED_QUERIES_DIR, hashed
+    byte for byte as clients must hash them.
+    """
+    registry = {}
+    for path in sorted(Path(settings.GRAPHQL_PERSISTED_QUERIES_DIR).glob('*.graphql')):
+        text = path.read_text(encoding='utf-8')
+        registry[hashlib.sha256(text.encode('utf-8')).hexdigest()] = text
+    return registry
@@ -0,0 +1,85 @@
+""" DataLoaders OilApp """
+
+# Python
+from collections import defaultdict
+
+# Promise
+from promise import Promise
+from promise.dataloader import DataLoader
+
+
+class ModelLoader(DataLoader):
+    """ Loader of model instances by primary key
+
+    Collects the keys requested during a resolver tick and fetches them
+    with a single IN query. Loaded instances are cached by the loader.
+    """
+    def __init__(self, model, **kwargs):
+        super().__init__(**kwargs)
+        self.model = model
+
+    def batch_load_fn(self, keys):
+        """ Return the instances of keys, in the same order, in one query"""
+        instances = self.model.objects.in_bulk(keys)
+        return Promise.resolve([instances.get(key) for key in keys])
+
+
+class RelatedListLoader(DataLoader):
+    """ Loader of the model instances whose foreign key field points to each
+    key, in a single IN query"""
+    def __init__(self, model, field, **kwargs):
+        super().__init__(**kwargs)
+        self.model = model
+        self.attname = model._meta.get_field(field).attname
+
+    def batch_load_fn(self, keys):
+        """ Return the list of instances of each key, in the same order"""
+        groups = defaultdict(list)
+        for instance in self.model.objects.filter(**{f'{self.attname}__in': keys}):
+            groups[getattr(instance, self.attname)].append(instance)
+        return Promise.resolve([groups[key] for key in keys])
+
+
+def get_loader(info, model, field=None):
+    """ Return the loader of model for the current request, by primary key
+    or, given a foreign key field, by the object it points to
+
+    Loaders live on the request, so their cache is discarded with it.
+    """
+    loaders = getattr(info.context, 'loaders', None)
+    if loaders is None:
+        loaders = info.context.loaders = {}
+
+    if (model, field) not in loaders:
+        loaders[(model, field)] = ModelLoader(model) if field is None else \
+            RelatedListLoader(model, field)
+    return loaders[(model, field)]
+
+
+def load_related(info, instance, name):
+    """ Return the object of the foreign key name of instance
+
+    Objects already joined by select_related() are returned as they are,
+    otherwise they are batched through the loader of the related model.
+    """
+    field = instance._meta.get_field(name)
+    if field.is_cached(instance):
+        return getattr(instance, name)
+
+    key = getattr(instance, field.attname)
+    if key is None:
+        return None
+    return get_loader(info, field.related_model).load(key)
+
+
+def load_related_list(info, instance, name):
+    """ Return the objects of the reverse relation name of instance
+
+    Relations prefetched by prefetch_related() are returned as they are,
+    otherwise they are batched through a loader of the related model.
+    """
+    if name in getattr(instance, '_prefetched_objects_cache', {}):
+        return list(getattr(instance, name).all())
+
+    relation = getattr(type(instance), name).rel
+    return get_loader(info, relation.related_model, relation.field.name).load(instance.pk)
@@ -0,0 +1,147 @@
+""" Query optimizer OilApp """
+
+# Django
+from django.db.models import Prefetch
+
+# Graphene
+from graphene.utils.str_converters import to_snake_case
+from graphql.language.ast import FragmentSpread, InlineFragment
+
+
+def model_fields(model):
+    """ Return the fields of model keyed by the name graphene-django gives them
+
+    Reverse relations are keyed by their accessor name (price_set), like the
+    fields generated for them.
+    """
+    fields = {}
+    for field in model._meta.get_fields():
+        if field.auto_created and not field.concrete:
+            fields[field.get_accessor_name()] = field
+        else:
+            fields[field.name] = field
+    return fields
+
+
+def fragment_applies(info, fragment, model):
+    """ Return whether the type condition of fragment can match model"""
+    if fragment.type_condition is None:
+        return True
+
+    graphql_type = info.schema.get_type(fragment.type_condition.name.value)
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    fragment_model = getattr(getattr(graphene_type, '_meta', None), 'model', None)
+    return fragment_model is None or fragment_model is model
+
+
+def get_selections(info, selection_set, model):
+    """ Return the fields of selection_set, expanding the fragments that
+    apply to model"""
+    selections = []
+    if selection_set is None:
+        return selections
+
+    for selection in selection_set.selections:
+        if isinstance(selection, FragmentSpread):
+            fragment = info.fragments[selection.name.value]
+        elif isinstance(selection, InlineFragment):
+            fragment = selection
+        else:
+            selections.append(selection)
+            continue
+
+        if fragment_applies(info, fragment, model):
+            selections += get_selections(info, fragment.selection_set, model)
+    return selections
+
+
+def is_connection(selections):
+    """ Return whether selections are those of a Relay connection"""
+    return any(selection.name.value == 'edges' for selection in selections)
+
+
+def node_selections(info, field_ast, model):
+    """ Return the fields selected on the model objects of field_ast, looking
+    through the edges of a connection"""
+    selections = get_selections(info, field_ast.selection_set, model)
+    if not is_connection(selections):
+        return selections
+
+    nodes = []
+    for edges in selections:
+        if edges.name.value != 'edges':
+            continue
+        for node in get_selections(info, edges.selection_set, model):
+            if node.name.value == 'node':
+                nodes += get_selections(info, node.selection_set, model)
+    return nodes
+
+
+def plan(info, model, selections, prefix=''):
+    """ Return the only, select_related and prefetch_related lookups of model
+    that cover selections, prefixed by prefix"""
+    only, select, prefetch = {prefix + model._meta.pk.name}, set(), []
+    fields = model_fields(model)
+
+    for selection in selections:
+        field = fields.get(to_snake_case(selection.name.value))
+        if field is None:
+            continue
+
+        name = prefix + (field.name if field.concrete else field.get_accessor_name())
+
+        if not field.is_relation:
+            only.add(name)
+        elif field.one_to_one or (field.many_to_one and field.concrete):
+            # Forward foreign keys and one to one relations are joined
+            if field.concrete:
+                only.add(name)
+            select.add(name)
+
+            nested = get_selections(info, selection.selection_set, field.related_model)
+            nested_only, nested_select, nested_prefetch = plan(
+                info, field.related_model, nested, f'{name}__')
+            only |= nested_only
+            select |= nested_select
+            prefetch += nested_prefetch
+        else:
+            # Reverse and many to many relations are prefetched when listed;
+            # connections run their own query for each page
+            nested = get_selections(info, selection.selection_set, field.related_model)
+            if is_connection(nested):
+                continue
+
+            nested_only, nested_select, nested_prefetch = plan(info, field.related_model, nested)
+            if field.one_to_many:
+                nested_only.add(field.field.name)
+
+            queryset = apply_plan(field.related_model.objects.all(), nested_only,
+                                  nested_select, nested_prefetch)
+            prefetch.append(Prefetch(name, queryset=queryset))
+
+    return only, select, prefetch
+
+
+def apply_plan(queryset, only, select, prefetch):
+    """ Apply to queryset the lookups returned by plan()"""
+    queryset = queryset.only(*only)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def optimize(queryset, info):
+    """ Restrict queryset to what the GraphQL selection of info asks for
+
+    Only the selected columns are fetched, selected foreign keys are joined
+    with select_related() and listed reverse relations are prefetched.
+    Relay connections are looked through down to their nodes.
+    """
+    queryset = queryset.all()
+
+    selections = []
+    for field_ast in info.field_asts:
+        selections += node_selections(info, field_ast, queryset.model)
+    return apply_plan(queryset, *plan(info, queryset.model, selections))
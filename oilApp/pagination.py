@@ -0,0 +1,187 @@
+""" Keyset pagination OilApp """
+
+# Python
+import json
+
+# Django
+from django.db import connections
+from django.db.models import DateTimeField, Q
+from django.utils.dateparse import parse_datetime
+
+# Graphene
+import graphene
+from graphene import ConnectionField, PageInfo
+from graphene_django import DjangoConnectionField
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError
+from graphql_relay.utils import base64, unbase64
+
+CURSOR_PREFIX = 'keyset:'
+
+
+class KeysetConnection(graphene.Connection):
+    """ Connection paginated on the ordering keys of its nodes
+
+    Subclasses set keys to the fields that order the nodes, the last of them
+    unique. Cursors encode the keys of a node and pages are fetched with
+    WHERE keys > cursor, so deep pages cost the same as the first one.
+    """
+    class Meta:
+        """Class Meta"""
+        abstract = True
+
+    keys = ('id',)
+
+    total_count = graphene.Int(description='Exact number of nodes, counted when requested')
+    estimated_count = graphene.Int(
+        description='Number of nodes estimated by the query planner when available')
+
+    def resolve_total_count(root, info):
+        """ Return the exact number of nodes"""
+        return root.queryset.count()
+
+    def resolve_estimated_count(root, info):
+        """ Return the planner estimate of the number of nodes"""
+        return estimate_count(root.queryset)
+
+
+def estimate_count(queryset):
+    """ Return the rows the PostgreSQL planner expects from queryset, or
+    the exact count on other databases"""
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.count()
+
+    plan = json.loads(queryset.explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def encode_cursor(instance, keys):
+    """ Return the cursor of instance for keys"""
+    values = []
+    for key in keys:
+        value = getattr(instance, key)
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+    return base64(CURSOR_PREFIX + json.dumps(values))
+
+
+def decode_cursor(cursor, model, keys):
+    """ Return the key values encoded in cursor"""
+    try:
+        text = unbase64(cursor)
+        if not text.startswith(CURSOR_PREFIX):
+            raise ValueError(cursor)
+        values = json.loads(text[len(CURSOR_PREFIX):])
+        if len(values) != len(keys):
+            raise ValueError(cursor)
+    except (ValueError, TypeError):
+        raise GraphQLError(f'Invalid cursor {cursor}')
+
+    decoded = []
+    for key, value in zip(keys, values):
+        field = model._meta.pk if key == 'pk' else model._meta.get_field(key)
+        decoded.append(parse_datetime(value) if isinstance(field, DateTimeField) else value)
+    return decoded
+
+
+def keyset_filter(keys, values, lookup):
+    """ Return the filter of the rows whose keys come after values in the
+    order given by lookup, 'gt' or 'lt'
+
+    The expanded row comparison is bounded by the first key, so the index
+    range scan starts at the cursor.
+    """
+    condition = Q()
+    for i, key in enumerate(keys):
+        equal = {prefix: value for prefix, value in zip(keys[:i], values[:i])}
+        condition |= Q(**equal, **{f'{key}__{lookup}': values[i]})
+    return Q(**{f'{keys[0]}__{lookup}e': values[0]}) & condition
+
+
+def check_page_size(args):
+    """ Reject negative first and last arguments, a size of 0 selects an
+    empty page"""
+    for key in ('first', 'last'):
+        if args.get(key) is not None and args[key] < 0:
+            raise GraphQLError(f'Argument {key} must be a non-negative integer, got {args[key]}')
+
+
+def paginate(connection_type, queryset, args):
+    """ Return the page of queryset selected by the Relay arguments args"""
+    check_page_size(args)
+    keys = connection_type.keys
+    max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    first, last = args.get('first'), args.get('last')
+    backward = first is None and last is not None
+    limit = last if backward else first
+    limit = max_limit if limit is None else min(limit, max_limit)
+
+    # Keys must be loaded to build the cursors, even under only()
+    fields, defer = queryset.query.deferred_loading
+    if fields and not defer:
+        queryset = queryset.only(*fields, *keys)
+
+    page = queryset
+    if args.get('after'):
+        page = page.filter(keyset_filter(keys, decode_cursor(args['after'], page.model, keys),
+                                         'gt'))
+    if args.get('before'):
+        page = page.filter(keyset_filter(keys, decode_cursor(args['before'], page.model, keys),
+                                         'lt'))
+
+    ordering = [f'-{key}' for key in keys] if backward else list(keys)
+    nodes = list(page.order_by(*ordering)[:limit + 1])
+    has_more = len(nodes) > limit
+    nodes = nodes[:limit]
+    if backward:
+        nodes.reverse()
+
+    edges = [connection_type.Edge(node=node, cursor=encode_cursor(node, keys)) for node in nodes]
+    connection = connection_type(
+        edges=edges,
+        page_info=PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=has_more if backward else bool(args.get('after')),
+            has_next_page=bool(args.get('before')) if backward else has_more,
+        ),
+    )
+    connection.queryset = queryset
+    return connection
+
+
+class KeysetConnectionField(ConnectionField):
+    """ Connection field over a KeysetConnection, paginated with keyset
+    cursors instead of OFFSET"""
+
+    @classmethod
+    def resolve_connection(cls, connection_type, args, resolved):
+        """ Return the page of the resolved queryset"""
+        if isinstance(resolved, connection_type):
+            return resolved
+        return paginate(connection_type, resolved, args)
+
+
+class LimitedConnectionField(ConnectionField):
+    """ Offset paginated connection field whose pages are sliced in the
+    database and hold at most RELAY_CONNECTION_MAX_LIMIT nodes
+
+    Larger first and last arguments are clamped, and a connection without
+    them gets a page of the maximum size instead of every node.
+    """
+
+    @classmethod
+    def resolve_connection(cls, connection_type, args, resolved):
+        """ Return the page of the resolved queryset"""
+        if isinstance(resolved, connection_type):
+            return resolved
+
+        check_page_size(args)
+        max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+        args = dict(args)
+        for key in ('first', 'last'):
+            if args.get(key) is not None:
+                args[key] = min(args[key], max_limit)
+        if args.get('first') is None and args.get('last') is None:
+            args['first'] = max_limit
+
+        return DjangoConnectionField.resolve_connection(connection_type, args, resolved)
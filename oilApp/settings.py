@@ -35,7 +35,7 @@ DJANGO_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    
+    'django.contrib.postgres',
 ]
 THIRD_PARTY_APPS = [
     'graphene_django',
@@ -100,11 +100,40 @@ WSGI_APPLICATION = 'oilApp.wsgi.application'
 # Graphene
 GRAPHENE = {
     "SCHEMA": "oilApp.schema.schema",
+    # Page size of connections without first or last, and their maximum
+    'RELAY_CONNECTION_MAX_LIMIT': 100,
     'MIDDLEWARE': [
         'graphql_jwt.middleware.JSONWebTokenMiddleware',
     ],
 }
 
+# Cache, local memory unless CACHE_URL points to a shared backend
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Responses of anonymous GraphQL queries, kept until the data version changes
+GRAPHQL_CACHE_ALIAS = 'default'
+GRAPHQL_CACHE_TIMEOUT = env.int('GRAPHQL_CACHE_TIMEOUT', default=60 * 60)
+
+# Parsed and validated GraphQL documents kept in memory, by process
+GRAPHQL_DOCUMENT_CACHE_SIZE = env.int('GRAPHQL_DOCUMENT_CACHE_SIZE', default=256)
+# Registered documents that clients can send by sha256Hash
+GRAPHQL_PERSISTED_QUERIES_DIR = os.path.join(BASE_DIR, 'persisted_queries')
+
+# Static cost limits of GraphQL operations, checked before executing them
+GRAPHQL_COST = {
+    'MAX_DEPTH': env.int('GRAPHQL_MAX_DEPTH', default=10),
+    'MAX_COMPLEXITY': env.int('GRAPHQL_MAX_COMPLEXITY', default=5000),
+    # Items assumed for lists without a first argument
+    'DEFAULT_LIST_SIZE': 10,
+    # Cost of a field by 'Type.field', instead of 1 for objects and 0 for scalars
+    'FIELD_WEIGHTS': {
+        'Query.stationsNear': 5,
+        'Query.cheapestStations': 2,
+    },
+}
+
 # JWT
 AUTHENTICATION_BACKENDS = [
     'graphql_jwt.backends.JSONWebTokenBackend',
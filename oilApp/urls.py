@@ -5,10 +5,10 @@ from django.contrib import admin
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
 
-# Graphene
-from graphene_django.views import GraphQLView
+# Views
+from oilApp.views import CachedGraphQLView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True)))
+    path("graphql", csrf_exempt(CachedGraphQLView.as_view(graphiql=True)))
 ]
@@ -0,0 +1,175 @@
+""" GraphQL views OilApp """
+
+# Python
+import hashlib
+import json
+
+# Django
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponseBadRequest
+
+# Graphene
+from graphene_django.views import GraphQLView, HttpError
+from graphql.error import GraphQLSyntaxError
+from graphql_jwt.utils import get_http_authorization
+
+# Documents
+from oilApp.documents import CachedDocumentBackend, persisted_queries
+
+# Models
+from gasoline.models import DataVersion
+
+CACHE_PREFIX = 'graphql'
+HITS_KEY = f'{CACHE_PREFIX}:hits'
+MISSES_KEY = f'{CACHE_PREFIX}:misses'
+
+
+def get_cache():
+    """ Return the cache backend of the GraphQL responses"""
+    return caches[settings.GRAPHQL_CACHE_ALIAS]
+
+
+def count(key):
+    """ Increase the counter key of the cache"""
+    cache = get_cache()
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.add(key, 1, timeout=None)
+
+
+def cache_stats():
+    """ Return the hits, misses and hit ratio of the response cache"""
+    stats = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = stats.get(HITS_KEY, 0), stats.get(MISSES_KEY, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / (hits + misses) if hits + misses else None,
+    }
+
+
+def is_anonymous(request):
+    """ Return whether the request carries no credentials"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return False
+    return get_http_authorization(request) is None
+
+
+def get_persisted_query(request, data):
+    """ Return the registered document of the persisted query hash sent in
+    the extensions of the request, or None when none is sent"""
+    extensions = request.GET.get('extensions') or data.get('extensions')
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise HttpError(HttpResponseBadRequest('Extensions are invalid JSON.'))
+
+    persisted = (extensions or {}).get('persistedQuery') or {}
+    sha256_hash = persisted.get('sha256Hash')
+    if sha256_hash is None:
+        return None
+
+    query = persisted_queries().get(sha256_hash)
+    if query is None:
+        raise HttpError(HttpResponseBadRequest('PersistedQueryNotFound'))
+    return query
+
+
+class CachedGraphQLView(GraphQLView):
+    """ GraphQL view that caches the responses of anonymous queries
+
+    Responses are keyed by the normalized document, the variables, the
+    operation and the current DataVersion, which the ETL and the writes of
+    the models bump, so a response is served until the data changes.
+    Mutations and authenticated requests always run.
+
+    Documents are parsed and validated once through CachedDocumentBackend,
+    whose timings are reported in the Server-Timing header, and clients can
+    send the sha256Hash of a registered persisted query instead of its text.
+    """
+    cache_status = None
+    execution_result = None
+
+    def dispatch(self, request, *args, **kwargs):
+        """ Return the response, telling whether it came from the cache"""
+        response = super().dispatch(request, *args, **kwargs)
+        if self.cache_status is not None:
+            response['X-Cache'] = self.cache_status
+
+        timings = getattr(request, 'graphql_timings', None)
+        if timings is not None:
+            metrics = [f'parse;dur={timings["parse"]:.3f}',
+                       f'validate;dur={timings["validate"]:.3f}',
+                       f'document;desc={"cached" if timings["cached"] else "new"}']
+            if 'execute' in timings:
+                metrics += [f'execute;dur={timings["execute"]:.3f}',
+                            f'cost;desc={timings["complexity"]}']
+            response['Server-Timing'] = ', '.join(metrics)
+        return response
+
+    def get_backend(self, request):
+        """ Return the backend of the request, over the shared document cache"""
+        return CachedDocumentBackend(request)
+
+    def get_graphql_params(self, request, data):
+        """ Return the GraphQL parameters, reading the query of a persisted
+        query hash when no query text is sent"""
+        query, variables, operation_name, id = super().get_graphql_params(request, data)
+        if not query:
+            query = get_persisted_query(request, data)
+        return query, variables, operation_name, id
+
+    def get_response(self, request, data, show_graphiql=False):
+        """ Return the cached response of the request or execute it"""
+        query, variables, operation_name, _ = self.get_graphql_params(request, data)
+        key = None if show_graphiql else self.get_cache_key(request, query, variables,
+                                                             operation_name)
+        if key is None:
+            return super().get_response(request, data, show_graphiql)
+
+        cache = get_cache()
+        cached = cache.get(key)
+        if cached is not None:
+            self.cache_status = 'HIT'
+            count(HITS_KEY)
+            return cached
+
+        self.cache_status = 'MISS'
+        count(MISSES_KEY)
+        response = super().get_response(request, data, show_graphiql)
+
+        result = self.execution_result
+        if response[1] == 200 and result is not None and not result.errors:
+            cache.set(key, response, settings.GRAPHQL_CACHE_TIMEOUT)
+        return response
+
+    def execute_graphql_request(self, *args, **kwargs):
+        """ Execute the request, keeping its result to decide whether to cache it"""
+        self.execution_result = super().execute_graphql_request(*args, **kwargs)
+        return self.execution_result
+
+    def get_cache_key(self, request, query, variables, operation_name):
+        """ Return the cache key of the response, or None when it must not be cached"""
+        if not query or not is_anonymous(request):
+            return None
+
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query)
+        except GraphQLSyntaxError:
+            return None
+
+        if document.get_operation_type(operation_name) != 'query':
+            return None
+
+        digest = hashlib.sha256(json.dumps(
+            [document.normalized, variables or {}, operation_name,
+             bool(request.GET.get('pretty'))],
+            sort_keys=True,
+        ).encode()).hexdigest()
+        return f'{CACHE_PREFIX}:{DataVersion.current()}:{digest}'
@@ -16,6 +16,9 @@ from graphql_jwt.decorators import login_required
 # Models
 from users.models import Profile
 
+# Optimizer
+from oilApp.optimizer import optimize
+
 #------------------QUERIES---------------
 class UserType(DjangoObjectType):
     """Type for user model"""
@@ -51,6 +54,11 @@ class ProfileNode(DjangoObjectType):
         }
         interfaces = (relay.Node,)
 
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        """ Fetch only what the selection set asks for"""
+        return optimize(queryset, info)
+
 
 #-----------MUTATIONS----------
 class UserInput(graphene.InputObjectType):
@@ -146,7 +154,7 @@ class Query(graphene.ObjectType):
     @login_required
     def resolve_my_user(root, info):
         """ Return profile of the logged user"""
-        return Profile.objects.get(user=info.context.user)
+        return optimize(Profile.objects.all(), info).get(user=info.context.user)
     
     # Node Query Class
     profile = relay.Node.Field(ProfileNode)